@@ -1,5 +1,6 @@
 # app/__init__.py
 
+import os
 from flask import Flask, session
 from flask_socketio import SocketIO
 
@@ -13,4 +14,9 @@ def create_app():
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
+    # Load the knowledge base in the background so the first query doesn't pay for it
+    if os.getenv('KB_WARMUP', 'true').strip().lower() in ('1', 'true', 'yes', 'on'):
+        from app.knowledge_base.engine import warm_up
+        warm_up(background=True)
+
     return app
\ No newline at end of file
@@ -0,0 +1,222 @@
+# app/knowledge_base/answer_cache.py
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def source_ids(sources: List[Dict]) -> List[str]:
+    # Documents are also keyed by the case/document they were chunked from, which is what
+    # ingestion reports when it changes them
+    ids = []
+    for source in sources:
+        ids += [str(source[key]) for key in ('id', 'case_id', 'doc_id') if source.get(key)]
+    return list(dict.fromkeys(ids))
+
+
+def entity_key(entities: Optional[Iterable[str]]) -> Optional[List[str]]:
+    if entities is None:
+        return None
+    return sorted({" ".join(entity.lower().split()) for entity in entities})
+
+
+class SemanticAnswerCache:
+    """Answers keyed on query embeddings, served when a new query is similar enough.
+
+    Similar wording is not enough on its own: a hit also needs the same named entities
+    (judges, courts, parties, cases, numbers) as the cached query, since swapping one
+    name barely moves the embedding but changes the answer.
+
+    Entries live in memory as a normalized NumPy matrix; when ``path`` is set they are
+    also written to SQLite so the cache survives restarts.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000, path: Optional[str] = None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.data_version = None
+        self._ids: List[str] = []
+        self._entries: Dict[str, Dict] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open_db()
+
+    def lookup(self, embedding: List[float], entities: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        vector = self._normalize(embedding)
+        entities = entity_key(entities or [])
+        with self._lock:
+            self._expire()
+            if not self._ids or self._matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ vector
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            for index in candidates[np.argsort(-similarities[candidates])]:
+                entry = self._entries[self._ids[index]]
+                if entry['entities'] != entities:
+                    continue
+                entry['last_used'] = time.time()
+                if self._db is not None:
+                    # Eviction after a restart goes by the stored times
+                    self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (entry['last_used'], entry['id']))
+                    self._db.commit()
+                self.hits += 1
+                return dict(entry, similarity=float(similarities[index]))
+            self.misses += 1
+            return None
+
+    def store(self, query: str, embedding: List[float], answer: str, sources: List[Dict],
+              entities: Optional[Iterable[str]] = None):
+        vector = self._normalize(embedding)
+        entry = {
+            'id': uuid.uuid4().hex,
+            'query': query,
+            'answer': answer,
+            'entities': entity_key(entities or []),
+            'source_ids': source_ids(sources),
+            'sources': sources,
+            'created_at': time.time(),
+            'last_used': time.time(),
+        }
+        with self._lock:
+            if self._ids and self._matrix.shape[1] != vector.shape[0]:
+                # The embedding model changed; nothing cached is comparable any more
+                self._clear()
+            self._append(entry, vector)
+            while len(self._ids) > self.max_entries:
+                least_recent = min(self._ids, key=lambda entry_id: self._entries[entry_id]['last_used'])
+                self._remove([least_recent])
+                self.evictions += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO answers (id, query, embedding, answer, sources, entities, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry['id'], query, vector.tobytes(), answer, json.dumps(sources), json.dumps(entry['entities']),
+                     entry['created_at'], entry['last_used']),
+                )
+                self._db.commit()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def invalidate_sources(self, source_ids: Iterable[str]):
+        source_ids = {str(source_id) for source_id in source_ids}
+        with self._lock:
+            stale = [
+                entry_id for entry_id in self._ids
+                if source_ids.intersection(self._entries[entry_id]['source_ids'])
+            ]
+            self._remove(stale)
+            self.invalidations += len(stale)
+
+    def set_data_version(self, version: str) -> bool:
+        # Returns True when the underlying data changed and the cache was cleared
+        with self._lock:
+            if version == self.data_version:
+                return False
+            changed = self.data_version is not None
+            self.data_version = version
+            if changed:
+                self._clear()
+                self.invalidations += 1
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('data_version', ?)", (version,))
+                self._db.commit()
+            return changed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._ids),
+                'max_size': self.max_entries,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _append(self, entry: Dict, vector: np.ndarray):
+        self._ids.append(entry['id'])
+        self._entries[entry['id']] = entry
+        if self._matrix.size == 0:
+            self._matrix = vector.reshape(1, -1)
+        else:
+            self._matrix = np.vstack([self._matrix, vector])
+
+    def _remove(self, entry_ids: List[str]):
+        if not entry_ids:
+            return
+        removed = set(entry_ids)
+        keep = [i for i, entry_id in enumerate(self._ids) if entry_id not in removed]
+        self._ids = [self._ids[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+        for entry_id in removed:
+            self._entries.pop(entry_id, None)
+        if self._db is not None:
+            self._db.executemany("DELETE FROM answers WHERE id = ?", [(entry_id,) for entry_id in removed])
+            self._db.commit()
+
+    def _clear(self):
+        self._remove(list(self._ids))
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        self._remove([entry_id for entry_id in self._ids if self._entries[entry_id]['created_at'] < cutoff])
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id TEXT PRIMARY KEY, query TEXT, embedding BLOB, answer TEXT, sources TEXT, entities TEXT, created_at REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        self.data_version = row[0] if row else None
+        rows = self._db.execute(
+            "SELECT id, query, embedding, answer, sources, entities, created_at, last_used FROM answers ORDER BY created_at"
+        ).fetchall()
+        for entry_id, query, embedding, answer, sources, entities, created_at, last_used in rows:
+            sources = json.loads(sources)
+            entry = {
+                'id': entry_id,
+                'query': query,
+                'answer': answer,
+                'entities': json.loads(entities),
+                'source_ids': source_ids(sources),
+                'sources': sources,
+                'created_at': created_at,
+                'last_used': last_used,
+            }
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if self._ids and self._matrix.shape[1] != vector.shape[0]:
+                continue
+            self._append(entry, vector)
+        self._expire()
+        logging.info(f"Loaded {len(self._ids)} cached answers from {self.path}")
@@ -0,0 +1,43 @@
+# app/knowledge_base/branch_pool.py
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class BranchBusy(Exception):
+    pass
+
+
+class BranchPool:
+    """Threads for one retrieval branch, so a hung backend only ties up its own threads.
+
+    A call counts as in flight from submission until its function returns, including
+    after the caller has stopped waiting for it. Once ``max_in_flight`` calls are in
+    flight, new ones are rejected with BranchBusy instead of queueing behind them.
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 4):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f'kb-{name}')
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args) -> Future:
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise BranchBusy(self.name)
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
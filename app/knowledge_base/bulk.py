@@ -0,0 +1,174 @@
+# app/knowledge_base/bulk.py
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.knowledge_base.engine import QueryCancelled
+from app.knowledge_base.metrics import metrics
+
+
+class BulkAnswerer:
+    """Answers many queries together instead of one round trip per stage per query.
+
+    Each batch of queries is embedded in one model call, searched with one Qdrant
+    ``query_batch_points`` request and looked up in the graph with one batched Cypher query
+    per stage. Final answers are generated on at most ``concurrency`` LLM calls at a time
+    and yielded as they finish, so results come back out of order with their ``index``.
+    Bulk answers always use the single final prompt, without the router.
+    """
+
+    def __init__(self, kb_query, batch_size: int = 64, concurrency: int = 4):
+        self.kb_query = kb_query
+        self.batch_size = max(batch_size, 1)
+        self.concurrency = max(concurrency, 1)
+
+    def answer(self, queries: Iterable[str], cancel_event: Optional[threading.Event] = None) -> Iterator[Dict]:
+        queries = iter(enumerate(queries))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='kb-bulk') as executor:
+            pending = set()
+            while batch := list(islice(queries, self.batch_size)):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                for result, future in self._retrieve_batch(batch, executor):
+                    if result is not None:
+                        yield result
+                    else:
+                        pending.add(future)
+                # Retrieval for the next batch overlaps with the answers still being generated
+                while len(pending) > self.batch_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+                done = {future for future in pending if future.done()}
+                pending -= done
+                yield from (future.result() for future in done)
+
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    for future in pending:
+                        future.cancel()
+                    raise QueryCancelled()
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+            if cancel_event is not None and cancel_event.is_set():
+                raise QueryCancelled()
+
+    def _retrieve_batch(self, batch: List, executor: ThreadPoolExecutor):
+        kb_query = self.kb_query
+        started = time.perf_counter()
+        queries = [query for _, query in batch]
+        with metrics.timer('bulk_embedding'):
+            embeddings = kb_query.embed_model.get_query_embedding_batch(queries)
+
+        uncached = []
+        for (index, query), embedding in zip(batch, embeddings):
+            cached = kb_query.lookup_cached_answer(query, embedding)
+            if cached:
+                yield self._result(index, query, cached['answer'], cached['sources'], started, cached=True), None
+            else:
+                uncached.append((index, query, embedding))
+        if not uncached:
+            return
+
+        queries = [query for _, query, _ in uncached]
+        try:
+            vector_hits = kb_query.vector_search.search_batch(queries, [embedding for _, _, embedding in uncached])
+        except Exception as e:
+            logging.error(f"Error in batched vector retrieval: {str(e)}")
+            vector_hits = [[] for _ in queries]
+        try:
+            graph_contexts = kb_query.graph_contexts(queries)
+        except Exception as e:
+            logging.error(f"Error in batched graph retrieval: {str(e)}")
+            graph_contexts = [{'graph_results': [], 'case_details': [], 'cases': []} for _ in queries]
+        metrics.observe('kb_stage_seconds', time.perf_counter() - started, stage='bulk_retrieve')
+        logging.info(f"Retrieved context for {len(queries)} queries in {time.perf_counter() - started:.2f}s")
+
+        for (index, query, embedding), hits, graph_context in zip(uncached, vector_hits, graph_contexts):
+            yield None, executor.submit(self._generate, index, query, embedding, hits, graph_context, started)
+
+    def _generate(self, index: int, query: str, embedding: List[float], hits: List, graph_context: Dict, started: float) -> Dict:
+        kb_query = self.kb_query
+        sources = kb_query.collect_sources(graph_context['cases'], hits)
+        try:
+            response = kb_query.generate_llm_response(
+                query,
+                "",
+                graph_context['graph_results'],
+                kb_query.vector_snippets(hits),
+                graph_context['case_details'],
+            )
+        except Exception as e:
+            logging.error(f"Error answering bulk query {index}: {str(e)}")
+            return self._result(index, query, None, sources, started, error=str(e))
+        kb_query.cache_answer(query, str(response), sources, embedding)
+        return self._result(index, query, str(response), sources, started)
+
+    def _result(self, index: int, query: str, response: Optional[str], sources: List[Dict], started: float,
+                cached: bool = False, error: Optional[str] = None) -> Dict:
+        metrics.inc('kb_bulk_queries_total', status='error' if error else 'cached' if cached else 'ok')
+        return {
+            'index': index,
+            'query': query,
+            'response': response,
+            'sources': sources,
+            'cached': cached,
+            'error': error,
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+
+def read_queries(path: str) -> Iterator[Dict]:
+    # Plain text has one query per line; JSONL records keep their other fields in the output
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                yield json.loads(line)
+            else:
+                yield {'query': line}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer a file of questions against the knowledge base')
+    parser.add_argument('input', help='text file with one question per line, or JSONL with a "query" field; - reads stdin')
+    parser.add_argument('--out', default='-', help='JSONL file the answers are appended to as they finish; - writes stdout')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('KB_BULK_BATCH', '64')),
+                        help='queries embedded, searched and looked up together (default: KB_BULK_BATCH)')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('KB_BULK_LLM_CONCURRENCY', '4')),
+                        help='LLM completions running at once (default: KB_BULK_LLM_CONCURRENCY)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app.knowledge_base.engine import get_kb_query
+
+    records = list(read_queries(args.input))
+    answerer = BulkAnswerer(get_kb_query(), batch_size=args.batch_size, concurrency=args.concurrency)
+    out = sys.stdout if args.out == '-' else open(args.out, 'a', encoding='utf-8')
+    started = time.perf_counter()
+    answered = failed = 0
+    try:
+        for result in answerer.answer(record['query'] for record in records):
+            out.write(json.dumps({**records[result['index']], **result}) + "\n")
+            out.flush()
+            answered += 1
+            failed += result['error'] is not None
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    logging.info(f"Answered {answered} queries ({failed} failed) in {elapsed:.1f}s, {answered / max(elapsed, 1e-9):.2f} queries/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# app/knowledge_base/case_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class CaseDetailsCache:
+    """Bounded LRU cache of formatted case records keyed by case id, expired after ``ttl`` seconds.
+
+    Records fetched by a lookup that started before an invalidation are not stored, so a
+    slow lookup cannot put back a record that ingestion has just replaced.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get_many(self, case_ids: Iterable[str]) -> Dict[str, Dict]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for case_id in dict.fromkeys(case_ids):
+                entry = self._entries.get(case_id)
+                if entry is not None and self.ttl and now - entry['stored_at'] > self.ttl:
+                    del self._entries[case_id]
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(case_id)
+                self.hits += 1
+                found[case_id] = entry['record']
+        return found
+
+    def put_many(self, records: Dict[str, Dict], generation: Optional[int] = None):
+        now = time.time()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            for case_id, record in records.items():
+                self._entries[case_id] = {'record': record, 'stored_at': now}
+                self._entries.move_to_end(case_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_fetch(self, case_ids: List[str], fetch: Callable[[List[str]], Dict[str, Dict]]) -> Dict[str, Dict]:
+        generation = self._generation
+        records = self.get_many(case_ids)
+        missing = [case_id for case_id in dict.fromkeys(case_ids) if case_id not in records]
+        if missing:
+            fetched = fetch(missing)
+            self.put_many(fetched, generation)
+            records.update(fetched)
+        return records
+
+    def invalidate(self, case_ids: Optional[Iterable[str]] = None):
+        with self._lock:
+            self._generation += 1
+            if case_ids is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            for case_id in case_ids:
+                if self._entries.pop(str(case_id), None) is not None:
+                    self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
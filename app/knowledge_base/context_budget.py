@@ -0,0 +1,81 @@
+# app/knowledge_base/context_budget.py
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.utils import get_tokenizer
+
+from app.knowledge_base.conversation_store import tokenize
+from app.knowledge_base.metrics import metrics
+
+# How much an item's position in its own ranking counts next to its overlap with the query
+SECTION_PRIORITY = {'response': 1.0, 'case_details': 0.6, 'vector': 0.5, 'graph': 0.4}
+
+
+class ContextBudget:
+    """Fits retrieved context into a token budget before it goes into the final prompt.
+
+    Items are deduplicated across sections, scored by their overlap with the query and
+    their rank within their section, and added best-first until the budget is spent.
+    An item that only partly fits is cut down to the tokens that remain.
+    """
+
+    def __init__(self, max_tokens: int = 3000, context_window: int = 8192, reserve_tokens: int = 1024,
+                 min_item_tokens: int = 32, tokenizer: Optional[Callable[[str], List]] = None):
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.reserve_tokens = reserve_tokens
+        self.min_item_tokens = min_item_tokens
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer(text)) if text else 0
+
+    def available(self, overhead: str = "") -> int:
+        # The answer needs reserve_tokens of the window; the prompt's fixed text takes the rest first
+        window = self.context_window - self.reserve_tokens - self.count(overhead)
+        return max(min(self.max_tokens, window), 0)
+
+    def fit(self, query: str, sections: Dict[str, List[str]], overhead: str = "") -> Tuple[Dict[str, List[str]], int]:
+        budget = self.available(overhead)
+        query_tokens = set(tokenize(query))
+
+        candidates = []
+        seen = set()
+        for section, items in sections.items():
+            for rank, item in enumerate(items):
+                key = re.sub(r'\s+', ' ', item or '').strip().lower()
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                candidates.append((self.relevance(query_tokens, item, section, rank), len(candidates), section, item))
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        kept = {section: [] for section in sections}
+        used = 0
+        for _, order, section, item in candidates:
+            tokens = self.count(item)
+            if used + tokens > budget:
+                remaining = budget - used
+                if remaining < self.min_item_tokens:
+                    metrics.inc('kb_context_items_dropped_total', section=section)
+                    continue
+                item = self.truncate(item, remaining)
+                tokens = self.count(item)
+            kept[section].append((order, item))
+            used += tokens
+            metrics.inc('kb_context_tokens_total', tokens, section=section)
+
+        # Ranking decides what fits; what is kept stays in its original order
+        return {section: [item for _, item in sorted(items)] for section, items in kept.items()}, used
+
+    def relevance(self, query_tokens: set, item: str, section: str, rank: int) -> float:
+        overlap = len(query_tokens.intersection(tokenize(item))) / len(query_tokens) if query_tokens else 0.0
+        return overlap + SECTION_PRIORITY.get(section, 0.5) / (1 + rank)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.count(text)
+        while tokens > max_tokens and text:
+            text = text[:max(int(len(text) * max_tokens / tokens * 0.95), 0)].rstrip()
+            tokens = self.count(text + "...")
+        return text + "..." if text else ""
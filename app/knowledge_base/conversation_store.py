@@ -0,0 +1,180 @@
+# app/knowledge_base/conversation_store.py
+
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'were', 'with', 'that', 'this', 'what', 'which', 'who', 'whom',
+    'when', 'where', 'why', 'how', 'about', 'from', 'into', 'any', 'all', 'there', 'their', 'they',
+    'them', 'has', 'have', 'had', 'did', 'does', 'can', 'could', 'would', 'should', 'will', 'not',
+    'you', 'your', 'our', 'its', 'been', 'being', 'more', 'other', 'some', 'such', 'than', 'then',
+    'also', 'tell', 'give', 'show', 'list', 'based', 'knowledge', 'involving', 'case', 'cases',
+    'court', 'courts', 'judge', 'judges', 'legal', 'law',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r'[a-z0-9]+', text.lower()) if len(token) > 2 and token not in STOPWORDS]
+
+
+class ConversationStore:
+    """Server-side conversation history, so the session cookie only carries a conversation id.
+
+    Each conversation keeps its last ``max_turns`` turns; older turns are folded into a
+    running summary, one at a time and in order. An inverted index over turn tokens finds
+    the prior turns relevant to a new query without scanning the whole history.
+    """
+
+    def __init__(self, max_turns: int = 10, max_conversations: int = 10000, ttl: float = 86400,
+                 summarizer: Optional[Callable[[str, Dict], str]] = None, summary_chars: int = 2000):
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.summarizer = summarizer
+        self.summary_chars = summary_chars
+        self._conversations: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_conversation_id() -> str:
+        return uuid.uuid4().hex
+
+    def add_turn(self, conversation_id: str, query: str, response: str):
+        turn = {
+            'id': uuid.uuid4().hex,
+            'query': query,
+            'response': response,
+            'tokens': Counter(tokenize(f"{query} {response}")),
+            'query_tokens': set(tokenize(query)),
+            'created_at': time.time(),
+        }
+        with self._lock:
+            conversation = self._get_or_create(conversation_id)
+            conversation['turns'].append(turn)
+            for token in turn['tokens']:
+                conversation['index'].setdefault(token, set()).add(turn['id'])
+            while len(conversation['turns']) > self.max_turns:
+                conversation['fold_queue'].append(self._unindex(conversation, conversation['turns'].popleft()))
+            # A thread already folding this conversation also folds the turns queued here
+            fold = bool(conversation['fold_queue']) and not conversation['folding']
+            if fold:
+                conversation['folding'] = True
+            self._evict()
+
+        if fold:
+            self._fold(conversation)
+
+    def relevant_turns(self, conversation_id: str, query: str, min_score: float = 0.5, limit: int = 3) -> List[Dict]:
+        query_tokens = set(tokenize(query))
+        if not query_tokens:
+            return []
+        with self._lock:
+            conversation = self._get(conversation_id)
+            if conversation is None:
+                return []
+            # Count how many query tokens each turn shares, using only the postings for those tokens
+            overlap = Counter()
+            for token in query_tokens:
+                for turn_id in conversation['index'].get(token, ()):
+                    overlap[turn_id] += 1
+            turns_by_id = {turn['id']: turn for turn in conversation['turns']}
+            relevant = []
+            for turn_id, shared in overlap.most_common():
+                score = shared / len(query_tokens)
+                if score < min_score or len(relevant) >= limit:
+                    break
+                turn = turns_by_id[turn_id]
+                # How closely the earlier question alone matches; its answer's words don't count
+                query_score = len(query_tokens & turn['query_tokens']) / len(query_tokens | turn['query_tokens'])
+                relevant.append({'query': turn['query'], 'response': turn['response'], 'score': score,
+                                 'query_score': query_score})
+            return relevant
+
+    def history(self, conversation_id: str) -> List[Dict]:
+        with self._lock:
+            conversation = self._get(conversation_id)
+            if conversation is None:
+                return []
+            return [{'query': turn['query'], 'response': turn['response']} for turn in conversation['turns']]
+
+    def summary(self, conversation_id: str) -> str:
+        with self._lock:
+            conversation = self._get(conversation_id)
+            return conversation['summary'] if conversation else ""
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'conversations': len(self._conversations),
+                'turns': sum(len(conversation['turns']) for conversation in self._conversations.values()),
+            }
+
+    def _get(self, conversation_id: str) -> Optional[Dict]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        if self.ttl and time.time() - conversation['last_active'] > self.ttl:
+            del self._conversations[conversation_id]
+            return None
+        return conversation
+
+    def _get_or_create(self, conversation_id: str) -> Dict:
+        conversation = self._get(conversation_id)
+        if conversation is None:
+            conversation = {
+                'turns': deque(), 'index': {}, 'summary': "", 'fold_queue': deque(), 'folding': False,
+                'last_active': time.time(),
+            }
+            self._conversations[conversation_id] = conversation
+        conversation['last_active'] = time.time()
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _unindex(self, conversation: Dict, turn: Dict) -> Dict:
+        for token in turn['tokens']:
+            turn_ids = conversation['index'].get(token)
+            if turn_ids is not None:
+                turn_ids.discard(turn['id'])
+                if not turn_ids:
+                    del conversation['index'][token]
+        return turn
+
+    def _fold(self, conversation: Dict):
+        # The summarizer may call the LLM, so it runs outside the lock; the summary is re-read
+        # under the lock for every turn, and a turn leaves the queue only once it is folded in
+        try:
+            while True:
+                with self._lock:
+                    if not conversation['fold_queue']:
+                        conversation['folding'] = False
+                        return
+                    turn = conversation['fold_queue'][0]
+                    summary = conversation['summary']
+                summary = self._summarize(summary, turn)
+                with self._lock:
+                    conversation['summary'] = summary
+                    conversation['fold_queue'].popleft()
+        except Exception:
+            with self._lock:
+                conversation['folding'] = False
+            raise
+
+    def _summarize(self, summary: str, turn: Dict) -> str:
+        if self.summarizer is not None:
+            summary = self.summarizer(summary, turn)
+        else:
+            summary = f"{summary}\nQ: {turn['query']}\nA: {turn['response'][:300]}".strip()
+        # Keep the most recent part when the summary outgrows its budget
+        return summary[-self.summary_chars:]
+
+    def _evict(self):
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
@@ -0,0 +1,219 @@
+# app/knowledge_base/embedding_cache.py
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.fastembed import FastEmbedEmbedding
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings keyed on normalized query text.
+
+    With a ``path``, the cache is loaded from it and saved back after every ``save_every``
+    new embeddings (0 leaves saving to the caller), so a worker that is killed loses at most
+    that many. Each process writes through its own temporary file.
+    """
+
+    def __init__(self, max_size: int = 2048, path: Optional[str] = None, model_name: str = "", save_every: int = 0):
+        self.max_size = max_size
+        self.path = path
+        self.model_name = model_name
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get_or_compute(self, text: str, compute: Callable[[str], List[float]]) -> List[float]:
+        key = normalize_query(text)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    # This thread computes the embedding; concurrent callers wait for it
+                    pending = threading.Event()
+                    self._pending[key] = pending
+                    self.misses += 1
+                    break
+            # Re-check once the other thread finishes; if it failed this thread computes instead
+            pending.wait()
+
+        try:
+            embedding = compute(text)
+            with self._lock:
+                self._entries[key] = embedding
+                self._entries.move_to_end(key)
+                self._added()
+            self._maybe_save()
+            return embedding
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        # Cached embeddings by normalized text, one hit each; the misses are counted by put()
+        with self._lock:
+            found = {}
+            for key in dict.fromkeys(map(normalize_query, texts)):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.hits += len(found)
+            return found
+
+    def put(self, text: str, embedding: List[float]):
+        with self._lock:
+            self.misses += 1
+            self._entries[normalize_query(text)] = embedding
+            self._added()
+        self._maybe_save()
+
+    def _added(self):
+        # Called with the lock held after inserting an entry
+        self._unsaved += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _maybe_save(self):
+        if self.path and self.save_every and self._unsaved >= self.save_every:
+            # One save at a time; a thread arriving mid-save leaves its entries to the next one
+            if self._save_lock.acquire(blocking=False):
+                try:
+                    self.save()
+                finally:
+                    self._save_lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = np.array(list(self._entries.values()), dtype=np.float32)
+            self._unsaved = 0
+        # Workers sharing the path each write their own file, then swap it in atomically
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, keys=np.array(keys, dtype=str), vectors=vectors, model_name=np.array(self.model_name))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving embedding cache to {self.path}: {str(e)}")
+            return
+        logging.info(f"Saved {len(keys)} cached query embeddings to {self.path}")
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data['model_name']) != self.model_name:
+                    logging.warning(f"Ignoring embedding cache at {self.path}: built for model {data['model_name']}")
+                    return
+                keys = data['keys'].tolist()
+                vectors = data['vectors'].tolist()
+        except Exception as e:
+            logging.error(f"Error loading embedding cache from {self.path}: {str(e)}")
+            return
+        with self._lock:
+            for key, vector in list(zip(keys, vectors))[-self.max_size:]:
+                self._entries[key] = vector
+        logging.info(f"Loaded {len(self._entries)} cached query embeddings from {self.path}")
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves query embeddings from an EmbeddingCache.
+
+    Installed as ``Settings.embed_model`` so the llama-index query engines and
+    ``format_vector_results`` share a single embedding per query.
+    """
+
+    _base_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, base_model: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(
+            model_name=base_model.model_name,
+            embed_batch_size=base_model.embed_batch_size,
+            **kwargs,
+        )
+        self._base_model = base_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._cache.get_or_compute(query, self._base_model.get_query_embedding)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        # Every query missing from the cache is embedded in a single model call. The results are
+        # returned directly, since a batch larger than the cache would evict its own entries
+        keys = [normalize_query(query) for query in queries]
+        embeddings = self._cache.get_many(queries)
+        missing = {key: query for key, query in zip(keys, queries) if key not in embeddings}
+        if missing:
+            for key, embedding in zip(missing, self._embed_queries(list(missing.values()))):
+                self._cache.put(missing[key], embedding)
+                embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        base_model = self._base_model
+        if hasattr(base_model, 'get_query_embedding_batch'):
+            return base_model.get_query_embedding_batch(queries)
+        if isinstance(base_model, FastEmbedEmbedding) and base_model.doc_embed_type == 'default':
+            # FastEmbed's dense models embed queries and documents alike unless passage embedding is on
+            return base_model.get_text_embedding_batch(queries)
+        return [base_model.get_query_embedding(query) for query in queries]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._base_model.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._base_model.get_text_embedding_batch(texts)
@@ -0,0 +1,83 @@
+# app/knowledge_base/engine.py
+
+import logging
+import threading
+import time
+
+# One knowledge-base engine per process, shared by the HTTP routes and the Socket.IO events.
+# The module avoids importing llama-index until the engine is first needed so the app can
+# start and answer health checks while the models and database clients load.
+_kb_query = None
+_init_error = None
+_init_started = None
+_init_seconds = None
+_lock = threading.Lock()
+_warmup_thread = None
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+def get_kb_query():
+    global _kb_query, _init_error, _init_started, _init_seconds
+    if _kb_query is not None:
+        return _kb_query
+    with _lock:
+        if _kb_query is None:
+            from app.knowledge_base.integrated_kb_query import IntegratedKnowledgeBaseQuery
+
+            _init_started = time.time()
+            try:
+                _kb_query = IntegratedKnowledgeBaseQuery()
+                _init_error = None
+            except Exception as e:
+                _init_error = e
+                logging.error(f"Error initializing knowledge base: {str(e)}")
+                raise
+            finally:
+                _init_seconds = time.time() - _init_started
+            logging.info(f"Knowledge base initialized in {_init_seconds:.2f}s")
+    return _kb_query
+
+
+def warm_up(background: bool = True):
+    global _warmup_thread
+    if not background:
+        return get_kb_query()
+    with _lock:
+        if _kb_query is not None or (_warmup_thread is not None and _warmup_thread.is_alive()):
+            return None
+        _warmup_thread = threading.Thread(target=_warm_up_quietly, name='kb-warmup', daemon=True)
+        _warmup_thread.start()
+    return None
+
+
+def _warm_up_quietly():
+    try:
+        get_kb_query()
+    except Exception:
+        # Already logged; the next request retries initialization
+        pass
+
+
+def is_ready() -> bool:
+    return _kb_query is not None
+
+
+def readiness() -> dict:
+    if _kb_query is not None:
+        status = 'ready'
+    elif _init_error is not None:
+        status = 'error'
+    elif _init_started is not None or (_warmup_thread is not None and _warmup_thread.is_alive()):
+        status = 'initializing'
+    else:
+        status = 'not_started'
+
+    result = {'status': status}
+    if _init_seconds is not None:
+        result['init_seconds'] = round(_init_seconds, 3)
+    if status == 'error':
+        result['error'] = str(_init_error)
+    return result
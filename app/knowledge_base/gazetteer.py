@@ -0,0 +1,178 @@
+# app/knowledge_base/gazetteer.py
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.knowledge_base.conversation_store import STOPWORDS
+
+# Spellings that mean the same thing in entity names are reduced to one token
+TOKEN_SYNONYMS = {
+    'vs': 'v', 'versus': 'v',
+    'corporation': 'corp', 'incorporated': 'inc', 'company': 'co', 'limited': 'ltd',
+}
+COMPANY_SUFFIXES = {'corp', 'inc', 'co', 'ltd', 'llc', 'llp', 'lp', 'plc'}
+JUDGE_TITLES = ['judge', 'justice']
+
+
+def tokens(text: str) -> List[str]:
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r"['’]s\b", '', text.replace('&', ' and '))
+    return [TOKEN_SYNONYMS.get(token, token) for token in re.findall(r'[a-z0-9]+', text)]
+
+
+def aliases(name: str, labels: Iterable[str], extra: Iterable[str] = ()) -> List[Tuple[str, ...]]:
+    variants = [tuple(tokens(name))] + [tuple(tokens(alias)) for alias in extra if alias]
+    labels = set(labels)
+    for variant in list(variants):
+        if len(variant) > 1 and variant[-1] in COMPANY_SUFFIXES:
+            variants.append(variant[:-1])
+        if 'Judge' in labels and variant:
+            variants += [(title, *variant) for title in JUDGE_TITLES]
+            variants += [(title, variant[-1]) for title in JUDGE_TITLES]
+    # A lone common word would match almost every query
+    return list(dict.fromkeys(
+        variant for variant in variants
+        if variant and (len(variant) > 1 or (len(variant[0]) > 2 and variant[0] not in STOPWORDS))
+    ))
+
+
+class EntityGazetteer:
+    """Known graph entity names, matched in queries with a token-level Aho-Corasick automaton.
+
+    Names and their aliases are normalized into token sequences, so matching ignores case,
+    accents, punctuation and spellings like "v."/"vs." or "Corporation"/"Corp.". One pass
+    over the query's tokens finds every known name; names inside a longer match are
+    dropped. The compiled automaton can be saved to ``path`` and loaded at startup.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.data_version = None
+        self.built_at = 0.0
+        self._automaton = None
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    @property
+    def ready(self) -> bool:
+        return self._automaton is not None
+
+    def __len__(self) -> int:
+        return len(self._automaton['entities']) if self._automaton else 0
+
+    def build(self, records: Iterable[Dict], data_version: Optional[str] = None):
+        # records: {'name', 'labels', 'aliases'} rows, one per graph node
+        start = time.perf_counter()
+        entities, entity_ids, patterns = [], {}, {}
+        for record in records:
+            name = record.get('name')
+            if not name:
+                continue
+            labels = record.get('labels') or []
+            key = (name, next(iter(labels), ''))
+            if key not in entity_ids:
+                entity_ids[key] = len(entities)
+                entities.append(list(key))
+            for variant in aliases(name, labels, record.get('aliases') or []):
+                ids = patterns.setdefault(variant, [])
+                if entity_ids[key] not in ids:
+                    ids.append(entity_ids[key])
+
+        goto, fail, depth, output, link = [{}], [0], [0], [[]], [0]
+        for variant, ids in patterns.items():
+            node = 0
+            for token in variant:
+                if token not in goto[node]:
+                    goto[node][token] = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    depth.append(depth[node] + 1)
+                    output.append([])
+                    link.append(0)
+                node = goto[node][token]
+            output[node] = ids
+
+        # Breadth-first failure links; link points at the nearest suffix that ends a name
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in goto[node].items():
+                state = fail[node]
+                while state and token not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(token, 0)
+                link[child] = fail[child] if output[fail[child]] else link[fail[child]]
+                queue.append(child)
+
+        automaton = {'entities': entities, 'goto': goto, 'fail': fail, 'depth': depth, 'output': output, 'link': link}
+        with self._lock:
+            self._automaton = automaton
+            self.data_version = data_version
+            self.built_at = time.time()
+        logging.info(f"Built entity gazetteer: {len(entities)} entities, {len(patterns)} names and aliases, "
+                     f"{len(goto)} states in {time.perf_counter() - start:.2f}s")
+
+    def find(self, text: str) -> List[Dict]:
+        automaton = self._automaton
+        if automaton is None:
+            return []
+        goto, fail, depth, output, link = (automaton[key] for key in ('goto', 'fail', 'depth', 'output', 'link'))
+        matches = []
+        state = 0
+        for end, token in enumerate(tokens(text)):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            node = state if output[state] else link[state]
+            while node:
+                matches.append((end - depth[node] + 1, end, node))
+                node = link[node]
+
+        found = []
+        for start, end, node in matches:
+            if any(s <= start and end <= e and (s, e) != (start, end) for s, e, _ in matches):
+                continue
+            for entity_id in output[node]:
+                name, label = automaton['entities'][entity_id]
+                found.append({'name': name, 'label': label, 'start': start, 'end': end})
+        found.sort(key=lambda match: (match['start'], match['end']))
+        return found
+
+    def names(self, text: str) -> List[str]:
+        return list(dict.fromkeys(match['name'] for match in self.find(text)))
+
+    def save(self):
+        if not self.path or self._automaton is None:
+            return
+        with self._lock:
+            snapshot = dict(self._automaton, data_version=self.data_version, built_at=self.built_at)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        logging.info(f"Saved entity gazetteer ({len(snapshot['entities'])} entities) to {self.path}")
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading entity gazetteer from {self.path}: {str(e)}")
+            return False
+        with self._lock:
+            self.data_version = snapshot.pop('data_version', None)
+            self.built_at = snapshot.pop('built_at', 0.0)
+            self._automaton = snapshot
+        logging.info(f"Loaded entity gazetteer ({len(snapshot['entities'])} entities) from {self.path}")
+        return True
@@ -0,0 +1,549 @@
+# app/knowledge_base/ingestion.py
+#
+# Loads court opinions into law_docs (Qdrant) and the legal graph (Neo4j).
+#
+#   python -m app.knowledge_base.ingestion opinions.jsonl scans/*.pdf --batch-size 256 --parallel 0
+#   python -m app.knowledge_base.ingestion --backfill-snippets
+#
+# JSONL records use the fields read by get_case_details: id, case_name, date_filed, text,
+# judges, author, court, attorneys, plaintiff, defendant, citations and docket. PDFs are
+# parsed with llama-parse and become cases named after the file; a PDF whose bytes match
+# the manifest is skipped without being parsed again.
+#
+# A SQLite manifest keeps a content hash per document and per chunk. Unchanged documents
+# are skipped, only new or edited chunks are embedded and upserted, stale chunks are
+# deleted, and --prune removes documents missing from the input. An interrupted run
+# picks up where it stopped.
+
+import argparse
+import json
+import logging
+import os
+import time
+import urllib.request
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, tee
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from qdrant_client import QdrantClient, models
+
+from app.knowledge_base.ingestion_manifest import IngestionManifest, content_hash, file_hash
+from app.knowledge_base.vector_search import (
+    SparseEncoder, backfill_snippets, collection_config, ensure_quantization, point_vector, snippet,
+)
+
+load_dotenv()
+
+# Record field, node label, key property, relationship type, whether the case is the source
+RELATIONSHIPS = [
+    ('judges', 'Judge', 'name', 'DECIDED_BY', True),
+    ('author', 'Judge', 'name', 'AUTHORED_BY', True),
+    ('court', 'Court', 'name', 'HEARD_IN', True),
+    ('attorneys', 'Attorney', 'name', 'REPRESENTED_BY', True),
+    ('plaintiff', 'Party', 'name', 'FILED_CASE', False),
+    ('defendant', 'Party', 'name', 'AGAINST', True),
+    ('citations', 'Citation', 'text', 'CITED_BY', True),
+    ('docket', 'Docket', 'id', 'HAS_DOCKET', True),
+]
+
+CASE_PROPERTIES = ['case_name', 'date_filed']
+
+# Where a document was read from, rather than what it says; left out of its hashes
+SOURCE_FIELDS = ('source_path', 'source_hash')
+
+MERGE_CASES_QUERY = """
+        UNWIND $rows AS row
+        MERGE (c:Case {id: row.id})
+        SET c += row.properties
+        """
+
+
+def relationship_query(label: str, key: str, rel_type: str, case_is_source: bool) -> str:
+    pattern = f"(c)-[:{rel_type}]->(n)" if case_is_source else f"(n)-[:{rel_type}]->(c)"
+    return f"""
+        UNWIND $rows AS row
+        MATCH (c:Case {{id: row.case_id}})
+        MERGE (n:{label} {{{key}: row.key}})
+        ON CREATE SET n.id = row.node_id
+        SET n += row.properties
+        MERGE {pattern}
+        """
+
+
+DETACH_CASES_QUERY = """
+        UNWIND $ids AS case_id
+        MATCH (c:Case {id: case_id})-[r]-()
+        DELETE r
+        """
+
+DELETE_CASES_QUERY = """
+        UNWIND $ids AS case_id
+        MATCH (c:Case {id: case_id})
+        DETACH DELETE c
+        """
+
+
+def new_point_id(doc_id: str, chunk_hash: str, occurrence: int) -> str:
+    # Keyed on the chunk's content, so an unchanged chunk keeps its point when text around it moves
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}#{chunk_hash}#{occurrence}"))
+
+
+def read_jsonl(path: Path) -> Iterator[Dict]:
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"Skipping {path}:{line_number}: {e}")
+
+
+def read_pdf(path: Path) -> Dict:
+    from llama_parse import LlamaParse
+
+    parser = LlamaParse(api_key=os.getenv('LLAMA_CLOUD_API_KEY'), result_type="text")
+    documents = parser.load_data(str(path))
+    return {'id': path.stem, 'case_name': path.stem, 'text': "\n\n".join(document.text for document in documents)}
+
+
+def pdf_source(path: Path) -> Dict:
+    # Parsing costs a LlamaParse call, so the pipeline parses only once the file hash has changed
+    return {'id': path.stem, 'case_name': path.stem, 'source_path': str(path), 'source_hash': file_hash(path)}
+
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Dict]:
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from iter_documents(sorted(str(child) for child in path.iterdir() if child.suffix.lower() in ('.jsonl', '.pdf')))
+        elif path.suffix.lower() == '.pdf':
+            yield pdf_source(path)
+        else:
+            yield from read_jsonl(path)
+
+
+def encode_stream(stream: Optional[Callable], encode_batch: Callable, texts: Iterator[str], batch_size: int) -> Iterator:
+    # Encoders without a streaming method are called once per batch_size texts
+    if stream is not None:
+        yield from stream(texts)
+        return
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            return
+        yield from encode_batch(batch)
+
+
+class FastEmbedBatchEmbedder:
+    """Document embedding through FastEmbed's data-parallel mode (``parallel=0`` uses every core)."""
+
+    def __init__(self, model_name: str = "BAAI/bge-small-en-v1.5", batch_size: int = 256, parallel: Optional[int] = None):
+        from fastembed import TextEmbedding
+
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self._model = TextEmbedding(model_name=model_name)
+
+    def get_text_embedding_batch(self, texts: List[str]) -> List[List[float]]:
+        return list(self.embed_stream(texts))
+
+    def embed_stream(self, texts: Iterable[str]) -> Iterator[List[float]]:
+        # Each passage_embed call starts its own worker pool, and every worker loads the model
+        for embedding in self._model.passage_embed(texts, batch_size=self.batch_size, parallel=self.parallel):
+            yield embedding.tolist()
+
+
+class IngestionPipeline:
+    """Chunks, embeds and bulk-writes changed documents, overlapping each batch's writes with the next batch's embedding.
+
+    The chunk texts of the whole run go through one embedding stream, so FastEmbed starts
+    its worker processes once rather than once per batch.
+    """
+
+    def __init__(self, client: QdrantClient, embed_model, graph_store=None, sparse_encoder=None,
+                 collection_name: str = "law_docs", batch_size: int = 256, chunk_size: int = 1024,
+                 chunk_overlap: int = 128, manifest: Optional[IngestionManifest] = None,
+                 on_change: Optional[Callable[[List[str]], None]] = None, quantization: Optional[str] = None):
+        self.client = client
+        self.embed_model = embed_model
+        self.graph_store = graph_store
+        self.sparse_encoder = sparse_encoder
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.manifest = manifest or IngestionManifest()
+        # Called with the ids of documents written or removed, e.g. to invalidate the query caches
+        self.on_change = on_change
+        self.quantization = quantization
+        self.stats = {
+            'documents': 0, 'unchanged': 0, 'removed': 0,
+            'chunks_embedded': 0, 'chunks_reused': 0, 'chunks_deleted': 0, 'seconds': 0.0,
+        }
+        self._collection_ready = False
+        self._graph_ready = False
+        self._started = 0.0
+
+    def run(self, documents: Iterable[Dict], prune: bool = False) -> Dict:
+        self._started = time.perf_counter()
+        seen = set()
+        pending = None
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for batch, points in self._embedded_batches(documents, seen):
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(self.write_batch, batch, points)
+            if pending is not None:
+                pending.result()
+        if prune:
+            self.remove_documents(self.manifest.doc_ids() - seen)
+        self.stats['seconds'] = time.perf_counter() - self._started
+        self._report(final=True)
+        return self.stats
+
+    def _batches(self, documents: Iterable[Dict], seen: set) -> Iterator[List[Dict]]:
+        # Documents are never split across batches, so the manifest only records complete ones
+        batch, chunks = [], 0
+        for document in documents:
+            doc_id = str(document.get('id') or '')
+            if doc_id and document.get('source_hash'):
+                if self.manifest.source_hash(doc_id) == document['source_hash']:
+                    seen.add(doc_id)
+                    self.stats['unchanged'] += 1
+                    continue
+                if not document.get('text'):
+                    document = dict(document, **read_pdf(Path(document['source_path'])))
+            if not doc_id or not document.get('text'):
+                logging.warning(f"Skipping document without id or text: {doc_id or document.get('case_name')}")
+                continue
+            seen.add(doc_id)
+            planned = self.plan(dict(document, id=doc_id))
+            if planned is None:
+                if document.get('source_hash'):
+                    # The file changed but parses to the same text; don't parse it again next run
+                    self.manifest.set_source_hash(doc_id, document['source_hash'])
+                self.stats['unchanged'] += 1
+                continue
+            document = planned
+            batch.append(document)
+            chunks += len(document['new_chunks'])
+            if chunks >= self.batch_size:
+                yield batch
+                batch, chunks = [], 0
+        if batch:
+            yield batch
+
+    def _embedded_batches(self, documents: Iterable[Dict], seen: set) -> Iterator[Tuple[List[Dict], List[models.PointStruct]]]:
+        planned = deque()
+
+        def texts():
+            for batch in self._batches(documents, seen):
+                planned.append(batch)
+                for document in batch:
+                    yield from (text for _, _, text in document['new_chunks'])
+
+        # Vectors come back in text order; the stream reads ahead, planning batches before they are due
+        vectors, buffered, done = self._vector_stream(texts()), deque(), object()
+        while True:
+            if not planned:
+                vector = next(vectors, done)
+                if vector is done and not planned:
+                    return
+                if vector is not done:
+                    buffered.append(vector)
+                continue
+            batch = planned.popleft()
+            count = sum(len(document['new_chunks']) for document in batch)
+            while len(buffered) < count:
+                buffered.append(next(vectors))
+            yield batch, self.build_points(batch, [buffered.popleft() for _ in range(count)])
+
+    def _vector_stream(self, texts: Iterator[str]) -> Iterator[Tuple]:
+        dense_texts, sparse_texts = tee(texts) if self.sparse_encoder else (texts, None)
+        embeddings = encode_stream(getattr(self.embed_model, 'embed_stream', None),
+                                   self.embed_model.get_text_embedding_batch, dense_texts, self.batch_size)
+        if self.sparse_encoder is None:
+            return ((embedding, None) for embedding in embeddings)
+        sparse_vectors = encode_stream(getattr(self.sparse_encoder, 'encode_document_stream', None),
+                                       self.sparse_encoder.encode_documents, sparse_texts, self.batch_size)
+        return zip(embeddings, sparse_vectors)
+
+    def plan(self, document: Dict) -> Optional[Dict]:
+        # Works out which chunks need embedding and which points are stale; None if nothing changed
+        content = {key: value for key, value in document.items() if key not in SOURCE_FIELDS}
+        record = {key: value for key, value in content.items() if key != 'text'}
+        document['content_hash'] = content_hash(content)
+        document['graph_hash'] = content_hash(record)
+        known = self.manifest.document(document['id'])
+        if known and known['content_hash'] == document['content_hash']:
+            return None
+
+        occurrences = Counter()
+        document['chunks'] = []
+        for text in self.splitter.split_text(document['text']):
+            chunk_hash = content_hash(text)
+            point_id = new_point_id(document['id'], chunk_hash, occurrences[chunk_hash])
+            occurrences[chunk_hash] += 1
+            document['chunks'].append((point_id, chunk_hash, text))
+
+        known_points = known['point_ids'] if known else set()
+        point_ids = {point_id for point_id, _, _ in document['chunks']}
+        document['new_chunks'] = [chunk for chunk in document['chunks'] if chunk[0] not in known_points]
+        document['stale_points'] = sorted(known_points - point_ids)
+        document['known'] = known is not None
+        document['graph_changed'] = not known or known['graph_hash'] != document['graph_hash']
+        self.stats['chunks_reused'] += len(document['chunks']) - len(document['new_chunks'])
+        return document
+
+    def build_points(self, batch: List[Dict], vectors: List[Tuple]) -> List[models.PointStruct]:
+        # vectors: a (dense, sparse or None) pair per new chunk of the batch, in order
+        nodes = []
+        for document in batch:
+            for point_id, _, text in document['new_chunks']:
+                nodes.append(TextNode(
+                    id_=point_id,
+                    text=text,
+                    metadata={'case_id': document['id'], 'case_name': document.get('case_name', '')},
+                    relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=document['id'])},
+                ))
+        updated_at = time.time()
+        return [
+            models.PointStruct(
+                id=node.node_id,
+                vector=point_vector(embedding, sparse_vector),
+                # updated_at lets local mirrors of the collection sync only what changed
+                payload={
+                    **node_to_metadata_dict(node, remove_text=False),
+                    'snippet': snippet(node.text),
+                    'updated_at': updated_at,
+                },
+            )
+            for node, (embedding, sparse_vector) in zip(nodes, vectors)
+        ]
+
+    def write_batch(self, batch: List[Dict], points: List[models.PointStruct]):
+        if points:
+            self.ensure_collection(points[0].vector)
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+        stale_points = [point_id for document in batch for point_id in document['stale_points']]
+        if stale_points:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=stale_points),
+                wait=True,
+            )
+        if self.graph_store is not None:
+            self.write_graph([document for document in batch if document['graph_changed']])
+        self.manifest.record([
+            {
+                'id': document['id'],
+                'content_hash': document['content_hash'],
+                'graph_hash': document['graph_hash'],
+                'source_hash': document.get('source_hash'),
+                'chunks': [(point_id, chunk_hash) for point_id, chunk_hash, _ in document['chunks']],
+            }
+            for document in batch
+        ])
+        self._changed([document['id'] for document in batch])
+        self.stats['documents'] += len(batch)
+        self.stats['chunks_embedded'] += len(points)
+        self.stats['chunks_deleted'] += len(stale_points)
+        self._report()
+
+    def remove_documents(self, doc_ids: Iterable[str]):
+        doc_ids = sorted(doc_ids)
+        if not doc_ids:
+            return
+        if self.client.collection_exists(self.collection_name):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.FilterSelector(filter=models.Filter(must=[
+                    models.FieldCondition(key='doc_id', match=models.MatchAny(any=doc_ids)),
+                ])),
+                wait=True,
+            )
+        if self.graph_store is not None:
+            self.graph_store.structured_query(DELETE_CASES_QUERY, {'ids': doc_ids})
+            # Judges, courts and parties that no remaining case refers to
+            labels = sorted({label for _, label, _, _, _ in RELATIONSHIPS})
+            self.graph_store.structured_query(
+                f"MATCH (n) WHERE ({' OR '.join(f'n:{label}' for label in labels)}) AND NOT (n)--() DELETE n"
+            )
+        self.manifest.remove(doc_ids)
+        self._changed(doc_ids)
+        self.stats['removed'] += len(doc_ids)
+        logging.info(f"Removed {len(doc_ids)} documents no longer in the input")
+
+    def ensure_collection(self, vector):
+        if self._collection_ready:
+            return
+        if not self.client.collection_exists(self.collection_name):
+            dense_vector = next(iter(vector.values())) if isinstance(vector, dict) else vector
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                **collection_config(len(dense_vector), self.sparse_encoder, self.quantization),
+            )
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name='doc_id',
+                field_schema=models.PayloadSchemaType.KEYWORD,
+            )
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name='updated_at',
+                field_schema=models.PayloadSchemaType.FLOAT,
+            )
+        elif self.quantization:
+            ensure_quantization(self.client, self.collection_name, self.quantization)
+        self._collection_ready = True
+
+    def ensure_graph_schema(self):
+        if self._graph_ready:
+            return
+        # MERGE looks nodes up by key; without these constraints every MERGE scans the label
+        keys = {('Case', 'id')} | {(label, key) for _, label, key, _, _ in RELATIONSHIPS}
+        for label, key in sorted(keys):
+            self.graph_store.structured_query(
+                f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+            )
+        self._graph_ready = True
+
+    def write_graph(self, batch: List[Dict]):
+        if not batch:
+            return
+        self.ensure_graph_schema()
+        # Edited cases lose their old relationships before the current ones are merged back
+        changed = [document['id'] for document in batch if document['known']]
+        if changed:
+            self.graph_store.structured_query(DETACH_CASES_QUERY, {'ids': changed})
+        cases = [
+            {
+                'id': document['id'],
+                'properties': dict(
+                    {field: document[field] for field in CASE_PROPERTIES if document.get(field) is not None},
+                    name=document.get('case_name') or document['id'],
+                ),
+            }
+            for document in batch
+        ]
+        self.graph_store.structured_query(MERGE_CASES_QUERY, {'rows': cases})
+
+        for field, label, key, rel_type, case_is_source in RELATIONSHIPS:
+            rows = []
+            for document in batch:
+                values = document.get(field)
+                if values is None:
+                    continue
+                for value in values if isinstance(values, list) else [values]:
+                    properties = dict(value) if isinstance(value, dict) else {key: value}
+                    if not properties.get(key):
+                        continue
+                    rows.append({
+                        'case_id': document['id'],
+                        'key': properties[key],
+                        'node_id': f"{label.lower()}-{properties[key]}",
+                        'properties': properties,
+                    })
+            if rows:
+                self.graph_store.structured_query(relationship_query(label, key, rel_type, case_is_source), {'rows': rows})
+
+    def _changed(self, doc_ids: List[str]):
+        if self.on_change is None or not doc_ids:
+            return
+        try:
+            self.on_change(doc_ids)
+        except Exception as e:
+            logging.warning(f"Could not report {len(doc_ids)} changed documents: {e}")
+
+    def _report(self, final: bool = False):
+        elapsed = time.perf_counter() - self._started
+        rate = self.stats['documents'] / elapsed if elapsed else 0.0
+        message = (f"{self.stats['documents']} documents in {elapsed:.1f}s: {rate:.1f} docs/s "
+                   f"({self.stats['unchanged']} unchanged, {self.stats['chunks_embedded']} chunks embedded, "
+                   f"{self.stats['chunks_reused']} reused, {self.stats['chunks_deleted']} deleted)")
+        logging.info(("Ingestion finished: " if final else "Ingested ") + message)
+
+
+def notify_invalidation(url: str, token: Optional[str] = None, timeout: float = 10) -> Callable[[List[str]], None]:
+    # Tells a running app which cases changed so it drops their cached details and answers
+    def notify(doc_ids: List[str]):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        body = json.dumps({'case_ids': doc_ids}).encode('utf-8')
+        request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+        with urllib.request.urlopen(request, timeout=timeout):
+            pass
+    return notify
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest court opinions into law_docs and the legal graph')
+    parser.add_argument('paths', nargs='*', help='JSONL files, PDFs or directories containing them')
+    parser.add_argument('--collection', default='law_docs')
+    parser.add_argument('--batch-size', type=int, default=256, help='chunks embedded and upserted per batch')
+    parser.add_argument('--parallel', type=int, default=None, help='FastEmbed worker processes; 0 uses every core')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='tokens per chunk')
+    parser.add_argument('--chunk-overlap', type=int, default=128)
+    parser.add_argument('--manifest', default='.ingest_manifest.sqlite', help='SQLite file with document and chunk hashes')
+    parser.add_argument('--restart', action='store_true', help='forget the manifest and ingest everything again')
+    parser.add_argument('--prune', action='store_true', help='delete documents that are in the manifest but not in the input')
+    parser.add_argument('--hybrid', action='store_true', default=os.getenv('KB_HYBRID', 'false').strip().lower() in ('1', 'true', 'yes', 'on'),
+                        help='also write sparse vectors for hybrid search (default: KB_HYBRID)')
+    parser.add_argument('--no-graph', action='store_true', help='only write law_docs')
+    parser.add_argument('--quantization', choices=['none', 'scalar', 'binary'], default=os.getenv('KB_QUANTIZATION'),
+                        help='quantize the dense vectors of the collection (default: KB_QUANTIZATION)')
+    parser.add_argument('--notify-url', default=os.getenv('KB_INVALIDATE_URL'),
+                        help="app's /cache/invalidate URL, called with the ids of changed cases (default: KB_INVALIDATE_URL)")
+    parser.add_argument('--backfill-snippets', action='store_true',
+                        help='write the snippet field of points ingested before it existed, then exit')
+    args = parser.parse_args()
+    if not args.paths and not args.backfill_snippets:
+        parser.error('the following arguments are required: paths')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    if args.backfill_snippets:
+        filled = backfill_snippets(client, args.collection, batch_size=args.batch_size)
+        logging.info(f"Backfilled {filled} snippets in {args.collection}")
+        return
+    if args.restart and os.path.exists(args.manifest):
+        os.remove(args.manifest)
+
+    graph_store = None
+    if not args.no_graph:
+        from llama_index.graph_stores.neo4j import Neo4jPropertyGraphStore
+
+        graph_store = Neo4jPropertyGraphStore(
+            url=os.getenv('NEO4J_URL'),
+            username="neo4j",
+            password=os.getenv('NEO4J_PASSWORD'),
+            database="neo4j",
+            refresh_schema=False,
+        )
+
+    pipeline = IngestionPipeline(
+        client=client,
+        embed_model=FastEmbedBatchEmbedder(batch_size=args.batch_size, parallel=args.parallel),
+        graph_store=graph_store,
+        sparse_encoder=SparseEncoder(os.getenv('KB_SPARSE_MODEL', 'Qdrant/bm25'), parallel=args.parallel) if args.hybrid else None,
+        collection_name=args.collection,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        manifest=IngestionManifest(args.manifest),
+        on_change=notify_invalidation(args.notify_url, os.getenv('KB_ADMIN_TOKEN')) if args.notify_url else None,
+        quantization=args.quantization,
+    )
+    pipeline.run(iter_documents(args.paths), prune=args.prune)
+
+
+if __name__ == '__main__':
+    main()
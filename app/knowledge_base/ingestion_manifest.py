@@ -0,0 +1,97 @@
+# app/knowledge_base/ingestion_manifest.py
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def content_hash(value) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def file_hash(path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """SQLite record of what has been ingested: a content hash per document and the points of its chunks.
+
+    A document is recorded only after its points and graph nodes are written, so the
+    manifest also serves as the resume point of an interrupted run. Documents parsed from
+    files (PDFs) also keep the hash of the raw file, so unchanged files are not parsed again.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, content_hash TEXT, graph_hash TEXT, source_hash TEXT, updated_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if 'source_hash' not in columns:
+            self._db.execute("ALTER TABLE documents ADD COLUMN source_hash TEXT")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (point_id TEXT PRIMARY KEY, doc_id TEXT, chunk_hash TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        self._db.commit()
+
+    def document(self, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, graph_hash FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            points = self._db.execute("SELECT point_id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        return {'content_hash': row[0], 'graph_hash': row[1], 'point_ids': {point_id for (point_id,) in points}}
+
+    def source_hash(self, doc_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT source_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_source_hash(self, doc_id: str, source_hash: str):
+        with self._lock, self._db:
+            self._db.execute("UPDATE documents SET source_hash = ? WHERE doc_id = ?", (source_hash, doc_id))
+
+    def record(self, documents: List[Dict]):
+        # documents: {'id', 'content_hash', 'graph_hash', 'source_hash', 'chunks': [(point_id, chunk_hash), ...]}
+        now = time.time()
+        with self._lock, self._db:
+            for document in documents:
+                self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (document['id'],))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (point_id, doc_id, chunk_hash) VALUES (?, ?, ?)",
+                    [(point_id, document['id'], chunk_hash) for point_id, chunk_hash in document['chunks']],
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents (doc_id, content_hash, graph_hash, source_hash, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (document['id'], document['content_hash'], document['graph_hash'], document.get('source_hash'), now),
+                )
+
+    def remove(self, doc_ids: Iterable[str]):
+        doc_ids = [(doc_id,) for doc_id in doc_ids]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM chunks WHERE doc_id = ?", doc_ids)
+            self._db.executemany("DELETE FROM documents WHERE doc_id = ?", doc_ids)
+
+    def doc_ids(self) -> Set[str]:
+        with self._lock:
+            return {doc_id for (doc_id,) in self._db.execute("SELECT doc_id FROM documents")}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            documents = self._db.execute("SELECT count(*) FROM documents").fetchone()[0]
+            chunks = self._db.execute("SELECT count(*) FROM chunks").fetchone()[0]
+        return {'documents': documents, 'chunks': chunks}
@@ -1,9 +1,14 @@
 import logging
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import atexit
 import json
 import re
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from llama_index.core import VectorStoreIndex, StorageContext
 from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import models
 from llama_index.graph_stores.neo4j import Neo4jPropertyGraphStore
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.retrievers import VectorIndexRetriever
@@ -19,27 +24,251 @@ from llama_index.core.selectors import (
     PydanticSingleSelector,
 )
 from llama_index.core.response_synthesizers import TreeSummarize
+from llama_index.core.callbacks import CallbackManager
+from app.knowledge_base.embedding_cache import EmbeddingCache, CachedEmbedding
+from app.knowledge_base.answer_cache import SemanticAnswerCache
+from app.knowledge_base.branch_pool import BranchBusy, BranchPool
+from app.knowledge_base.case_cache import CaseDetailsCache
+from app.knowledge_base.conversation_store import ConversationStore
+from app.knowledge_base.metrics import metrics
+from app.knowledge_base.metrics_callbacks import MetricsCallbackHandler
+from app.knowledge_base.vector_search import SNIPPET_CHARS, SparseEncoder, VectorSearch, ensure_quantization
+from app.knowledge_base.local_index import LocalVectorIndex, LocalVectorSearch
+from app.knowledge_base.gazetteer import EntityGazetteer
+from app.knowledge_base.query_router import LocalQueryRouter, LocalRouterSelector, load_exemplars
+from app.knowledge_base.context_budget import ContextBudget
+from app.knowledge_base.engine import QueryCancelled
 from dotenv import load_dotenv
 import numpy as np
 import nest_asyncio
 import os
-from flask import session
+from flask import session, has_request_context
 
 load_dotenv()
 nest_asyncio.apply()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+ENTITY_PATTERN = r'\b[A-Z][a-z]+ (?:[A-Z][a-z]+ )*(?:Co\.|Corporation|Inc\.|LLC)\b|\b[A-Z][a-z]+\b'
+NUMBER_PATTERN = r'\b\d(?:[\w.\-/]*\w)?'
+
+ENTITY_LOOKUP_QUERY = """
+        MATCH (e)
+        WHERE e.name CONTAINS $entity_name
+        OPTIONAL MATCH (e)-[r]-(related)
+        RETURN e as entity, e.id as entity_id, labels(e) as entity_labels,
+               type(r) as relationship_type, related, labels(related) as related_labels
+        LIMIT 10
+        """
+
+BATCHED_ENTITY_LOOKUP_QUERY = """
+        UNWIND range(0, size($names) - 1) AS position
+        WITH position, $names[position] AS entity_name
+        CALL {
+            WITH entity_name
+            MATCH (e)
+            WHERE e.name CONTAINS entity_name
+            OPTIONAL MATCH (e)-[r]-(related)
+            RETURN e, r, related
+            LIMIT 10
+        }
+        RETURN position, entity_name, e as entity, e.id as entity_id, labels(e) as entity_labels,
+               type(r) as relationship_type, related, labels(related) as related_labels
+        """
+
+ENTITY_INDEX_NAME = 'entityNames'
+ENTITY_INDEX_LABELS = ['Case', 'Judge', 'Court', 'Party', 'Attorney']
+
+GAZETTEER_NAMES_QUERY = """
+        MATCH (n)
+        WHERE any(label IN labels(n) WHERE label IN $labels) AND n.name IS NOT NULL
+        RETURN n.name AS name, labels(n) AS labels,
+               coalesce(n.aliases, []) + CASE WHEN n.short_name IS NULL THEN [] ELSE [n.short_name] END AS aliases
+        """
+
+FULLTEXT_ENTITY_LOOKUP_QUERY = """
+        UNWIND range(0, size($names) - 1) AS position
+        WITH position, $names[position] AS entity_name, $search_terms[position] AS search_term
+        CALL {
+            WITH search_term
+            CALL db.index.fulltext.queryNodes($index_name, search_term, {limit: $candidates})
+            YIELD node, score
+            WHERE score >= $min_score
+            OPTIONAL MATCH (node)-[r]-(related)
+            RETURN node AS e, score, r, related
+            ORDER BY score DESC
+            LIMIT 10
+        }
+        RETURN position, entity_name, e as entity, e.id as entity_id, labels(e) as entity_labels, score,
+               type(r) as relationship_type, related, labels(related) as related_labels
+        """
+
+LUCENE_SPECIAL_CHARS = re.compile(r'([+\-!(){}\[\]^"~*?:\\/]|&&|\|\|)')
+# Only the upper-case spellings are operators, and the index analyzer lower-cases terms anyway
+LUCENE_KEYWORDS = {'AND', 'OR', 'NOT'}
+
+
+def build_fulltext_query(entity: str, fuzzy: bool = True) -> str:
+    raw_terms = [term.lower() if term in LUCENE_KEYWORDS else term for term in entity.split()]
+    terms = [LUCENE_SPECIAL_CHARS.sub(r'\\\1', term) for term in raw_terms]
+    if not terms:
+        return '""'
+    # Exact phrase matches rank above fuzzy term matches
+    exact = f'"{" ".join(terms)}"^2'
+    if not fuzzy:
+        return f'{exact} OR ({" AND ".join(terms)})'
+    # Length before escaping, so punctuation does not make a short term fuzzy
+    fuzzy_terms = [f"{term}~1" if len(raw) >= 4 else term for raw, term in zip(raw_terms, terms)]
+    return f'{exact} OR ({" AND ".join(fuzzy_terms)})'
+
+
+CASE_DETAILS_CLAUSES = """
+        OPTIONAL MATCH (c)-[:DECIDED_BY]->(j:Judge)
+        OPTIONAL MATCH (c)-[:AUTHORED_BY]->(a:Judge)
+        OPTIONAL MATCH (c)-[:HEARD_IN]->(ct:Court)
+        OPTIONAL MATCH (c)-[:REPRESENTED_BY]->(att:Attorney)
+        OPTIONAL MATCH (p:Party)-[:FILED_CASE]->(c)
+        OPTIONAL MATCH (c)-[:AGAINST]->(d:Party)
+        OPTIONAL MATCH (c)-[:CITED_BY]->(cit:Citation)
+        OPTIONAL MATCH (c)-[:HAS_OPINION]->(o:Opinion)
+        OPTIONAL MATCH (c)-[:HAS_DOCKET]->(docket:Docket)"""
+
+CASE_DETAILS_RETURN = """collect(DISTINCT j) as judges, a as author, ct as court,
+               collect(DISTINCT att) as attorneys, p as plaintiff, d as defendant,
+               collect(DISTINCT cit) as citations, o as opinion, docket"""
+
+
+TOP_CASES_QUERY = """
+        MATCH (c:Case)
+        WITH c, size([(c)--() | 1]) AS references
+        ORDER BY references DESC
+        LIMIT $limit
+        RETURN c.id AS case_id
+        """
+
+FINAL_PROMPT_TEMPLATE = """You are a highly knowledgeable Legal AI assistant specializing in analyzing court cases and legal precedents. Your task is to provide a very short and accurate response to the following query based on the information data provided.
+
+        Query: {query}
+
+        Data: {response}
+
+        Knowledgebase Context: {graph_context} + {vector_context}
+
+        Case Details: {case_details}
+
+        Instructions:
+        1. Analyze the Knowledgebase context, data and specific case details, extracting all relevant information related to the query.
+        2. Provide a clear, concise, and well-structured response that directly addresses the query.
+        3. Include specific details such as case names, courts, judges, plaintiffs, defendants, attorneys, dates filed, decision dates, case outcomes, judicial opinions and legal principles when available in any of the contexts but do not use the term 'document' or 'context' in your response.
+        4. If the contexts contain information about multiple related cases or legal issues, combine and summarize them briefly and explain their relevance to the query.
+        5. If there are any conflicting opinions or interpretations in the contexts, present them objectively and explain the implications.
+        6. Use legal terminology accurately, but also provide explanations for complex terms to ensure clarity.
+        7. If the contexts don't provide sufficient information to fully answer the query, clearly state what is known and what information is missing.
+        8. Do not refer to the query, documents and contexts directly in your answer; instead, incorporate the information seamlessly into your response by saying "Based on my knowledge ...".
+        9. Do not make assumptions or include information not present in the given contexts.
+        10. Conclude your response with a brief summary of the key points.
+        11. After your main response, suggest two follow-up questions that would be relevant for further exploration of the topic, prefaced with "For further exploration, you might consider asking:".
+
+        Remember to maintain an objective, professional tone throughout your response. Do not refer to the query or contexts directly in your answer; instead, incorporate the information seamlessly into your response.
+
+        Now, based on these instructions, please provide your comprehensive analysis and response."""
+
+
+def as_items(context) -> List[str]:
+    if not context:
+        return []
+    return [context] if isinstance(context, str) else list(context)
+
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event], query: str, chunks=None):
+    if cancel_event is not None and cancel_event.is_set():
+        # Closing the generator closes the LLM's streaming connection
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        raise QueryCancelled(query)
+
+
+class TimedLLMMultiSelector(LLMMultiSelector):
+    def _select(self, choices, query):
+        with metrics.timer('selector'):
+            return super()._select(choices, query)
+
+
 class IntegratedKnowledgeBaseQuery:
-    def __init__(self):
-        self.embed_model, self.llm = self._initialize_components()
-        self.graph_store = self._setup_graph_store()
-        self.vector_store = self._setup_vector_store()
+    def __init__(self, embed_model=None, llm=None, graph_store=None, vector_store=None, sparse_encoder=None):
+        # Components can be injected, e.g. local stand-ins for the offline benchmarks
+        self.embed_model, self.llm = self._initialize_components(embed_model, llm)
+        self.graph_store = graph_store or self._setup_graph_store()
+        self.vector_store = vector_store or self._setup_vector_store()
+        self.vector_search = self._setup_vector_search(sparse_encoder)
+        self.graph_batched = env_flag('KB_GRAPH_BATCHED', True)
+        self.entity_index_ready = self._setup_entity_index()
+        self.gazetteer = self._setup_gazetteer()
+        self._gazetteer_lock = threading.Lock()
+        self._gazetteer_running = False
+        self._gazetteer_pending = False
         self.graph_index, self.vector_index = self._setup_index()
+        self.retrieval_pools, self.retrieval_timeouts = self._setup_retrieval()
+        # 'single' feeds retrieval results straight into one final completion;
+        # 'router' also runs the LLM selector, sub-engine synthesis and TreeSummarize
+        self.synthesis_mode = os.getenv('KB_SYNTHESIS_MODE', 'single').strip().lower()
+        self.local_router = self._setup_local_router()
+        # Built once and shared by every request: the engines, tools and summarizer keep no
+        # per-query state, and llama-index tracks callbacks per thread via context variables.
+        # They query the stores directly, so ingestion never requires a rebuild
+        self.router_query_engine = self._build_router_query_engine()
+        self.answer_cache = self._setup_answer_cache()
+        self.case_cache = self._setup_case_cache()
+        self.context_budget = ContextBudget(
+            max_tokens=int(os.getenv('KB_CONTEXT_TOKENS', '3000')),
+            context_window=int(os.getenv('KB_CONTEXT_WINDOW', '8192')),
+            reserve_tokens=int(os.getenv('KB_RESPONSE_TOKENS', '1024')),
+        )
+        self.conversation_store = ConversationStore(
+            max_turns=int(os.getenv('KB_HISTORY_TURNS', '10')),
+            max_conversations=int(os.getenv('KB_HISTORY_CONVERSATIONS', '10000')),
+            ttl=float(os.getenv('KB_HISTORY_TTL', '86400')),
+            summarizer=self._summarize_turn if env_flag('KB_HISTORY_SUMMARIZE', False) else None,
+        )
+        self.history_match_score = float(os.getenv('KB_HISTORY_MATCH_SCORE', '0.5'))
+        self.history_reuse_score = float(os.getenv('KB_HISTORY_REUSE_SCORE', '0.9'))
+        self.data_version_interval = float(os.getenv('KB_DATA_VERSION_INTERVAL', '60'))
+        self._data_version_checked = 0.0
+        self._data_version = None
+        self._data_version_lock = threading.Lock()
+        metrics.register_collector(self._cache_metrics)
+        if self.gazetteer is not None and self.data_version_interval > 0:
+            threading.Thread(target=self._watch_data_version, name='kb-data-version', daemon=True).start()
+        prefetch = int(os.getenv('KB_CASE_CACHE_PREFETCH', '0'))
+        if self.case_cache is not None and prefetch > 0:
+            threading.Thread(target=self.warm_case_cache, args=(prefetch,), name='kb-case-prefetch', daemon=True).start()
 
-    def _initialize_components(self):
-        embed_model = FastEmbedEmbedding(model_name="BAAI/bge-small-en-v1.5")
+    def _initialize_components(self, base_embed_model=None, llm=None):
+        # Times llama-index LLM, retrieval and synthesis events and counts LLM tokens
+        Settings.callback_manager = CallbackManager([MetricsCallbackHandler()])
+        if base_embed_model is None:
+            base_embed_model = FastEmbedEmbedding(model_name="BAAI/bge-small-en-v1.5")
+        # Query embeddings are cached so the router's vector engine and format_vector_results share them
+        embedding_cache = EmbeddingCache(
+            max_size=int(os.getenv('KB_EMBED_CACHE_SIZE', '2048')),
+            path=os.getenv('KB_EMBED_CACHE_PATH'),
+            model_name=base_embed_model.model_name,
+            save_every=int(os.getenv('KB_EMBED_CACHE_SAVE_EVERY', '256')),
+        )
+        if embedding_cache.path:
+            atexit.register(embedding_cache.save)
+        embed_model = CachedEmbedding(base_embed_model, embedding_cache)
         Settings.embed_model = embed_model
-        llm = Groq(model="llama3-70b-8192", api_key=os.getenv('GROQ_API_KEY'), temperature=0)
+        if llm is None:
+            llm = Groq(model="llama3-70b-8192", api_key=os.getenv('GROQ_API_KEY'), temperature=0)
+        llm.callback_manager = Settings.callback_manager
         Settings.llm = llm
 
         return embed_model, llm
@@ -54,23 +283,166 @@ class IntegratedKnowledgeBaseQuery:
             sanitize_query_output=True
         )
 
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        return self.embed_model.cache
+
+    def _graph_query(self, cypher_query: str, params: Optional[Dict] = None, name: str = 'other'):
+        metrics.inc('kb_neo4j_queries_total', query=name)
+        return self.graph_store.structured_query(cypher_query, params)
+
+    def _cache_metrics(self) -> List[Tuple[str, str, Dict, float]]:
+        caches = {'embedding': self.embedding_cache.stats()}
+        if self.answer_cache is not None:
+            caches['answer'] = self.answer_cache.stats()
+        if self.case_cache is not None:
+            caches['case'] = self.case_cache.stats()
+        samples = [
+            ('kb_retrieval_in_flight', 'gauge', {'branch': name}, pool.in_flight)
+            for name, pool in self.retrieval_pools.items()
+        ]
+        if self.gazetteer is not None:
+            samples.append(('kb_gazetteer_entities', 'gauge', {}, len(self.gazetteer)))
+        for cache, stats in caches.items():
+            samples += [
+                ('kb_cache_hits_total', 'counter', {'cache': cache}, stats['hits']),
+                ('kb_cache_misses_total', 'counter', {'cache': cache}, stats['misses']),
+                ('kb_cache_hit_ratio', 'gauge', {'cache': cache}, stats['hit_rate']),
+                ('kb_cache_entries', 'gauge', {'cache': cache}, stats['size']),
+            ]
+        return samples
+
+    def _setup_entity_index(self) -> bool:
+        if not env_flag('KB_ENTITY_INDEX', True):
+            return False
+        labels = '|'.join(ENTITY_INDEX_LABELS)
+        try:
+            self._graph_query(
+                f"CREATE FULLTEXT INDEX {ENTITY_INDEX_NAME} IF NOT EXISTS "
+                f"FOR (n:{labels}) ON EACH [n.name, n.case_name]",
+                name='create_entity_index',
+            )
+            self._graph_query(
+                "CALL db.awaitIndex($index_name, $timeout)",
+                {"index_name": ENTITY_INDEX_NAME, "timeout": int(os.getenv('KB_ENTITY_INDEX_TIMEOUT', '60'))},
+                name='await_entity_index',
+            )
+            logging.info(f"Full-text entity index '{ENTITY_INDEX_NAME}' is online")
+            return True
+        except Exception as e:
+            logging.error(f"Error creating full-text entity index, falling back to CONTAINS lookups: {str(e)}")
+            return False
+
+    def _setup_gazetteer(self):
+        if not env_flag('KB_GAZETTEER', True):
+            return None
+        gazetteer = EntityGazetteer(path=os.getenv('KB_GAZETTEER_PATH'))
+        # A snapshot is used straight away and rebuilt in the background if the graph has changed since
+        if not gazetteer.ready:
+            self.refresh_gazetteer(gazetteer)
+        return gazetteer
+
+    def fetch_entity_names(self) -> List[Dict]:
+        return self._graph_query(GAZETTEER_NAMES_QUERY, {"labels": ENTITY_INDEX_LABELS}, name='gazetteer_names')
+
+    def refresh_gazetteer(self, gazetteer: Optional[EntityGazetteer] = None, data_version: Optional[str] = None):
+        gazetteer = self.gazetteer if gazetteer is None else gazetteer
+        try:
+            # The version is read first, so a change during the build triggers another one
+            data_version = data_version or self.data_version()
+            with metrics.timer('gazetteer_build'):
+                gazetteer.build(self.fetch_entity_names(), data_version)
+            gazetteer.save()
+        except Exception as e:
+            logging.error(f"Error building the entity gazetteer: {str(e)}")
+
+    def refresh_gazetteer_async(self, data_version: Optional[str] = None):
+        # Requests made while a rebuild runs are folded into one more rebuild after it
+        with self._gazetteer_lock:
+            if self._gazetteer_running:
+                self._gazetteer_pending = True
+                return
+            self._gazetteer_running = True
+        threading.Thread(target=self._refresh_gazetteer_loop, args=(data_version,), name='kb-gazetteer', daemon=True).start()
+
+    def _refresh_gazetteer_loop(self, data_version: Optional[str]):
+        while True:
+            self.refresh_gazetteer(data_version=data_version)
+            with self._gazetteer_lock:
+                if not self._gazetteer_pending:
+                    self._gazetteer_running = False
+                    return
+                self._gazetteer_pending = False
+            data_version = None
+
+    def _watch_data_version(self):
+        # The gazetteer follows graph changes even when no query checks the data version
+        if time.time() - self.gazetteer.built_at < self.data_version_interval:
+            time.sleep(self.data_version_interval)
+        while True:
+            self.refresh_data_version()
+            time.sleep(self.data_version_interval)
+
     def get_neo4j_schema(self):
         cypher_query = """
         CALL db.schema.visualization()
         """
         try:
-            result = self.graph_store.structured_query(cypher_query)
+            result = self._graph_query(cypher_query, name='schema')
             return result
         except Exception as e:
             logging.error(f"Error retrieving Neo4j schema: {str(e)}")
             return None
 
     def _setup_vector_store(self):
-        return QdrantVectorStore(
+        vector_store = QdrantVectorStore(
             url=os.getenv("QDRANT_URL"),
             api_key=os.getenv("QDRANT_API_KEY"),
             collection_name="law_docs",
         )
+        # Unset leaves the collection as it is; 'none' turns quantization off
+        quantization = os.getenv('KB_QUANTIZATION')
+        if quantization:
+            try:
+                ensure_quantization(vector_store.client, "law_docs", quantization)
+            except Exception as e:
+                logging.error(f"Error configuring law_docs quantization: {str(e)}")
+        return vector_store
+
+    def _setup_vector_search(self, sparse_encoder=None):
+        # Hybrid search needs law_docs to carry sparse vectors next to the dense ones
+        if sparse_encoder is None and env_flag('KB_HYBRID', False):
+            sparse_encoder = SparseEncoder(os.getenv('KB_SPARSE_MODEL', 'Qdrant/bm25'))
+        vector_search = VectorSearch(
+            self.vector_store.client,
+            "law_docs",
+            self.embed_model,
+            sparse_encoder=sparse_encoder,
+            limit=int(os.getenv('KB_VECTOR_LIMIT', '3')),
+            prefetch_limit=int(os.getenv('KB_HYBRID_PREFETCH', '20')),
+            oversampling=float(os.getenv('KB_QUANTIZATION_OVERSAMPLING', '2.0')),
+            rescore=env_flag('KB_QUANTIZATION_RESCORE', True),
+        )
+        if os.getenv('KB_VECTOR_BACKEND', 'qdrant').strip().lower() != 'local':
+            return vector_search
+        # In-process mirror of the dense vectors; Qdrant stays the source it syncs from
+        if vector_search.hybrid:
+            logging.warning("The local vector backend is dense-only; hybrid search is disabled")
+        return LocalVectorSearch(
+            LocalVectorIndex(
+                os.getenv('KB_LOCAL_INDEX_PATH', '.law_docs_index'),
+                dtype=os.getenv('KB_LOCAL_INDEX_DTYPE', 'float32'),
+                nprobe=int(os.getenv('KB_LOCAL_INDEX_NPROBE', '0')) or None,
+                probe_fraction=float(os.getenv('KB_LOCAL_INDEX_PROBE', '0.5')),
+            ),
+            self.vector_store.client,
+            "law_docs",
+            self.embed_model,
+            vector_name=vector_search.dense_vector_name,
+            limit=vector_search.limit,
+            sync_interval=float(os.getenv('KB_LOCAL_SYNC_INTERVAL', '60')),
+            fallback=vector_search,
+        )
 
     def _setup_index(self):
         storage_context = StorageContext.from_defaults(
@@ -87,6 +459,137 @@ class IntegratedKnowledgeBaseQuery:
         )
         return graph_index, vector_index
 
+    def _setup_retrieval(self):
+        # Each branch has its own threads, so a hung Neo4j cannot starve the vector search
+        workers = int(os.getenv('KB_RETRIEVAL_WORKERS', '4'))
+        default_timeout = os.getenv('KB_RETRIEVAL_TIMEOUT', '30')
+        timeouts = {
+            'router': float(os.getenv('KB_ROUTER_TIMEOUT', default_timeout)),
+            'graph': float(os.getenv('KB_GRAPH_TIMEOUT', default_timeout)),
+            'vector': float(os.getenv('KB_VECTOR_TIMEOUT', default_timeout)),
+        }
+        return {name: BranchPool(name, workers) for name in timeouts}, timeouts
+
+    def _setup_local_router(self):
+        # Only router synthesis selects tools; embedding the exemplars is wasted work otherwise
+        if self.synthesis_mode != 'router' or os.getenv('KB_ROUTER', 'local').strip().lower() != 'local':
+            return None
+        threshold = os.getenv('KB_ROUTER_THRESHOLD', '').strip()
+        try:
+            return LocalQueryRouter(
+                self.embed_model,
+                exemplars=load_exemplars(os.getenv('KB_ROUTER_EXEMPLARS')),
+                entity_extractor=self.extract_entities,
+                threshold=float(threshold) if threshold else None,
+                calibration_quantile=float(os.getenv('KB_ROUTER_CALIBRATION', '0.25')),
+                margin=float(os.getenv('KB_ROUTER_MARGIN', '0.02')),
+                log_path=os.getenv('KB_ROUTER_LOG'),
+            )
+        except Exception as e:
+            logging.error(f"Error setting up the local query router, using the LLM selector: {str(e)}")
+            return None
+
+    def _setup_answer_cache(self):
+        if not env_flag('KB_ANSWER_CACHE', True):
+            return None
+        return SemanticAnswerCache(
+            threshold=float(os.getenv('KB_ANSWER_CACHE_THRESHOLD', '0.95')),
+            ttl=float(os.getenv('KB_ANSWER_CACHE_TTL', '3600')),
+            max_entries=int(os.getenv('KB_ANSWER_CACHE_SIZE', '1000')),
+            path=os.getenv('KB_ANSWER_CACHE_PATH'),
+        )
+
+    def _setup_case_cache(self):
+        if not env_flag('KB_CASE_CACHE', True):
+            return None
+        return CaseDetailsCache(
+            max_size=int(os.getenv('KB_CASE_CACHE_SIZE', '5000')),
+            ttl=float(os.getenv('KB_CASE_CACHE_TTL', '3600')),
+        )
+
+    def data_version(self) -> str:
+        metrics.inc('kb_qdrant_requests_total', operation='get_collection')
+        collection_info = self.vector_store.client.get_collection(collection_name="law_docs")
+        counts = self._graph_query(
+            "CALL { MATCH (n) RETURN count(n) AS nodes } "
+            "CALL { MATCH ()-[r]->() RETURN count(r) AS relationships } "
+            "RETURN nodes, relationships",
+            name='data_version',
+        )[0]
+        return f"{collection_info.points_count}:{self._latest_update()}:{counts['nodes']}:{counts['relationships']}"
+
+    def _latest_update(self) -> Optional[float]:
+        # Edits that keep the chunk count still write new points with a newer updated_at
+        try:
+            metrics.inc('kb_qdrant_requests_total', operation='scroll')
+            points, _ = self.vector_store.client.scroll(
+                collection_name="law_docs",
+                limit=1,
+                order_by=models.OrderBy(key='updated_at', direction=models.Direction.DESC),
+                with_payload=['updated_at'],
+                with_vectors=False,
+            )
+        except Exception as e:
+            # Collections created before ingestion indexed updated_at cannot be ordered by it
+            logging.debug(f"Could not read the latest law_docs update: {str(e)}")
+            return None
+        return points[0].payload.get('updated_at') if points else None
+
+    def refresh_data_version(self, force: bool = False):
+        # Polls collection and graph sizes and the latest law_docs update at most once per
+        # interval and drops stale caches on change
+        with self._data_version_lock:
+            now = time.time()
+            if not force and now - self._data_version_checked < self.data_version_interval:
+                return
+            self._data_version_checked = now
+        try:
+            version = self.data_version()
+        except Exception as e:
+            logging.error(f"Error checking knowledge base data version: {str(e)}")
+            return
+        if self.answer_cache is not None and self.answer_cache.set_data_version(version):
+            logging.info(f"Knowledge base data changed ({version}); cleared cached answers")
+        if self.case_cache is not None and self._data_version not in (None, version):
+            self.case_cache.invalidate()
+            logging.info(f"Knowledge base data changed ({version}); cleared cached case details")
+        if self.gazetteer is not None and self.gazetteer.data_version != version:
+            logging.info(f"Knowledge base data changed ({version}); rebuilding the entity gazetteer")
+            self.refresh_gazetteer_async(version)
+        self._data_version = version
+
+    def invalidate_caches(self, source_ids: Optional[Iterable[str]] = None):
+        # Hook for ingestion: drop everything, or only answers and case details for the given cases/documents
+        source_ids = None if source_ids is None else [str(source_id) for source_id in source_ids]
+        if self.answer_cache is not None:
+            if source_ids is None:
+                self.answer_cache.invalidate()
+            else:
+                self.answer_cache.invalidate_sources(source_ids)
+        if self.case_cache is not None:
+            self.case_cache.invalidate(source_ids)
+        if self.gazetteer is not None:
+            self.refresh_gazetteer_async()
+
+    def answer_cache_entities(self, query: str) -> List[str]:
+        # Names plus numbers (years, dockets, citations): a cached answer is only reused for the same ones
+        return self.extract_entities(query) + re.findall(NUMBER_PATTERN, query)
+
+    def lookup_cached_answer(self, query: str, embedding: Optional[List[float]] = None) -> Optional[Dict]:
+        if self.answer_cache is None:
+            return None
+        self.refresh_data_version()
+        cached = self.answer_cache.lookup(embedding or self.embed_model.get_query_embedding(query),
+                                          self.answer_cache_entities(query))
+        if cached:
+            logging.info(f"Answer cache hit (similarity {cached['similarity']:.3f}, cached query: {cached['query']})")
+        return cached
+
+    def cache_answer(self, query: str, answer: str, sources: List[Dict], embedding: Optional[List[float]] = None):
+        if self.answer_cache is not None and answer:
+            self.answer_cache.store(query, embedding or self.embed_model.get_query_embedding(query), answer, sources,
+                                    self.answer_cache_entities(query))
+
     def diagnose_stores(self):
         logging.info("Diagnosing graph store...")
         self._diagnose_graph_store()
@@ -95,17 +598,17 @@ class IntegratedKnowledgeBaseQuery:
 
     def _diagnose_graph_store(self):
         query = "MATCH (n) RETURN count(n) as node_count"
-        result = self.graph_store.structured_query(query)
+        result = self._graph_query(query, name='diagnose')
         node_count = result[0]['node_count']
         logging.info(f"Total nodes in the graph: {node_count}")
 
         query = "MATCH (n) RETURN DISTINCT labels(n) as node_types"
-        result = self.graph_store.structured_query(query)
+        result = self._graph_query(query, name='diagnose')
         node_types = [r['node_types'][0] for r in result if r['node_types']]
         logging.info(f"Node types in the graph: {', '.join(node_types)}")
 
         query = "MATCH (n) RETURN n LIMIT 5"
-        result = self.graph_store.structured_query(query)
+        result = self._graph_query(query, name='diagnose')
         logging.info("Sample nodes:")
         for record in result:
             logging.info(record['n'])
@@ -134,157 +637,352 @@ class IntegratedKnowledgeBaseQuery:
         return formatted_result
 
     def get_case_details(self, case_id):
-        cypher_query = """
-        MATCH (c:Case {id: $case_id})
-        OPTIONAL MATCH (c)-[:DECIDED_BY]->(j:Judge)
-        OPTIONAL MATCH (c)-[:AUTHORED_BY]->(a:Judge)
-        OPTIONAL MATCH (c)-[:HEARD_IN]->(ct:Court)
-        OPTIONAL MATCH (c)-[:REPRESENTED_BY]->(att:Attorney)
-        OPTIONAL MATCH (p:Party)-[:FILED_CASE]->(c)
-        OPTIONAL MATCH (c)-[:AGAINST]->(d:Party)
-        OPTIONAL MATCH (c)-[:CITED_BY_BYCITED_BYit:Citation)
-        OPTIONAL MATCH (c)-[:HAS_OPINION]->(o:Opinion)
-        OPTIONAL MATCH (c)-[:HAS_DOCKET]->(docket:Docket)
-        RETURN c, collect(DISTINCT j) as judges, a as author, ct as court,
-               collect(DISTINCT att) as attorneys, p as plaintiff, d as defendant,
-               collect(DISTINCT cit) as citations, o as opinion, docket
+        cypher_query = f"""
+        MATCH (c:Case {{id: $case_id}})
+        {CASE_DETAILS_CLAUSES}
+        RETURN c, {CASE_DETAILS_RETURN}
         """
-        results = self.graph_store.structured_query(cypher_query, {"case_id": case_id})
+        results = self._graph_query(cypher_query, {"case_id": case_id}, name='case_details')
         return results
 
-    def format_graph_results(self, query):
-        cypher_query = """
-                MATCH (e)
-                WHERE e.name CONTAINS $entity_name
-                OPTIONAL MATCH (e)-[r]-(related)
-                RETURN e as entity, type(r) as relationship_type, related
-                LIMIT 10
-                """
-        # Extract key entities from the query
-        entities = re.findall(r'\b[A-Z][a-z]+ (?:[A-Z][a-z]+ )*(?:Co\.|Corporation|Inc\.|LLC)\b|\b[A-Z][a-z]+\b', query)
+    def get_case_details_batch(self, case_ids: List[str]) -> Dict[str, List[Dict]]:
+        case_ids = list(dict.fromkeys(case_ids))
+        if not case_ids:
+            return {}
+        cypher_query = f"""
+        UNWIND $case_ids AS case_id
+        MATCH (c:Case {{id: case_id}})
+        {CASE_DETAILS_CLAUSES}
+        RETURN case_id, c, {CASE_DETAILS_RETURN}
+        """
+        results = self._graph_query(cypher_query, {"case_ids": case_ids}, name='case_details_batch')
+        details = {}
+        for result in results:
+            details.setdefault(result['case_id'], []).append(result)
+        return details
+
+    def fetch_case_records(self, case_ids: List[str]) -> Dict[str, Dict]:
+        case_ids = list(dict.fromkeys(case_ids))
+        if self.graph_batched:
+            details_by_case = self.get_case_details_batch(case_ids)
+        else:
+            details_by_case = {case_id: self.get_case_details(case_id) for case_id in case_ids}
+        return {
+            case_id: {'name': details[0]['c'].get('case_name', 'Unknown'), 'details': self.format_case_details(details)}
+            for case_id, details in details_by_case.items() if details
+        }
+
+    def case_records(self, case_ids: List[str]) -> Dict[str, Dict]:
+        if not case_ids:
+            return {}
+        if self.case_cache is None:
+            return self.fetch_case_records(case_ids)
+        self.refresh_data_version()
+        return self.case_cache.get_or_fetch(case_ids, self.fetch_case_records)
+
+    def warm_case_cache(self, limit: int, batch_size: int = 100):
+        # Loads the cases with the most relationships, which are the ones graph lookups keep returning
+        try:
+            case_ids = [row['case_id'] for row in self._graph_query(TOP_CASES_QUERY, {'limit': limit}, name='top_cases')]
+            for start in range(0, len(case_ids), batch_size):
+                self.case_records(case_ids[start:start + batch_size])
+            logging.info(f"Prefetched details for {len(case_ids)} cases")
+        except Exception as e:
+            logging.error(f"Error prefetching case details: {str(e)}")
+
+    def extract_entities(self, query: str) -> List[str]:
+        if self.gazetteer is not None and self.gazetteer.ready:
+            # Only names known to the graph, so no lookups are spent on ordinary capitalized words
+            return self.gazetteer.names(query)
+        return re.findall(ENTITY_PATTERN, query)
+
+    def lookup_entities(self, entities: List[str]) -> List[Dict]:
+        if not entities:
+            return []
+        if self.entity_index_ready:
+            # Ranked, fuzzy matches from the full-text index instead of scanning every node
+            fuzzy = env_flag('KB_ENTITY_FUZZY', True)
+            results = self._graph_query(FULLTEXT_ENTITY_LOOKUP_QUERY, {
+                "names": entities,
+                "search_terms": [build_fulltext_query(entity, fuzzy) for entity in entities],
+                "index_name": ENTITY_INDEX_NAME,
+                "candidates": int(os.getenv('KB_ENTITY_CANDIDATES', '5')),
+                "min_score": float(os.getenv('KB_ENTITY_MIN_SCORE', '0')),
+            }, name='entity_lookup_fulltext')
+            results.sort(key=lambda result: result['position'])
+            return results
+        if self.graph_batched:
+            # One round trip for every entity; per-entity LIMIT is applied inside the subquery
+            results = self._graph_query(BATCHED_ENTITY_LOOKUP_QUERY, {"names": entities}, name='entity_lookup_batch')
+            results.sort(key=lambda result: result['position'])
+            return results
 
         graph_results = []
-        case_details = []
         for entity in entities:
-            results = self.graph_store.structured_query(cypher_query, {"entity_name": entity})
-            graph_results.extend(results)
-            # Check if any of the results are Case nodes
-            for result in results:
-                if 'Case' in result['entity'].get('labels', []):
-                    case_id = result['entity_id']
-                    case_detail = self.get_case_details(case_id)
-                    if case_detail:
-                        formatted_case = self.format_case_details(case_detail)
-                        case_details.append(formatted_case)
-        formatted_results = []
+            for result in self._graph_query(ENTITY_LOOKUP_QUERY, {"entity_name": entity}, name='entity_lookup'):
+                graph_results.append({**result, 'entity_name': entity})
+        return graph_results
+
+    def format_graph_results(self, query):
+        graph_context = self.graph_context(query)
+        return graph_context['graph_results'], graph_context['case_details']
+
+    def graph_context(self, query: str) -> Dict:
+        return self.graph_contexts([query])[0]
+
+    def graph_contexts(self, queries: List[str]) -> List[Dict]:
+        # Entities and cases shared by several queries are looked up once, in one round trip each
+        entities_by_query = [list(dict.fromkeys(self.extract_entities(query))) for query in queries]
+        with metrics.timer('graph_lookup'):
+            rows = self.lookup_entities(list(dict.fromkeys(e for entities in entities_by_query for e in entities)))
+        rows_by_entity = {}
+        for row in rows:
+            rows_by_entity.setdefault(row.get('entity_name'), []).append(row)
+
+        graph_results = [[row for entity in entities for row in rows_by_entity.get(entity, [])] for entities in entities_by_query]
+        case_ids = [
+            [result['entity_id'] for result in results if 'Case' in (result.get('entity_labels') or [])]
+            for results in graph_results
+        ]
+        with metrics.timer('case_details'):
+            records = self.case_records(list(dict.fromkeys(case_id for ids in case_ids for case_id in ids)))
+        return [self._format_graph_context(results, ids, records) for results, ids in zip(graph_results, case_ids)]
+
+    def _format_graph_context(self, graph_results: List[Dict], case_ids: List[str], records: Dict[str, Dict]) -> Dict:
+        case_ids = [case_id for case_id in dict.fromkeys(case_ids) if case_id in records]
+        case_details = [records[case_id]['details'] for case_id in case_ids]
+
+        # One entry per entity, listing each of its relationships once
+        entities = {}
         for graph_result in graph_results:
-            entity = graph_result.get('entity', {})
+            entity = graph_result.get('entity') or {}
             rel_type = graph_result.get('relationship_type')
-            related = graph_result.get('related', {})
+            related = graph_result.get('related') or {}
 
             entity_name = entity.get('name', 'Unknown')
-            entity_type = next(iter(entity.get('labels', [])), 'Unknown')
-            formatted_result = f"- {entity_name} ({entity_type})"
+            entity_type = next(iter(graph_result.get('entity_labels') or entity.get('labels', [])), 'Unknown')
+            key = graph_result.get('entity_id') or (entity_name, entity_type)
+            formatted_result = entities.setdefault(key, {'header': f"- {entity_name} ({entity_type})", 'relations': []})
 
             if rel_type and related:
                 related_name = related.get('name', 'Unknown')
-                related_type = next(iter(related.get('labels', [])), 'Unknown')
-                formatted_result += f"\n  {rel_type} {related_name} ({related_type})"
-
-            formatted_results.append(formatted_result)
-
-        return "\n".join(formatted_results), case_details
-
-    def format_vector_results(self, query) -> str:
-        query_vector = self.embed_model.get_text_embedding(query)
-        vector_results = self.vector_store.client.search(
-            collection_name="law_docs",
-            query_vector=query_vector,
-            limit=3
-        )
-        formatted_results = []
-        for i, result in enumerate(vector_results, 1):
-            # Access the payload and score attributes directly
-              payload = result.payload
-              score = result.score
-              # Assuming 'content' is a field in your payload
-              node_content = json.loads(result.payload['_node_content'])
-              content = node_content.get('text', '')
-              formatted_results.append(f"Document {i} (Score: {score:.4f}):\n{content[:300]}...")
-        return "\n".join(formatted_results)
+                related_type = next(iter(graph_result.get('related_labels') or related.get('labels', [])), 'Unknown')
+                relation = f"{rel_type} {related_name} ({related_type})"
+                if relation not in formatted_result['relations']:
+                    formatted_result['relations'].append(relation)
 
-    def generate_llm_response(self, query: str, response: str, graph_results: List[Dict], vector_results: List[Dict], case_details: List[str]) -> str:
-        graph_context = graph_results
-        vector_context = vector_results
+        formatted_results = [
+            entity['header'] + "".join(f"\n  {relation}" for relation in entity['relations'])
+            for entity in entities.values()
+        ]
 
-        prompt = f"""You are a highly knowledgeable Legal AI assistant specializing in analyzing court cases and legal precedents. Your task is to provide a very short and accurate response to the following query based on the information data provided.
+        cases = [{'id': case_id, 'name': records[case_id]['name']} for case_id in case_ids]
+        return {
+            'graph_results': formatted_results,
+            'case_details': case_details,
+            'cases': cases,
+        }
 
-        Query: {query}
+    def search_vectors(self, query: str) -> List:
+        return self.vector_search.search(query)
 
-        Data: {response}
+    def format_vector_hits(self, vector_results: List) -> str:
+        return "\n".join(self.vector_snippets(vector_results))
 
-        Knowledgebase Context: {graph_context} + {vector_context}
+    def vector_snippets(self, vector_results: List) -> List[str]:
+        formatted_results = []
+        for i, result in enumerate(vector_results, 1):
+            payload = result.payload or {}
+            content = payload.get('snippet')
+            if content is None and '_node_content' in payload:
+                content = json.loads(payload['_node_content']).get('text', '')
+            formatted_results.append(f"Document {i} (Score: {result.score:.4f}):\n{(content or '')[:SNIPPET_CHARS]}...")
+        return formatted_results
 
-        Case Details: {case_details}
+    def format_vector_results(self, query) -> str:
+        return self.format_vector_hits(self.search_vectors(query))
 
-        Instructions:
-        1. Analyze the Knowledgebase context, data and specific case details, extracting all relevant information related to the query.
-        2. Provide a clear, concise, and well-structured response that directly addresses the query.
-        3. Include specific details such as case names, courts, judges, plaintiffs, defendants, attorneys, dates filed, decision dates, case outcomes, judicial opinions and legal principles when available in any of the contexts but do not use the term 'document' or 'context' in your response.
-        4. If the contexts contain information about multiple related cases or legal issues, combine and summarize them briefly and explain their relevance to the query.
-        5. If there are any conflicting opinions or interpretations in the contexts, present them objectively and explain the implications.
-        6. Use legal terminology accurately, but also provide explanations for complex terms to ensure clarity.
-        7. If the contexts don't provide sufficient information to fully answer the query, clearly state what is known and what information is missing.
-        8. Do not refer to the query, documents and contexts directly in your answer; instead, incorporate the information seamlessly into your response by saying "Based on my knowledge ...".
-        9. Do not make assumptions or include information not present in the given contexts.
-        10. Conclude your response with a brief summary of the key points.
-        11. After your main response, suggest two follow-up questions that would be relevant for further exploration of the topic, prefaced with "For further exploration, you might consider asking:".
+    def collect_sources(self, cases: List[Dict], vector_results: List) -> List[Dict]:
+        sources = [{'type': 'case', 'id': case['id'], 'name': case['name']} for case in cases]
+        for result in vector_results:
+            payload = result.payload or {}
+            sources.append({
+                'type': 'document',
+                'id': str(result.id),
+                # Ingestion reports changes by case/document id, not by point
+                'case_id': payload.get('case_id'),
+                # llama-index writes the string "None" for chunks without a source document
+                'doc_id': payload.get('doc_id') if payload.get('doc_id') != 'None' else None,
+                'name': payload.get('case_name') or payload.get('file_name') or payload.get('doc_id') or str(result.id),
+                'score': round(result.score, 4),
+            })
+        return sources
 
-        Remember to maintain an objective, professional tone throughout your response. Do not refer to the query or contexts directly in your answer; instead, incorporate the information seamlessly into your response.
+    def build_prompt(self, query: str, response: str, graph_results, vector_results, case_details) -> str:
+        # Deduplicate, rank and trim the retrieved context to the token budget
+        overhead = FINAL_PROMPT_TEMPLATE.format(query=query, response="", graph_context="", vector_context="", case_details="")
+        context, tokens = self.context_budget.fit(query, {
+            'response': [response] if response else [],
+            'case_details': as_items(case_details),
+            'graph': as_items(graph_results),
+            'vector': as_items(vector_results),
+        }, overhead=overhead)
+        logging.info(f"Final prompt context: {tokens} tokens")
 
-        Now, based on these instructions, please provide your comprehensive analysis and response."""
+        return FINAL_PROMPT_TEMPLATE.format(
+            query=query,
+            response="\n".join(context['response']),
+            graph_context="\n".join(context['graph']),
+            vector_context="\n".join(context['vector']),
+            case_details="\n".join(context['case_details']),
+        )
 
-        llm_output = self.llm.complete(prompt).text
+    def generate_llm_response(self, query: str, response: str, graph_results: List[Dict], vector_results: List[Dict], case_details: List[str]) -> str:
+        prompt = self.build_prompt(query, response, graph_results, vector_results, case_details)
+        with metrics.timer('llm_final'):
+            llm_output = self.llm.complete(prompt).text
         return llm_output
 
-    def query_knowledge_base(self, query: str) -> str:
+    def stream_llm_response(self, query: str, response: str, graph_results: List[Dict], vector_results: List[Dict], case_details: List[str]) -> Iterator[str]:
+        prompt = self.build_prompt(query, response, graph_results, vector_results, case_details)
+        start = time.perf_counter()
+        first_token = True
+        for chunk in self.llm.stream_complete(prompt):
+            if chunk.delta:
+                if first_token:
+                    metrics.observe('kb_stage_seconds', time.perf_counter() - start, stage='llm_first_token')
+                    first_token = False
+                yield chunk.delta
+        metrics.observe('kb_stage_seconds', time.perf_counter() - start, stage='llm_final')
+
+    def query_knowledge_base(self, query: str, conversation_id: Optional[str] = None) -> str:
         logging.info(f"Querying knowledge base: {query}")
         
-        # Access previous context from the session
-        previous_context = session.get('history', [])
+        # Access the relevant previous turns of this conversation
+        conversation_id = self.conversation_id(conversation_id)
+        previous_context = self.previous_context(query, conversation_id)
 
         # Determine strategy based on query and context
-        if self.is_new_query(query, previous_context):
-            response = self.query_datastores(query)
-        elif self.can_use_previous_context(query, previous_context):
-            response = self.use_previous_context(query, previous_context)
-        else:
-            response = self.combine_context_and_query(query, previous_context)
+        with metrics.timer('query'):
+            if self.is_new_query(query, previous_context):
+                response = self.query_datastores(query)
+            else:
+                response = self.answer_from_previous_context(query, previous_context)
         
-        # Store response in session for future context
-        if 'history' not in session:
-            session['history'] = []
-        session['history'].append(response)
+        self._store_history(conversation_id, query, response)
 
         return response
 
-    def is_new_query(self, query: str, context: list) -> bool:
-        return not any(entity in query for entity in context)
+    def stream_knowledge_base(self, query: str, conversation_id: Optional[str] = None,
+                              cancel_event: Optional[threading.Event] = None) -> Tuple[List[Dict], Iterator[str]]:
+        logging.info(f"Streaming knowledge base query: {query}")
 
-    def can_use_previous_context(self, query: str, context: list) -> bool:
-        return any(entity in query for entity in context)
+        conversation_id = self.conversation_id(conversation_id)
+        previous_context = self.previous_context(query, conversation_id)
 
-    def combine_context_and_query(self, query: str, context: list) -> str:
+        # Retrieval finishes before the first chunk so sources are known up front
+        on_complete = None
+        if not self.is_new_query(query, previous_context):
+            sources = []
+            chunks = iter([self.answer_from_previous_context(query, previous_context)])
+        elif cached := self.lookup_cached_answer(query):
+            sources = cached['sources']
+            chunks = iter([cached['answer']])
+        else:
+            retrieved = self.retrieve(query, cancel_event)
+            # The branches may all have finished after the cancel, so retrieval does not always notice it
+            raise_if_cancelled(cancel_event, query)
+            sources = retrieved['sources']
+            chunks = self.stream_llm_response(
+                query,
+                retrieved['response'],
+                retrieved['graph_results'],
+                retrieved['vector_results'],
+                retrieved['case_details'],
+            )
+            on_complete = lambda response: self.cache_answer(query, response, sources)
+
+        return sources, self._stream_and_store_history(chunks, conversation_id, query, on_complete, cancel_event)
+
+    def _stream_and_store_history(self, chunks: Iterator[str], conversation_id: Optional[str], query: str,
+                                  on_complete=None, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        response = []
+        # The LLM call starts with the first chunk, so a query cancelled before then never reaches it;
+        # a chunk that arrives after a cancel is dropped
+        raise_if_cancelled(cancel_event, query, chunks)
+        for chunk in chunks:
+            raise_if_cancelled(cancel_event, query, chunks)
+            response.append(chunk)
+            yield chunk
+        response = "".join(response)
+        if on_complete is not None:
+            on_complete(response)
+        self._store_history(conversation_id, query, response)
+
+    def conversation_id(self, conversation_id: Optional[str] = None) -> Optional[str]:
+        # Only the conversation id lives in the session cookie; the turns are kept server-side
+        if conversation_id is None and has_request_context():
+            session.pop('history', None)
+            conversation_id = session.get('conversation_id')
+            if conversation_id is None:
+                conversation_id = session['conversation_id'] = ConversationStore.new_conversation_id()
+        return conversation_id
+
+    def previous_context(self, query: str, conversation_id: Optional[str]) -> Dict:
+        if conversation_id is None:
+            return {'turns': [], 'summary': ""}
+        return {
+            'turns': self.conversation_store.relevant_turns(conversation_id, query, min_score=self.history_match_score),
+            'summary': self.conversation_store.summary(conversation_id),
+        }
+
+    def _store_history(self, conversation_id: Optional[str], query: str, response: str):
+        if conversation_id is not None:
+            self.conversation_store.add_turn(conversation_id, query, response)
+
+    def _summarize_turn(self, summary: str, turn: Dict) -> str:
+        prompt = (
+            "Update the running summary of a legal research conversation with the exchange below. "
+            "Keep case names, parties, judges and courts; answer with the summary only.\n\n"
+            f"Current summary: {summary}\n\nQuestion: {turn['query']}\nAnswer: {turn['response']}"
+        )
+        return self.llm.complete(prompt).text
+
+    def _format_previous_context(self, context: Dict) -> str:
+        formatted = [f"Earlier summary: {context['summary']}"] if context['summary'] else []
+        for turn in context['turns']:
+            formatted.append(f"Question: {turn['query']}\nAnswer: {turn['response']}")
+        return "\n\n".join(formatted)
+
+    def answer_from_previous_context(self, query: str, previous_context: Dict) -> str:
+        if self.can_use_previous_context(query, previous_context):
+            return self.use_previous_context(query, previous_context)
+        return self.combine_context_and_query(query, previous_context)
+
+    def is_new_query(self, query: str, context: Dict) -> bool:
+        return not context['turns']
+
+    def can_use_previous_context(self, query: str, context: Dict) -> bool:
+        # Only a repeat of an earlier question skips retrieval; a short follow-up whose words
+        # appear in an earlier answer still needs fresh documents
+        return any(turn['query_score'] >= self.history_reuse_score for turn in context['turns'])
+
+    def combine_context_and_query(self, query: str, context: Dict) -> str:
         datastore_response = self.query_datastores(query)
-        combined_response = self.llm.complete(f"{datastore_response} with additional insights from previous interactions.").text
+        combined_response = self.llm.complete(
+            f"{datastore_response}\n\nRefine the answer above to the question \"{query}\" with additional insights from previous interactions:\n\n"
+            f"{self._format_previous_context(context)}"
+        ).text
         return combined_response
 
-    def use_previous_context(self, query: str, context: list) -> str:
-        relevant_context = [c for c in context if c in query]
-        llm_output = self.llm.complete(relevant_context).text
+    def use_previous_context(self, query: str, context: Dict) -> str:
+        relevant_context = self._format_previous_context(context)
+        llm_output = self.llm.complete(
+            f"Using only the earlier conversation below, answer the follow-up question.\n\n{relevant_context}\n\nFollow-up question: {query}"
+        ).text
         return llm_output
 
-    def query_datastores(self, query: str) -> str:
+    def _build_router_query_engine(self):
         # Create query engines
         graph_query_engine = self.graph_index.as_query_engine()
         vector_query_engine = self.vector_index.as_query_engine()
@@ -308,24 +1006,124 @@ class IntegratedKnowledgeBaseQuery:
             summary_template=PromptTemplate(TREE_SUMMARIZE_PROMPT_TMPL)
         )
 
+        # The local router picks the tools from exemplar similarity and graph entities, and
+        # only asks the LLM selector when it is not confident
+        selector = TimedLLMMultiSelector.from_defaults()
+        if self.local_router is not None:
+            selector = LocalRouterSelector(self.local_router, routes=['graph', 'vector'], fallback=selector)
+
         # Create router query engine
-        router_query_engine = RouterQueryEngine(
-            selector=LLMMultiSelector.from_defaults(),
+        return RouterQueryEngine(
+            selector=selector,
             query_engine_tools=[graph_tool, vector_tool],
             summarizer=tree_summarize,
         )
 
-        # Execute query
-        response = router_query_engine.query(query)
+    def query_router(self, query: str) -> str:
+        return str(self.router_query_engine.query(query))
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+    def retrieve(self, query: str, cancel_event: Optional[threading.Event] = None) -> Dict:
+        # Branch name -> (callable, fallback used when the branch fails or times out)
+        branches = {
+            'graph': (self.graph_context, {'graph_results': [], 'case_details': [], 'cases': []}),
+            'vector': (self.search_vectors, []),
+        }
+        if self.synthesis_mode == 'router':
+            branches['router'] = (self.query_router, "")
+
+        started = time.perf_counter()
+        results = {}
+        timings = {}
+        futures = {}
+        for name, (func, fallback) in branches.items():
+            try:
+                futures[name] = self.retrieval_pools[name].submit(self._timed, func, query)
+            except BranchBusy:
+                # Every thread of this branch is still stuck on earlier queries
+                logging.warning(f"{name} retrieval skipped: {self.retrieval_pools[name].max_in_flight} calls still in flight")
+                results[name] = fallback
+                timings[name] = {'seconds': 0.0, 'status': 'rejected'}
+
+        for name, future in futures.items():
+            fallback = branches[name][1]
+            timeout = self.retrieval_timeouts[name]
+            remaining = max(timeout - (time.perf_counter() - started), 0)
+            try:
+                results[name], elapsed = self._wait(future, remaining, cancel_event)
+                timings[name] = {'seconds': elapsed, 'status': 'ok'}
+            except QueryCancelled:
+                for pending in futures.values():
+                    pending.cancel()
+                raise QueryCancelled(query)
+            except FutureTimeoutError:
+                # The worker thread cannot be interrupted; stop waiting and answer without this branch
+                future.cancel()
+                logging.warning(f"{name} retrieval timed out after {timeout:.1f}s")
+                results[name] = fallback
+                timings[name] = {'seconds': time.perf_counter() - started, 'status': 'timeout'}
+            except Exception as e:
+                logging.error(f"Error in {name} retrieval: {str(e)}")
+                results[name] = fallback
+                timings[name] = {'seconds': time.perf_counter() - started, 'status': 'error'}
 
-        graph_results, case_details = self.format_graph_results(query)
-        logging.info(f"Formatted graph results: {graph_results}")
+        for name, timing in timings.items():
+            metrics.inc('kb_retrieval_branches_total', branch=name, status=timing['status'])
+            metrics.observe('kb_stage_seconds', timing['seconds'], stage=f"{name}_branch")
+        metrics.observe('kb_stage_seconds', time.perf_counter() - started, stage='retrieve')
+        logging.info("Retrieval timings: " + ", ".join(
+            f"{name}={t['seconds']:.3f}s ({t['status']})" for name, t in timings.items()
+        ))
 
-        vector_results = self.format_vector_results(query)
-        logging.info(f"Formatted vector results: {vector_results}")
+        graph_context = results['graph']
+        vector_hits = results['vector']
+        return {
+            'response': results.get('router', ""),
+            'graph_results': graph_context['graph_results'],
+            'case_details': graph_context['case_details'],
+            'vector_results': self.vector_snippets(vector_hits),
+            'sources': self.collect_sources(graph_context['cases'], vector_hits),
+            'timings': timings,
+        }
 
-        llm_response = self.generate_llm_response(query, str(response), graph_results, vector_results, case_details)
+    def _wait(self, future, timeout: float, cancel_event: Optional[threading.Event] = None):
+        if cancel_event is None:
+            return future.result(timeout=timeout)
+        # Wake up regularly so a cancelled query stops waiting on its branches
+        deadline = time.perf_counter() + timeout
+        while True:
+            if cancel_event.is_set():
+                raise QueryCancelled()
+            try:
+                return future.result(timeout=max(min(0.1, deadline - time.perf_counter()), 0))
+            except FutureTimeoutError:
+                if time.perf_counter() >= deadline:
+                    raise
+
+    def query_datastores(self, query: str) -> str:
+        cached = self.lookup_cached_answer(query)
+        if cached:
+            return cached['answer']
+
+        # Graph, vector and (in router mode) router retrieval run concurrently
+        retrieved = self.retrieve(query)
+
+        logging.info(f"Formatted graph results: {retrieved['graph_results']}")
+        logging.info(f"Formatted vector results: {retrieved['vector_results']}")
+
+        llm_response = self.generate_llm_response(
+            query,
+            retrieved['response'],
+            retrieved['graph_results'],
+            retrieved['vector_results'],
+            retrieved['case_details'],
+        )
         
         logging.info(f"LLM response: {llm_response}")
 
+        self.cache_answer(query, str(llm_response), retrieved['sources'])
         return str(llm_response)
@@ -0,0 +1,492 @@
+# app/knowledge_base/local_index.py
+#
+# In-process mirror of law_docs for dense search without a round trip to Qdrant.
+#
+#   python -m app.knowledge_base.local_index build --path .law_docs_index --dtype int8
+#   python -m app.knowledge_base.local_index sync --path .law_docs_index
+#
+# Vectors live in memory-mapped .npy files (float32, or int8 with a scale per vector),
+# grouped by an inverted-file (IVF) index: k-means centroids split the collection into
+# lists, and a query only scores the lists whose centroids are closest to it. The index
+# is built from a scroll over the collection and kept current by syncing the points whose
+# updated_at payload is newer than the last sync; points written or deleted since then are
+# held in a small delta, saved next to the files after every sync, until the next
+# compaction rewrites them.
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient, models
+
+from app.knowledge_base.metrics import metrics
+from app.knowledge_base.vector_search import PAYLOAD_FIELDS, fill_snippets
+
+load_dotenv()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def quantize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Symmetric int8 per vector: v ~= q * scale
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def train_centroids(matrix: np.ndarray, nlist: int, iterations: int = 10, sample_size: int = 50000, seed: int = 7) -> np.ndarray:
+    # Spherical k-means on a sample; the rows are unit vectors so similarity is a dot product
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), size=min(sample_size, len(matrix)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for list_id in range(nlist):
+            members = sample[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def updated_at(point) -> float:
+    return float((point.payload or {}).get('updated_at') or 0)
+
+
+def advance_watermark(points: Iterable, watermark: float, watermark_ids: Iterable[str]) -> Tuple[float, List[str]]:
+    # The newest updated_at seen, and the ids written at exactly that time, which the next sync skips
+    newest = max([watermark] + [updated_at(point) for point in points])
+    if not newest:
+        # Points without updated_at never match the sync filter
+        return newest, []
+    ids = set(watermark_ids) if newest == watermark else set()
+    ids.update(str(point.id) for point in points if updated_at(point) == newest)
+    return newest, sorted(ids)
+
+
+def point_dense_vector(point, vector_name: Optional[str]) -> List[float]:
+    if isinstance(point.vector, dict):
+        return point.vector[vector_name] if vector_name else next(iter(point.vector.values()))
+    return point.vector
+
+
+class LocalVectorIndex:
+    """Memory-mapped IVF index over the dense vectors of a Qdrant collection, with payloads in SQLite.
+
+    A search probes ``probe_fraction`` of the lists, or a fixed ``nprobe``; recall depends on
+    the share of the collection scanned rather than on the number of lists.
+    """
+
+    def __init__(self, path: str, dtype: str = 'float32', nprobe: Optional[int] = None, compact_ratio: float = 0.1,
+                 probe_fraction: float = 0.5):
+        self.path = path
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self.probe_fraction = probe_fraction
+        self.compact_ratio = compact_ratio
+        self.meta: Dict = {}
+        self._state = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, 'payloads.sqlite'), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS payloads (id TEXT PRIMARY KEY, payload TEXT NOT NULL)")
+        self._db.commit()
+        if os.path.exists(self._meta_path()):
+            self._load()
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def __len__(self) -> int:
+        state = self._state
+        return 0 if state is None else int(state['alive'].sum()) + len(state['delta_ids'])
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, 'meta.json')
+
+    def _file(self, name: str, generation: int, extension: str = 'npy') -> str:
+        return os.path.join(self.path, f"{name}-{generation}.{extension}")
+
+    def _load(self):
+        with open(self._meta_path()) as f:
+            self.meta = json.load(f)
+        generation = self.meta['generation']
+        with open(os.path.join(self.path, f"ids-{generation}.json")) as f:
+            ids = json.load(f)
+        self.dtype = self.meta['dtype']
+        vectors = np.load(self._file('vectors', generation), mmap_mode='r')
+        self._state = {
+            'ids': ids,
+            'rows': {str(point_id): row for row, point_id in enumerate(ids)},
+            'vectors': vectors,
+            'scales': np.load(self._file('scales', generation)) if self.dtype == 'int8' else None,
+            'centroids': np.load(self._file('centroids', generation)),
+            'offsets': np.load(self._file('offsets', generation)),
+            'alive': np.ones(len(ids), dtype=bool),
+            'delta_ids': [],
+            'delta': np.zeros((0, self.meta['dim']), dtype=np.float32),
+        }
+        if os.path.exists(self._file('delta', generation, 'npz')):
+            with np.load(self._file('delta', generation, 'npz')) as saved:
+                self._state.update(alive=saved['alive'], delta=saved['delta'], delta_ids=json.loads(str(saved['delta_ids'])))
+        logging.info(f"Loaded local vector index with {len(self)} points ({self.dtype}, "
+                     f"{len(self._state['delta_ids'])} in the delta) from {self.path}")
+
+    def probes(self) -> int:
+        lists = len(self._state['centroids']) if self._state else 0
+        return min(self.nprobe or max(1, int(np.ceil(self.probe_fraction * lists))), lists)
+
+    def search(self, vector: List[float], limit: int) -> List[Tuple[object, float]]:
+        state = self._state
+        if state is None:
+            return []
+        query = normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+
+        centroids = state['centroids']
+        if len(centroids):
+            lists = np.argsort(-(centroids @ query))[:self.probes()]
+            offsets = state['offsets']
+            rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in lists])
+        else:
+            rows = np.arange(len(state['ids']))
+        rows = rows[state['alive'][rows]]
+        vectors = state['vectors'][rows]
+        if state['scales'] is not None:
+            scores = (vectors.astype(np.float32) @ query) * state['scales'][rows]
+        else:
+            scores = vectors @ query
+
+        candidates = [(state['ids'][row], float(score)) for row, score in self._top(rows, scores, limit)]
+        if state['delta_ids']:
+            delta_scores = state['delta'] @ query
+            candidates += [(state['delta_ids'][i], float(score)) for i, score in self._top(np.arange(len(delta_scores)), delta_scores, limit)]
+        candidates.sort(key=lambda candidate: -candidate[1])
+        return candidates[:limit]
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, limit: int):
+        if len(scores) > limit:
+            best = np.argpartition(-scores, limit)[:limit]
+            return zip(rows[best], scores[best])
+        return zip(rows, scores)
+
+    def payloads(self, point_ids: List) -> Dict[str, Dict]:
+        keys = [str(point_id) for point_id in point_ids]
+        with self._lock:
+            found = self._db.execute(
+                f"SELECT id, payload FROM payloads WHERE id IN ({','.join('?' * len(keys))})", keys,
+            ).fetchall()
+        return {point_id: json.loads(payload) for point_id, payload in found}
+
+    def build(self, client: QdrantClient, collection_name: str, vector_name: Optional[str] = None,
+              nlist: Optional[int] = None, batch_size: int = 1000):
+        # Full export: every point is scrolled with its vector and payload and the files are rewritten
+        started = time.perf_counter()
+        ids, vectors, watermark, watermark_ids = [], [], 0.0, []
+        with self._lock:
+            self._db.execute("DELETE FROM payloads")
+        for points in self._scroll(client, collection_name, batch_size, with_vectors=True):
+            ids += [point.id for point in points]
+            vectors += [point_dense_vector(point, vector_name) for point in points]
+            watermark, watermark_ids = advance_watermark(points, watermark, watermark_ids)
+            fill_snippets(client, collection_name, points)
+            self._store_payloads(points)
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._write(ids, matrix, nlist, watermark, watermark_ids, collection_name, vector_name)
+        logging.info(f"Built local vector index of {len(ids)} points in {time.perf_counter() - started:.1f}s")
+
+    def sync(self, client: QdrantClient, collection_name: str, vector_name: Optional[str] = None,
+             batch_size: int = 1000) -> Dict:
+        if self._state is None:
+            self.build(client, collection_name, vector_name, batch_size=batch_size)
+            return {'upserted': len(self), 'deleted': 0}
+
+        # Points written since the last sync, by their updated_at payload. Writes sharing the
+        # watermark's timestamp may land after a sync, so it is inclusive, minus the ids already seen at it
+        watermark = self.meta.get('watermark', 0.0)
+        seen = set(self.meta.get('watermark_ids', []))
+        changed = []
+        scroll_filter = models.Filter(must=[models.FieldCondition(key='updated_at', range=models.Range(gte=watermark))])
+        for points in self._scroll(client, collection_name, batch_size, with_vectors=True, scroll_filter=scroll_filter):
+            changed += [point for point in points if not (str(point.id) in seen and updated_at(point) == watermark)]
+        new_watermark, new_watermark_ids = advance_watermark(changed, watermark, seen)
+
+        # Deletions, and points written without updated_at, only show up as a count mismatch
+        local_ids = self._live_ids() | {str(point.id) for point in changed}
+        deleted = []
+        metrics.inc('kb_qdrant_requests_total', operation='count')
+        if client.count(collection_name=collection_name, exact=True).count != len(local_ids):
+            remote_ids = {}
+            for points in self._scroll(client, collection_name, batch_size, with_vectors=False, with_payload=False):
+                remote_ids.update({str(point.id): point.id for point in points})
+            deleted = [point_id for point_id in local_ids if point_id not in remote_ids]
+            missing = [remote_ids[point_id] for point_id in remote_ids if point_id not in local_ids]
+            for start in range(0, len(missing), batch_size):
+                metrics.inc('kb_qdrant_requests_total', operation='retrieve')
+                changed += client.retrieve(collection_name=collection_name, ids=missing[start:start + batch_size],
+                                           with_vectors=True, with_payload=PAYLOAD_FIELDS + ['updated_at'])
+
+        if changed or deleted:
+            fill_snippets(client, collection_name, changed)
+            self._store_payloads(changed)
+            self._apply(changed, deleted, vector_name)
+        self.meta.update(watermark=new_watermark, watermark_ids=new_watermark_ids)
+        if len(self._state['delta_ids']) > self.compact_ratio * max(len(self._state['ids']), 1):
+            self.compact()
+        elif changed or deleted:
+            self._save_delta()
+        return {'upserted': len(changed), 'deleted': len(deleted)}
+
+    def compact(self):
+        # Folds the delta into rewritten files and retrains the lists
+        state = self._state
+        if state is None:
+            return
+        rows = np.flatnonzero(state['alive'])
+        main = np.asarray(state['vectors'][rows], dtype=np.float32)
+        if state['scales'] is not None:
+            main = main * state['scales'][rows][:, None]
+        matrix = np.vstack([main, state['delta']]) if len(state['delta']) else main
+        ids = [state['ids'][row] for row in rows] + state['delta_ids']
+        self._write(ids, normalize_rows(matrix), None, self.meta.get('watermark', 0.0), self.meta.get('watermark_ids', []),
+                    self.meta.get('collection'), self.meta.get('vector_name'))
+
+    def _apply(self, changed: List, deleted: List[str], vector_name: Optional[str]):
+        # Copy on write, so searches running on the old state are unaffected
+        state = dict(self._state)
+        alive = state['alive'].copy()
+        delta_ids = list(state['delta_ids'])
+        delta = state['delta']
+        replaced = {str(point.id) for point in changed} | set(deleted)
+        for point_id in replaced:
+            row = state['rows'].get(point_id)
+            if row is not None:
+                alive[row] = False
+        keep = [i for i, point_id in enumerate(delta_ids) if str(point_id) not in replaced]
+        delta_ids = [delta_ids[i] for i in keep] + [point.id for point in changed]
+        new_vectors = [point_dense_vector(point, vector_name) for point in changed]
+        delta = delta[keep]
+        if new_vectors:
+            new_vectors = normalize_rows(np.asarray(new_vectors, dtype=np.float32))
+            delta = np.vstack([delta, new_vectors]) if len(delta) else new_vectors
+        state.update(alive=alive, delta_ids=delta_ids, delta=delta)
+        self._state = state
+        if deleted:
+            with self._lock:
+                self._db.executemany("DELETE FROM payloads WHERE id = ?", [(point_id,) for point_id in deleted])
+                self._db.commit()
+
+    def _save_delta(self):
+        # Without it a restart would serve deleted points and lose the changes synced since the last compaction
+        state = self._state
+        generation = self.meta['generation']
+        tmp_path = self._file('delta', generation, 'tmp.npz')
+        np.savez(tmp_path, alive=state['alive'], delta=state['delta'], delta_ids=np.array(json.dumps(state['delta_ids'])))
+        os.replace(tmp_path, self._file('delta', generation, 'npz'))
+        self._write_meta(self.meta)
+
+    def _write_meta(self, meta: Dict):
+        with open(self._meta_path() + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(self._meta_path() + '.tmp', self._meta_path())
+
+    def _write(self, ids: List, matrix: np.ndarray, nlist: Optional[int], watermark: float, watermark_ids: List[str],
+               collection_name: Optional[str], vector_name: Optional[str]):
+        generation = self.meta.get('generation', 0) + 1
+        dim = matrix.shape[1] if matrix.size else self.meta.get('dim', 0)
+        if nlist is None:
+            # About sqrt(n) lists; small collections are searched exhaustively
+            nlist = int(np.sqrt(len(ids))) if len(ids) >= 1000 else 0
+        if nlist:
+            centroids = train_centroids(matrix, nlist)
+            assignments = np.concatenate([
+                np.argmax(matrix[start:start + 65536] @ centroids.T, axis=1)
+                for start in range(0, len(matrix), 65536)
+            ])
+        else:
+            centroids = np.zeros((0, dim), dtype=np.float32)
+            assignments = np.zeros(len(ids), dtype=np.int64)
+        # Rows are stored list by list so each probed list is one contiguous slice
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=max(nlist, 1)))]).astype(np.int64)
+
+        stored = np.lib.format.open_memmap(self._file('vectors', generation), mode='w+',
+                                           dtype=np.int8 if self.dtype == 'int8' else np.float32, shape=(len(ids), dim))
+        if self.dtype == 'int8':
+            quantized, scales = quantize(matrix[order]) if len(ids) else (np.zeros((0, dim), np.int8), np.zeros(0, np.float32))
+            stored[:] = quantized
+            np.save(self._file('scales', generation), scales)
+        elif len(ids):
+            stored[:] = matrix[order]
+        stored.flush()
+        del stored
+        np.save(self._file('centroids', generation), centroids)
+        np.save(self._file('offsets', generation), offsets)
+        with open(os.path.join(self.path, f"ids-{generation}.json"), 'w') as f:
+            json.dump([ids[i] for i in order], f)
+
+        previous = self.meta.get('generation')
+        meta = {
+            'generation': generation, 'dtype': self.dtype, 'dim': dim, 'count': len(ids), 'nlist': nlist,
+            'watermark': watermark, 'watermark_ids': watermark_ids, 'collection': collection_name, 'vector_name': vector_name, 'built_at': time.time(),
+        }
+        self._write_meta(meta)
+        self._load()
+        if previous is not None:
+            # Open memory maps keep the old files readable until the last search on them finishes
+            for name in (f"vectors-{previous}.npy", f"scales-{previous}.npy", f"centroids-{previous}.npy",
+                         f"offsets-{previous}.npy", f"ids-{previous}.json", f"delta-{previous}.npz"):
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+
+    def _live_ids(self) -> set:
+        state = self._state
+        return {str(state['ids'][row]) for row in np.flatnonzero(state['alive'])} | {str(point_id) for point_id in state['delta_ids']}
+
+    def _store_payloads(self, points: Iterable):
+        rows = [(str(point.id), json.dumps(point.payload or {})) for point in points]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO payloads (id, payload) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def _scroll(self, client: QdrantClient, collection_name: str, batch_size: int, with_vectors: bool,
+                with_payload=PAYLOAD_FIELDS + ['updated_at'], scroll_filter: Optional[models.Filter] = None):
+        offset = None
+        while True:
+            metrics.inc('kb_qdrant_requests_total', operation='scroll')
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_vectors=with_vectors,
+                with_payload=with_payload,
+            )
+            if points:
+                yield points
+            if offset is None:
+                return
+
+
+class LocalVectorSearch:
+    """Dense search over a LocalVectorIndex with the VectorSearch interface, synced from Qdrant in the background.
+
+    An index that is not built yet is built by the sync thread, and searches go to ``fallback``
+    until it is ready. Without a fallback it is built before the constructor returns.
+    """
+
+    hybrid = False
+
+    def __init__(self, index: LocalVectorIndex, client: QdrantClient, collection_name: str, embed_model,
+                 vector_name: Optional[str] = None, limit: int = 3, sync_interval: float = 60, fallback=None):
+        self.index = index
+        self.client = client
+        self.collection_name = collection_name
+        self.embed_model = embed_model
+        self.vector_name = vector_name
+        self.limit = limit
+        self.sync_interval = sync_interval
+        self.fallback = fallback
+        self._sync_lock = threading.Lock()
+        if index.ready or fallback is None:
+            # Catch up on changes made while the process was down before serving the copy on disk
+            try:
+                self.sync()
+            except Exception as e:
+                if not index.ready:
+                    raise
+                logging.error(f"Error syncing local vector index, serving the copy on disk: {str(e)}")
+        else:
+            logging.info(f"Building the local vector index in the background; searching {collection_name} until it is ready")
+        if sync_interval or not index.ready:
+            threading.Thread(target=self._sync_forever, name='kb-local-index-sync', daemon=True).start()
+        metrics.register_collector(self._metrics)
+
+    def sync(self) -> Dict:
+        with self._sync_lock:
+            with metrics.timer('local_index_sync'):
+                changes = self.index.sync(self.client, self.collection_name, self.vector_name)
+        if changes['upserted'] or changes['deleted']:
+            logging.info(f"Synced local vector index: {changes['upserted']} upserted, {changes['deleted']} deleted")
+        return changes
+
+    def _sync_forever(self):
+        # Builds the index first when there is none yet, retrying until it succeeds
+        while True:
+            if self.index.ready:
+                if not self.sync_interval:
+                    return
+                time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logging.error(f"Error syncing local vector index: {str(e)}")
+                if not self.index.ready:
+                    time.sleep(self.sync_interval or 60)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List:
+        if not self.index.ready and self.fallback is not None:
+            return self.fallback.search(query, limit)
+        with metrics.timer('embedding'):
+            dense_vector = self.embed_model.get_query_embedding(query)
+        return self._search_vector(dense_vector, limit or self.limit)
+
+    def search_batch(self, queries: List[str], dense_vectors: Optional[List] = None, limit: Optional[int] = None) -> List[List]:
+        if not self.index.ready and self.fallback is not None:
+            return self.fallback.search_batch(queries, dense_vectors, limit)
+        if dense_vectors is None:
+            with metrics.timer('embedding'):
+                if hasattr(self.embed_model, 'get_query_embedding_batch'):
+                    dense_vectors = self.embed_model.get_query_embedding_batch(queries)
+                else:
+                    dense_vectors = [self.embed_model.get_query_embedding(query) for query in queries]
+        return [self._search_vector(dense_vector, limit or self.limit) for dense_vector in dense_vectors]
+
+    def _search_vector(self, dense_vector: List[float], limit: int) -> List:
+        with metrics.timer('vector_search'):
+            hits = self.index.search(dense_vector, limit)
+            payloads = self.index.payloads([point_id for point_id, _ in hits])
+        return [
+            models.ScoredPoint(id=point_id, version=0, score=score, payload=payloads.get(str(point_id), {}))
+            for point_id, score in hits
+        ]
+
+    def _metrics(self) -> List[Tuple[str, str, Dict, float]]:
+        return [('kb_local_index_points', 'gauge', {}, len(self.index))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or sync the local mirror of law_docs')
+    parser.add_argument('command', choices=['build', 'sync', 'compact'])
+    parser.add_argument('--path', default=os.getenv('KB_LOCAL_INDEX_PATH', '.law_docs_index'))
+    parser.add_argument('--collection', default='law_docs')
+    parser.add_argument('--dtype', choices=['float32', 'int8'], default=os.getenv('KB_LOCAL_INDEX_DTYPE', 'float32'))
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists; defaults to about sqrt(points)')
+    parser.add_argument('--vector-name', default=None, help='dense vector name for collections with named vectors')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    index = LocalVectorIndex(args.path, dtype=args.dtype)
+    if args.command == 'build':
+        index.dtype = args.dtype
+        index.build(client, args.collection, args.vector_name, nlist=args.nlist)
+    elif args.command == 'sync':
+        logging.info(f"Synced: {index.sync(client, args.collection, args.vector_name)}")
+    else:
+        index.compact()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# app/knowledge_base/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'kb_stage_seconds': 'Time spent in each stage of the query pipeline',
+    'kb_llm_calls_total': 'LLM completions, including router and summarizer calls',
+    'kb_llm_tokens_total': 'LLM tokens, by kind',
+    'kb_neo4j_queries_total': 'Cypher queries sent to Neo4j, by query',
+    'kb_qdrant_requests_total': 'Requests sent to Qdrant, by operation',
+    'kb_retrieval_branches_total': 'Retrieval branch outcomes',
+    'kb_retrieval_in_flight': 'Retrieval calls running per branch, including ones no query is waiting for any more',
+    'kb_context_tokens_total': 'Retrieved-context tokens placed in final prompts, by section',
+    'kb_context_items_dropped_total': 'Retrieved-context items left out of final prompts by the token budget, by section',
+    'kb_queries_in_flight': 'Queries running or waiting for a worker',
+    'kb_queries_capacity': 'Queries that may be in flight before new ones are rejected',
+    'kb_queries_rejected_total': 'Queries rejected by backpressure, by reason',
+    'kb_queries_cancelled_total': 'Queries cancelled by their client',
+    'kb_bulk_queries_total': 'Queries answered in bulk, by outcome',
+    'kb_router_decisions_total': 'Router tool selections, by decision source and chosen tools',
+    'kb_local_index_points': 'Points in the local vector index',
+    'kb_gazetteer_entities': 'Graph entities known to the entity gazetteer',
+    'kb_cache_hits_total': 'Cache hits, by cache',
+    'kb_cache_misses_total': 'Cache misses, by cache',
+    'kb_cache_hit_ratio': 'Cache hit ratio since startup, by cache',
+    'kb_cache_entries': 'Entries currently held, by cache',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Process-wide counters and latency histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Dict]] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, str, Dict, float]]]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('kb_stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, str, Dict, float]]]):
+        # A collector returns (name, type, labels, value) samples computed at scrape time
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        # Copies of the recorded series, keyed by name and then by sorted (label, value) pairs
+        with self._lock:
+            return {
+                'counters': {name: dict(series) for name, series in self._counters.items()},
+                'histograms': {
+                    name: {key: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']} for key, h in series.items()}
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        counters, histograms = snapshot['counters'], snapshot['histograms']
+        with self._lock:
+            collectors = list(self._collectors)
+
+        collected: Dict[str, Tuple[str, Dict[Labels, float]]] = {}
+        for collector in collectors:
+            for name, metric_type, labels, value in collector():
+                collected.setdefault(name, (metric_type, {}))[1][_labels(labels)] = value
+
+        lines = []
+        for name in sorted(counters):
+            lines += self._header(name, 'counter')
+            lines += [f"{name}{_format_labels(key)} {value}" for key, value in sorted(counters[name].items())]
+        for name in sorted(histograms):
+            lines += self._header(name, 'histogram')
+            for key, histogram in sorted(histograms[name].items()):
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        for name in sorted(collected):
+            metric_type, series = collected[name]
+            lines += self._header(name, metric_type)
+            lines += [f"{name}{_format_labels(key)} {value}" for key, value in sorted(series.items())]
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name: str, metric_type: str) -> List[str]:
+        return [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} {metric_type}"]
+
+
+metrics = Metrics()
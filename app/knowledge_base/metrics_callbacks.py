@@ -0,0 +1,56 @@
+# app/knowledge_base/metrics_callbacks.py
+#
+# Kept apart from metrics.py so the routes can import the registry without loading llama-index.
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from llama_index.core.callbacks import CBEventType
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+from app.knowledge_base.metrics import Metrics, metrics
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records llama-index LLM, retrieval and synthesis events into ``metrics``."""
+
+    STAGES = {
+        CBEventType.LLM: 'llm',
+        CBEventType.RETRIEVE: 'router_retrieve',
+        CBEventType.SYNTHESIZE: 'router_synthesize',
+    }
+
+    def __init__(self, registry: Metrics = metrics):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.registry = registry
+        self.token_counter = TokenCounter()
+        self._starts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs) -> str:
+        if event_type in self.STAGES:
+            with self._lock:
+                self._starts[event_id] = time.perf_counter()
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs) -> None:
+        if event_type not in self.STAGES:
+            return
+        with self._lock:
+            start = self._starts.pop(event_id, None)
+        if start is not None:
+            self.registry.observe('kb_stage_seconds', time.perf_counter() - start, stage=self.STAGES[event_type])
+        if event_type == CBEventType.LLM and payload:
+            self.registry.inc('kb_llm_calls_total')
+            counts = get_llm_token_counts(self.token_counter, payload, event_id)
+            self.registry.inc('kb_llm_tokens_total', counts.prompt_token_count, kind='prompt')
+            self.registry.inc('kb_llm_tokens_total', counts.completion_token_count, kind='completion')
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
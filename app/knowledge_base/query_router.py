@@ -0,0 +1,221 @@
+# app/knowledge_base/query_router.py
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.base.base_selector import BaseSelector, SelectorResult, SingleSelection
+
+from app.knowledge_base.metrics import metrics
+
+# Labelled example queries for each router tool, or for a '+'-joined set of tools; a query
+# is routed to the tools of the examples it is most similar to
+ROUTE_EXEMPLARS = {
+    'graph': [
+        "Which judges presided over cases involving this company?",
+        "Who represented the plaintiff in this case?",
+        "Which attorneys appeared before Judge Smith?",
+        "List the cases decided by the Court of Appeals",
+        "What cases involve both of these parties?",
+        "Which court heard this case?",
+        "Cases involving Judge Miller",
+        "Who were the parties in this lawsuit?",
+        "Which law firms has this attorney worked against?",
+        "What other cases cite this case?",
+        "Which judges sit on the same court as Judge Brown?",
+        "How are these two companies connected through litigation?",
+        "Show all cases where this party was the defendant",
+        "Who authored the opinion in this case?",
+    ],
+    'vector': [
+        "Explain the doctrine of promissory estoppel",
+        "Summarize the court's reasoning on qualified immunity",
+        "What is the legal standard for summary judgment?",
+        "What precedents govern breach of fiduciary duty?",
+        "Explain the holding on Fourth Amendment searches of vehicles",
+        "What arguments were made about contract interpretation?",
+        "Summarize opinions about employment discrimination",
+        "How have courts interpreted the statute of limitations for fraud?",
+        "What did the opinion say about damages for emotional distress?",
+        "Describe the test for personal jurisdiction over a foreign corporation",
+        "What are the elements of negligence under state law?",
+        "Explain the bankruptcy precedents on preferential transfers",
+        "What reasoning did the court give for dismissing the appeal?",
+        "Summarize the dissent's view on administrative deference",
+    ],
+    'graph+vector': [
+        "Summarize the opinions Judge Smith wrote about securities fraud",
+        "How has the Ninth Circuit ruled on qualified immunity and which judges wrote those opinions?",
+        "What arguments did this attorney make in the patent cases they argued?",
+        "Explain how Judge Garcia has applied the fair use doctrine",
+        "What did the court decide in Smith v. Jones and who were the parties?",
+        "Compare the reasoning of the cases this company lost on antitrust claims",
+        "Which cases did Judge Lee decide on employment discrimination and what was the reasoning?",
+    ],
+}
+
+
+def load_exemplars(path: Optional[str]) -> Dict[str, List[str]]:
+    if not path:
+        return ROUTE_EXEMPLARS
+    with open(path) as f:
+        return json.load(f)
+
+
+class LocalQueryRouter:
+    """Routes a query to the graph and/or vector tools without an LLM call.
+
+    Each route scores the mean cosine similarity between the query and its ``top_k``
+    closest exemplars; routes using the graph also gain ``entity_weight`` per known entity
+    in the query (up to two). The tools of every route within ``margin`` of the best are
+    chosen, and a best score under ``threshold`` marks the decision as low confidence.
+
+    Cosine scores are on a different scale for every embedding model, so without an explicit
+    ``threshold`` it is calibrated from the exemplars themselves: each is routed against the
+    others, and the threshold is the ``calibration_quantile`` of the scores of those routed
+    to their own route.
+    """
+
+    def __init__(self, embed_model, exemplars: Optional[Dict[str, List[str]]] = None,
+                 entity_extractor: Optional[Callable[[str], List[str]]] = None, threshold: Optional[float] = None,
+                 margin: float = 0.02, entity_weight: float = 0.03, top_k: int = 3, log_path: Optional[str] = None,
+                 calibration_quantile: float = 0.25):
+        self.embed_model = embed_model
+        self.exemplars = exemplars or ROUTE_EXEMPLARS
+        self.entity_extractor = entity_extractor
+        self.threshold = threshold
+        self.margin = margin
+        self.entity_weight = entity_weight
+        self.top_k = top_k
+        self.log_path = log_path
+        self.routes = list(self.exemplars)
+        self._matrices = self._embed_exemplars()
+        self._log_lock = threading.Lock()
+        if self.threshold is None:
+            self.threshold = self.calibrate(calibration_quantile)
+            logging.info(f"Calibrated the local router threshold to {self.threshold:.3f}")
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        embed_batch = getattr(self.embed_model, 'get_query_embedding_batch', None)
+        embeddings = embed_batch(texts) if embed_batch else [self.embed_model.get_query_embedding(text) for text in texts]
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _embed_exemplars(self) -> Dict[str, np.ndarray]:
+        start = time.perf_counter()
+        matrices = {route: self._embed(texts) for route, texts in self.exemplars.items()}
+        logging.info(f"Embedded {sum(len(texts) for texts in self.exemplars.values())} router exemplars "
+                     f"in {time.perf_counter() - start:.2f}s")
+        return matrices
+
+    def _scores(self, vector: np.ndarray, exclude: Optional[Tuple[str, int]] = None) -> Dict[str, float]:
+        scores = {}
+        for route, matrix in self._matrices.items():
+            similarities = matrix @ vector
+            if exclude and exclude[0] == route:
+                similarities = np.delete(similarities, exclude[1])
+            similarities = np.sort(similarities)[::-1][:self.top_k]
+            scores[route] = float(similarities.mean()) if len(similarities) else 0.0
+        return scores
+
+    def calibrate(self, quantile: float) -> float:
+        confidences = []
+        for route, matrix in self._matrices.items():
+            for index, vector in enumerate(matrix):
+                scores = self._scores(vector, exclude=(route, index))
+                if max(scores, key=scores.get) == route:
+                    confidences.append(scores[route])
+        return float(np.quantile(confidences, quantile)) if confidences else 0.0
+
+    def route(self, query: str) -> Dict:
+        with metrics.timer('local_router'):
+            vector = self._embed([query])[0]
+            scores = self._scores(vector)
+            entities = list(dict.fromkeys(self.entity_extractor(query))) if self.entity_extractor else []
+            for route in scores:
+                if entities and 'graph' in route.split('+'):
+                    scores[route] += self.entity_weight * min(len(entities), 2)
+
+        confidence = max(scores.values(), default=0.0)
+        chosen = [route for route in self.routes if scores[route] >= confidence - self.margin]
+        tools = list(dict.fromkeys(tool for route in chosen for tool in route.split('+')))
+        return {
+            'query': query,
+            'tools': tools,
+            'scores': {route: round(score, 4) for route, score in scores.items()},
+            'confidence': round(confidence, 4),
+            'confident': confidence >= self.threshold,
+            'entities': entities,
+        }
+
+    def log_decision(self, decision: Dict, source: str, tools: Sequence[str], seconds: float):
+        # One line per decision, so routing accuracy can be scored against labelled queries later
+        metrics.inc('kb_router_decisions_total', source=source, tools='+'.join(tools) or 'none')
+        record = {
+            'ts': time.time(),
+            'query': decision['query'],
+            'source': source,
+            'tools': list(tools),
+            'local_tools': decision['tools'],
+            'scores': decision['scores'],
+            'confidence': decision['confidence'],
+            'entities': decision['entities'],
+            'seconds': round(seconds, 4),
+        }
+        logging.info(f"Router decision ({source}, {seconds * 1000:.1f} ms): {'+'.join(tools)} "
+                     f"scores={decision['scores']} entities={decision['entities']}")
+        if not self.log_path:
+            return
+        try:
+            with self._log_lock, open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logging.error(f"Error writing router decision log: {str(e)}")
+
+
+class LocalRouterSelector(BaseSelector):
+    """Selector for RouterQueryEngine that uses LocalQueryRouter, asking ``fallback`` only
+    when the local decision is low confidence. ``routes`` names the tools in order."""
+
+    def __init__(self, router: LocalQueryRouter, routes: List[str], fallback: Optional[BaseSelector] = None):
+        self.router = router
+        self.routes = routes
+        self.fallback = fallback
+
+    def _get_prompts(self) -> Dict:
+        return {}
+
+    def _update_prompts(self, prompts) -> None:
+        pass
+
+    def _local_result(self, decision: Dict) -> SelectorResult:
+        reason = f"local router, confidence {decision['confidence']:.3f}"
+        return SelectorResult(selections=[
+            SingleSelection(index=self.routes.index(tool), reason=reason)
+            for tool in decision['tools'] if tool in self.routes
+        ])
+
+    def _tools(self, result: SelectorResult) -> List[str]:
+        return [self.routes[selection.index] for selection in result.selections if selection.index < len(self.routes)]
+
+    def _select(self, choices, query) -> SelectorResult:
+        start = time.perf_counter()
+        decision = self.router.route(query.query_str)
+        result, source = self._local_result(decision), 'local'
+        if (not decision['confident'] or not result.selections) and self.fallback is not None:
+            result, source = self.fallback._select(choices, query), 'llm'
+        self.router.log_decision(decision, source, self._tools(result), time.perf_counter() - start)
+        return result
+
+    async def _aselect(self, choices, query) -> SelectorResult:
+        start = time.perf_counter()
+        decision = self.router.route(query.query_str)
+        result, source = self._local_result(decision), 'local'
+        if (not decision['confident'] or not result.selections) and self.fallback is not None:
+            result, source = await self.fallback._aselect(choices, query), 'llm'
+        self.router.log_decision(decision, source, self._tools(result), time.perf_counter() - start)
+        return result
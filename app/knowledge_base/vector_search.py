@@ -0,0 +1,271 @@
+# app/knowledge_base/vector_search.py
+
+import json
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from llama_index.vector_stores.qdrant.base import DEFAULT_DENSE_VECTOR_NAME, DEFAULT_SPARSE_VECTOR_NAME
+from qdrant_client import QdrantClient, models
+
+from app.knowledge_base.metrics import metrics
+
+# Characters of each chunk stored as its snippet; only the snippet goes into prompts
+SNIPPET_CHARS = 300
+QUANTIZATION_KINDS = ('none', 'scalar', 'binary')
+# Payload fields read at query time; _node_content holds the whole chunk and is left on the server
+PAYLOAD_FIELDS = ['snippet', 'case_id', 'case_name', 'file_name', 'doc_id']
+
+
+class SparseEncoder:
+    """FastEmbed sparse model (BM25, BM42 or SPLADE) producing Qdrant sparse vectors."""
+
+    def __init__(self, model_name: str = "Qdrant/bm25", batch_size: int = 256, parallel: Optional[int] = None):
+        from fastembed import SparseTextEmbedding
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self._model = SparseTextEmbedding(model_name=model_name)
+
+    @property
+    def requires_idf(self) -> bool:
+        # BM25-style models only emit term frequencies; Qdrant applies IDF at query time
+        config = QdrantClient.list_sparse_models().get(self.model_name) or {}
+        return bool(config.get('requires_idf'))
+
+    def encode_documents(self, texts: List[str]) -> List[models.SparseVector]:
+        return list(self.encode_document_stream(texts))
+
+    def encode_document_stream(self, texts: Iterable[str]) -> Iterator[models.SparseVector]:
+        # One call per ingestion run keeps a single pool of worker processes
+        for e in self._model.embed(texts, batch_size=self.batch_size, parallel=self.parallel):
+            yield models.SparseVector(indices=e.indices.tolist(), values=e.values.tolist())
+
+    def encode_queries(self, queries: List[str]) -> List[models.SparseVector]:
+        return [models.SparseVector(indices=e.indices.tolist(), values=e.values.tolist()) for e in self._model.query_embed(queries)]
+
+
+def quantization_config(kind: Optional[str]):
+    # Quantized vectors are kept in RAM; searches rescore the oversampled candidates with the originals
+    kind = (kind or 'none').strip().lower()
+    if kind == 'scalar':
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True,
+        ))
+    if kind == 'binary':
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if kind == 'none':
+        return None
+    raise ValueError(f"Unknown quantization '{kind}'; expected one of {', '.join(QUANTIZATION_KINDS)}")
+
+
+def quantization_kind(config) -> str:
+    if isinstance(config, models.ScalarQuantization):
+        return 'scalar'
+    if isinstance(config, models.BinaryQuantization):
+        return 'binary'
+    if isinstance(config, models.ProductQuantization):
+        return 'product'
+    return 'none'
+
+
+def collection_config(vector_size: int, sparse_encoder=None, quantization: Optional[str] = None) -> Dict:
+    # create_collection arguments for law_docs; named vectors match QdrantVectorStore's hybrid layout
+    quantization = quantization_config(quantization)
+    # With quantization the float32 originals are only read for rescoring, so they live on disk
+    dense_config = models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=quantization is not None or None)
+    config = {'quantization_config': quantization} if quantization is not None else {}
+    if sparse_encoder is None:
+        return {'vectors_config': dense_config, **config}
+    return {
+        'vectors_config': {DEFAULT_DENSE_VECTOR_NAME: dense_config},
+        'sparse_vectors_config': {
+            DEFAULT_SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                modifier=models.Modifier.IDF if sparse_encoder.requires_idf else None,
+            ),
+        },
+        **config,
+    }
+
+
+def dense_vector_name(params) -> Optional[str]:
+    # None is Qdrant's unnamed default vector
+    if isinstance(params.vectors, dict) and params.vectors:
+        return DEFAULT_DENSE_VECTOR_NAME if DEFAULT_DENSE_VECTOR_NAME in params.vectors else next(iter(params.vectors)) or None
+    return None
+
+
+def ensure_quantization(client: QdrantClient, collection_name: str, kind: str) -> bool:
+    # Switches an existing collection's quantization; Qdrant rebuilds the quantized vectors in the background
+    config = quantization_config(kind)
+    metrics.inc('kb_qdrant_requests_total', operation='get_collection')
+    current = client.get_collection(collection_name=collection_name).config
+    if quantization_kind(current.quantization_config) == quantization_kind(config):
+        return False
+    metrics.inc('kb_qdrant_requests_total', operation='update_collection')
+    client.update_collection(
+        collection_name=collection_name,
+        quantization_config=config if config is not None else models.Disabled.DISABLED,
+        vectors_config={dense_vector_name(current.params) or '': models.VectorParamsDiff(on_disk=config is not None)},
+    )
+    logging.info(f"Set {collection_name} quantization to {quantization_kind(config)}")
+    return True
+
+
+def point_vector(dense_vector: List[float], sparse_vector: Optional[models.SparseVector] = None):
+    if sparse_vector is None:
+        return dense_vector
+    return {DEFAULT_DENSE_VECTOR_NAME: dense_vector, DEFAULT_SPARSE_VECTOR_NAME: sparse_vector}
+
+
+def snippet(text: str) -> str:
+    return (text or '')[:SNIPPET_CHARS]
+
+
+def fill_snippets(client: QdrantClient, collection_name: str, points: List):
+    # Points ingested before snippets existed only carry the text inside _node_content;
+    # backfill_snippets() writes their snippets once so searches stop paying for this
+    legacy = {}
+    for point in points:
+        if point.payload is not None and 'snippet' not in point.payload:
+            legacy.setdefault(point.id, []).append(point)
+    if not legacy:
+        return
+    metrics.inc('kb_qdrant_requests_total', operation='retrieve')
+    for record in client.retrieve(collection_name=collection_name, ids=list(legacy), with_payload=['_node_content']):
+        node_content = (record.payload or {}).get('_node_content')
+        text = json.loads(node_content).get('text', '') if node_content else ''
+        for point in legacy[record.id]:
+            point.payload['snippet'] = snippet(text)
+    for point in (point for same_id in legacy.values() for point in same_id):
+        point.payload.setdefault('snippet', '')
+
+
+def backfill_snippets(client: QdrantClient, collection_name: str, batch_size: int = 256) -> int:
+    # One pass over the points without a snippet, writing each one's snippet next to its _node_content
+    missing = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key='snippet'))])
+    filled, offset = 0, None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, scroll_filter=missing, limit=batch_size,
+                                       offset=offset, with_payload=['_node_content'], with_vectors=False)
+        if points:
+            operations = []
+            for point in points:
+                node_content = (point.payload or {}).get('_node_content')
+                text = json.loads(node_content).get('text', '') if node_content else ''
+                operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={'snippet': snippet(text)}, points=[point.id],
+                )))
+            client.batch_update_points(collection_name=collection_name, update_operations=operations, wait=True)
+            filled += len(points)
+            logging.info(f"Backfilled snippets of {filled} {collection_name} points")
+        if offset is None:
+            return filled
+
+
+class VectorSearch:
+    """Top-k search over a Qdrant collection, dense-only or hybrid.
+
+    In hybrid mode the dense and sparse candidates are fetched as prefetches of a single
+    ``query_points`` request and fused server-side with reciprocal-rank fusion. On a quantized
+    collection the dense search fetches ``oversampling`` times the candidates from the quantized
+    vectors and, with ``rescore``, reorders them by the original vectors.
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, embed_model, sparse_encoder=None,
+                 limit: int = 3, prefetch_limit: int = 20, oversampling: float = 2.0, rescore: bool = True):
+        self.client = client
+        self.collection_name = collection_name
+        self.embed_model = embed_model
+        self.sparse_encoder = sparse_encoder
+        self.limit = limit
+        self.prefetch_limit = prefetch_limit
+        self.oversampling = oversampling
+        self.rescore = rescore
+        self.dense_vector_name, self.sparse_vector_name, self.quantization = self._detect_layout()
+        self.hybrid = sparse_encoder is not None and self.sparse_vector_name is not None
+        if sparse_encoder is not None and not self.hybrid:
+            logging.warning(f"{collection_name} has no sparse vectors; using dense-only search")
+
+    def _detect_layout(self):
+        try:
+            metrics.inc('kb_qdrant_requests_total', operation='get_collection')
+            config = self.client.get_collection(collection_name=self.collection_name).config
+            params = config.params
+        except Exception as e:
+            logging.warning(f"Could not read the vector layout of {self.collection_name}: {e}")
+            return None, None, 'none'
+
+        dense_name = dense_vector_name(params)
+        dense_config = params.vectors.get(dense_name or '') if isinstance(params.vectors, dict) else params.vectors
+        quantization = quantization_kind(getattr(dense_config, 'quantization_config', None) or config.quantization_config)
+        sparse_vectors = params.sparse_vectors or {}
+        sparse_name = None
+        if sparse_vectors:
+            sparse_name = DEFAULT_SPARSE_VECTOR_NAME if DEFAULT_SPARSE_VECTOR_NAME in sparse_vectors else next(iter(sparse_vectors))
+        return dense_name, sparse_name, quantization
+
+    @property
+    def search_params(self) -> Optional[models.SearchParams]:
+        if self.quantization == 'none':
+            return None
+        return models.SearchParams(quantization=models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling))
+
+    def _query_kwargs(self, dense_vector, sparse_vector, limit: int) -> Dict:
+        if not self.hybrid:
+            return {'query': dense_vector, 'using': self.dense_vector_name, 'limit': limit, 'params': self.search_params}
+        return {
+            'prefetch': [
+                models.Prefetch(query=dense_vector, using=self.dense_vector_name, limit=max(self.prefetch_limit, limit),
+                                params=self.search_params),
+                models.Prefetch(query=sparse_vector, using=self.sparse_vector_name, limit=max(self.prefetch_limit, limit)),
+            ],
+            'query': models.FusionQuery(fusion=models.Fusion.RRF),
+            'limit': limit,
+        }
+
+    def search(self, query: str, limit: Optional[int] = None) -> List:
+        limit = limit or self.limit
+        with metrics.timer('embedding'):
+            dense_vector = self.embed_model.get_query_embedding(query)
+        sparse_vector = None
+        if self.hybrid:
+            with metrics.timer('sparse_embedding'):
+                sparse_vector = self.sparse_encoder.encode_queries([query])[0]
+
+        metrics.inc('kb_qdrant_requests_total', operation='query_points')
+        with metrics.timer('vector_search'):
+            query = self._query_kwargs(dense_vector, sparse_vector, limit)
+            points = self.client.query_points(
+                collection_name=self.collection_name,
+                with_payload=PAYLOAD_FIELDS,
+                search_params=query.pop('params', None),
+                **query,
+            ).points
+            fill_snippets(self.client, self.collection_name, points)
+        return points
+
+    def search_batch(self, queries: List[str], dense_vectors: Optional[List] = None, limit: Optional[int] = None) -> List[List]:
+        if not queries:
+            return []
+        limit = limit or self.limit
+        if dense_vectors is None:
+            with metrics.timer('embedding'):
+                if hasattr(self.embed_model, 'get_query_embedding_batch'):
+                    dense_vectors = self.embed_model.get_query_embedding_batch(queries)
+                else:
+                    dense_vectors = [self.embed_model.get_query_embedding(query) for query in queries]
+        sparse_vectors = [None] * len(queries)
+        if self.hybrid:
+            with metrics.timer('sparse_embedding'):
+                sparse_vectors = self.sparse_encoder.encode_queries(queries)
+
+        requests = [
+            models.QueryRequest(with_payload=PAYLOAD_FIELDS, **self._query_kwargs(dense_vector, sparse_vector, limit))
+            for dense_vector, sparse_vector in zip(dense_vectors, sparse_vectors)
+        ]
+        metrics.inc('kb_qdrant_requests_total', operation='query_batch_points')
+        with metrics.timer('vector_search_batch'):
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+            fill_snippets(self.client, self.collection_name, [point for response in responses for point in response.points])
+        return [response.points for response in responses]
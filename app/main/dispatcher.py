@@ -0,0 +1,117 @@
+# app/main/dispatcher.py
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.knowledge_base.metrics import metrics
+
+
+class QueryRejected(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, owner: Optional[str]):
+        self.id = job_id
+        self.owner = owner
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.future: Optional[Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+
+class QueryDispatcher:
+    """Runs knowledge-base queries on a bounded thread pool, off the Socket.IO and HTTP handlers.
+
+    Submissions beyond ``max_workers + max_queued`` in-flight jobs, or beyond
+    ``max_per_owner`` for one client, are rejected at once instead of queueing. Each job
+    gets a cancel event that the query pipeline checks between stages and streamed chunks.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queued: int = 16, max_per_owner: int = 2):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_per_owner = max_per_owner
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='kb-query')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        metrics.register_collector(self._metrics)
+
+    def submit(self, func: Callable[[threading.Event], object], job_id: Optional[str] = None, owner: Optional[str] = None) -> Job:
+        job = Job(job_id or uuid.uuid4().hex, owner)
+        with self._lock:
+            if job.id in self._jobs:
+                raise QueryRejected(f"Query {job.id} is already running")
+            if len(self._jobs) >= self.max_workers + self.max_queued:
+                metrics.inc('kb_queries_rejected_total', reason='busy')
+                raise QueryRejected("The server is busy; please retry shortly")
+            if owner is not None and self.max_per_owner and sum(1 for j in self._jobs.values() if j.owner == owner) >= self.max_per_owner:
+                metrics.inc('kb_queries_rejected_total', reason='client_limit')
+                raise QueryRejected(f"At most {self.max_per_owner} queries can run at once per client")
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[threading.Event], object]):
+        try:
+            if job.cancelled:
+                return None
+            return func(job.cancel_event)
+        finally:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job.owner != owner):
+                return False
+        job.cancel_event.set()
+        metrics.inc('kb_queries_cancelled_total')
+        if job.future is not None and job.future.cancel():
+            # Never started, so _run won't clean it up
+            with self._lock:
+                self._jobs.pop(job.id, None)
+        return True
+
+    def cancel_owner(self, owner: str) -> List[str]:
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values() if job.owner == owner]
+        return [job_id for job_id in job_ids if self.cancel(job_id)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'in_flight': len(self._jobs), 'capacity': self.max_workers + self.max_queued}
+
+    def _metrics(self) -> List[Tuple[str, str, Dict, float]]:
+        stats = self.stats()
+        return [
+            ('kb_queries_in_flight', 'gauge', {}, stats['in_flight']),
+            ('kb_queries_capacity', 'gauge', {}, stats['capacity']),
+        ]
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> QueryDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = QueryDispatcher(
+                    max_workers=int(os.getenv('KB_QUERY_WORKERS', '8')),
+                    max_queued=int(os.getenv('KB_QUERY_QUEUE', '16')),
+                    max_per_owner=int(os.getenv('KB_QUERY_CLIENT_LIMIT', '2')),
+                )
+                logging.info(f"Query dispatcher started with {_dispatcher.max_workers} workers")
+    return _dispatcher
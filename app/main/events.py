@@ -1,12 +1,62 @@
 # app/main/events.py
 
-from app import socketio
-from app.knowledge_base.integrated_kb_query import IntegratedKnowledgeBaseQuery
+import logging
+import uuid
 
-kb_query = IntegratedKnowledgeBaseQuery()
+from flask import request
+from app import socketio
+from app.knowledge_base.engine import get_kb_query, QueryCancelled
+from app.main.dispatcher import get_dispatcher, QueryRejected
+from app.main.sessions import conversation_id as session_conversation_id
 
 @socketio.on('query')
 def handle_query(data):
     query_text = data['query']
-    response = kb_query.query_knowledge_base(query_text)
-    socketio.emit('response', {'response': response})
\ No newline at end of file
+    request_id = str(data.get('request_id') or uuid.uuid4().hex)
+    stream = data.get('stream', True)
+    # The worker has no request context, so the client's room and conversation are captured here
+    sid = request.sid
+    conversation_id = session_conversation_id()
+
+    try:
+        get_dispatcher().submit(
+            lambda cancel_event: run_query(sid, request_id, query_text, conversation_id, stream, cancel_event),
+            job_id=f"{sid}:{request_id}",
+            owner=sid,
+        )
+    except QueryRejected as e:
+        socketio.emit('query_rejected', {'request_id': request_id, 'error': str(e)}, to=sid)
+        return
+    socketio.emit('query_accepted', {'request_id': request_id}, to=sid)
+
+@socketio.on('cancel')
+def handle_cancel(data):
+    request_id = str(data.get('request_id', ''))
+    cancelled = get_dispatcher().cancel(f"{request.sid}:{request_id}", owner=request.sid)
+    if cancelled:
+        socketio.emit('query_cancelled', {'request_id': request_id}, to=request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    get_dispatcher().cancel_owner(request.sid)
+
+def run_query(sid, request_id, query_text, conversation_id, stream, cancel_event):
+    try:
+        kb_query = get_kb_query()
+        sources, chunks = kb_query.stream_knowledge_base(query_text, conversation_id, cancel_event)
+        response = ''
+        for chunk in chunks:
+            response += chunk
+            # Emit the answer as it is generated, then the full text with its sources
+            if stream:
+                socketio.emit('response_chunk', {'request_id': request_id, 'chunk': chunk}, to=sid)
+                socketio.sleep(0)
+        if stream:
+            socketio.emit('response_end', {'request_id': request_id, 'response': response, 'sources': sources}, to=sid)
+        else:
+            socketio.emit('response', {'request_id': request_id, 'response': response, 'sources': sources}, to=sid)
+    except QueryCancelled:
+        logging.info(f"Query {request_id} cancelled")
+    except Exception as e:
+        logging.error(f"Error answering query {request_id}: {str(e)}")
+        socketio.emit('query_error', {'request_id': request_id, 'error': 'The query could not be answered'}, to=sid)
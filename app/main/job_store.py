@@ -0,0 +1,107 @@
+# app/main/job_store.py
+
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+FINISHED = ('done', 'error', 'cancelled')
+
+
+class JobStore:
+    """Status and results of asynchronous queries, bounded in size and expired after ``ttl`` seconds."""
+
+    def __init__(self, max_jobs: int = 10000, ttl: float = 3600):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, query: str, callback_url: Optional[str] = None) -> Dict:
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'query': query,
+            'created_at': time.time(),
+            'callback_url': callback_url,
+        }
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = job
+            self._evict()
+            return self._public(job)
+
+    def update(self, job_id: str, **fields) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            if fields.get('status') in FINISHED:
+                job['finished_at'] = time.time()
+            return dict(job)
+
+    def set_result(self, job_id: str, index: int, result, **fields) -> Optional[Dict]:
+        # Fills one slot of the job's results in place; copying the whole list per result is quadratic
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job['results'][index] = result
+            job.update(fields)
+            return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job['status']] = statuses.get(job['status'], 0) + 1
+            return {'jobs': len(self._jobs), 'statuses': statuses}
+
+    def _public(self, job: Dict) -> Dict:
+        return {key: value for key, value in job.items() if key != 'callback_url'}
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.get('finished_at', job['created_at']) < cutoff and job['status'] in FINISHED]:
+            del self._jobs[job_id]
+
+    def _evict(self):
+        # Oldest finished jobs go first; unfinished jobs are bounded by the dispatcher
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['status'] in FINISHED]:
+            del self._jobs[job_id]
+            if len(self._jobs) <= self.max_jobs:
+                return
+
+
+def webhook_allowed(url: str, allowed_hosts) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme in ('http', 'https') and parsed.hostname in allowed_hosts
+
+
+def deliver_webhook(url: str, job: Dict, timeout: float = 10):
+    body = json.dumps({key: value for key, value in job.items() if key != 'callback_url'}).encode('utf-8')
+    webhook = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(webhook, timeout=timeout) as response:
+            logging.info(f"Delivered job {job['id']} to {url}: HTTP {response.status}")
+    except Exception as e:
+        logging.warning(f"Could not deliver job {job['id']} to {url}: {e}")
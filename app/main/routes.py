@@ -1,25 +1,155 @@
 # app/main/routes.py
 
-from flask import render_template, request, jsonify, session
+import hmac
+import os
+import time
+import uuid
+
+from flask import render_template, request, jsonify, Response, url_for
 from app.main import bp
-from app.knowledge_base.integrated_kb_query import IntegratedKnowledgeBaseQuery
+from app.knowledge_base.bulk import BulkAnswerer
+from app.knowledge_base.engine import get_kb_query, is_ready, readiness, QueryCancelled
+from app.knowledge_base.metrics import metrics
+from app.main.dispatcher import get_dispatcher, QueryRejected
+from app.main.job_store import JobStore, webhook_allowed, deliver_webhook
+from app.main.sessions import conversation_id as session_conversation_id
 
-kb_query = IntegratedKnowledgeBaseQuery()
+jobs = JobStore(
+    max_jobs=int(os.getenv('KB_JOB_STORE_SIZE', '10000')),
+    ttl=float(os.getenv('KB_JOB_TTL', '3600')),
+)
+bulk_max_queries = int(os.getenv('KB_BULK_MAX_QUERIES', '1000'))
+webhook_hosts = {host.strip() for host in os.getenv('KB_WEBHOOK_HOSTS', '').split(',') if host.strip()}
 
 @bp.route('/')
 def index():
     return render_template('index.html')
 
+@bp.route('/health')
+def health():
+    return jsonify({'status': 'ok'})
+
+@bp.route('/ready')
+def ready():
+    # Read before the state, so a 200 always carries status 'ready'
+    ready = is_ready()
+    return jsonify(readiness()), 200 if ready else 503
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    # Called by ingestion; without KB_ADMIN_TOKEN configured the endpoint stays disabled
+    token = os.getenv('KB_ADMIN_TOKEN')
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'Forbidden'}), 403
+    case_ids = (request.get_json(silent=True) or {}).get('case_ids')
+    if case_ids is not None and not isinstance(case_ids, list):
+        return jsonify({'error': 'case_ids must be a list'}), 400
+    get_kb_query().invalidate_caches(case_ids)
+    return jsonify({'invalidated': 'all' if case_ids is None else len(case_ids)})
+
 @bp.route('/query', methods=['POST'])
 def query():
     query_text = request.json['query']
-    
-    # Query the knowledge base
-    response = kb_query.query_knowledge_base(query_text)
-    
-    # Store response in session
-    if 'history' not in session:
-        session['history'] = []
-    session['history'].append(response)
-    
-    return jsonify({'response': response})
\ No newline at end of file
+
+    if request.json.get('wait'):
+        # Synchronous answer; the conversation turn is recorded server-side
+        response = get_kb_query().query_knowledge_base(query_text)
+        return jsonify({'response': response})
+
+    callback_url = request.json.get('callback_url')
+    if callback_url and not webhook_allowed(callback_url, webhook_hosts):
+        return jsonify({'error': 'callback_url host is not allowed'}), 400
+
+    job_id = uuid.uuid4().hex
+    conversation_id = session_conversation_id()
+    job = jobs.create(job_id, query_text, callback_url)
+    try:
+        get_dispatcher().submit(
+            lambda cancel_event: run_job(job_id, query_text, conversation_id, callback_url, cancel_event),
+            job_id=job_id,
+        )
+    except QueryRejected as e:
+        jobs.remove(job_id)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+
+    job['status_url'] = url_for('main.query_status', job_id=job_id)
+    return jsonify(job), 202, {'Location': job['status_url']}
+
+@bp.route('/query/batch', methods=['POST'])
+def query_batch():
+    queries = request.json.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+        return jsonify({'error': 'queries must be a non-empty list of strings'}), 400
+    if len(queries) > bulk_max_queries:
+        return jsonify({'error': f"At most {bulk_max_queries} queries per batch"}), 400
+
+    callback_url = request.json.get('callback_url')
+    if callback_url and not webhook_allowed(callback_url, webhook_hosts):
+        return jsonify({'error': 'callback_url host is not allowed'}), 400
+
+    job_id = uuid.uuid4().hex
+    job = jobs.create(job_id, queries, callback_url)
+    try:
+        get_dispatcher().submit(
+            lambda cancel_event: run_batch_job(job_id, queries, callback_url, cancel_event),
+            job_id=job_id,
+        )
+    except QueryRejected as e:
+        jobs.remove(job_id)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+
+    job['status_url'] = url_for('main.query_status', job_id=job_id)
+    return jsonify(job), 202, {'Location': job['status_url']}
+
+@bp.route('/query/<job_id>', methods=['GET'])
+def query_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+@bp.route('/query/<job_id>', methods=['DELETE'])
+def cancel_query(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if get_dispatcher().cancel(job_id):
+        job = jobs.update(job_id, status='cancelled')
+    return jsonify({key: value for key, value in job.items() if key != 'callback_url'})
+
+def run_job(job_id, query_text, conversation_id, callback_url, cancel_event):
+    jobs.update(job_id, status='running', started_at=time.time())
+    try:
+        sources, chunks = get_kb_query().stream_knowledge_base(query_text, conversation_id, cancel_event)
+        job = jobs.update(job_id, status='done', response="".join(chunks), sources=sources)
+    except QueryCancelled:
+        job = jobs.update(job_id, status='cancelled')
+    except Exception as e:
+        job = jobs.update(job_id, status='error', error=str(e))
+    if callback_url and job is not None:
+        deliver_webhook(callback_url, job)
+
+def run_batch_job(job_id, queries, callback_url, cancel_event):
+    jobs.update(job_id, status='running', started_at=time.time(), completed=0, results=[None] * len(queries))
+    try:
+        answerer = BulkAnswerer(
+            get_kb_query(),
+            batch_size=int(os.getenv('KB_BULK_BATCH', '64')),
+            concurrency=int(os.getenv('KB_BULK_LLM_CONCURRENCY', '4')),
+        )
+        completed = 0
+        for result in answerer.answer(queries, cancel_event):
+            completed += 1
+            # Pollers see answers as they finish, in the order of the submitted queries
+            jobs.set_result(job_id, result['index'], result, completed=completed)
+        job = jobs.update(job_id, status='done')
+    except QueryCancelled:
+        job = jobs.update(job_id, status='cancelled')
+    except Exception as e:
+        job = jobs.update(job_id, status='error', error=str(e))
+    if callback_url and job is not None:
+        deliver_webhook(callback_url, job)
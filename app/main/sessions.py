@@ -0,0 +1,11 @@
+# app/main/sessions.py
+
+from flask import session
+from app.knowledge_base.conversation_store import ConversationStore
+
+def conversation_id():
+    # Background workers have no request context, so handlers resolve the conversation up front
+    session.pop('history', None)
+    if session.get('conversation_id') is None:
+        session['conversation_id'] = ConversationStore.new_conversation_id()
+    return session['conversation_id']
@@ -4,29 +4,101 @@ document.addEventListener('DOMContentLoaded', () => {
     const socket = io();
     const queryInput = document.getElementById('query-input');
     const submitButton = document.getElementById('submit-query');
+    const cancelButton = document.getElementById('cancel-query');
     const messages = document.getElementById('messages');
+    let streamingMessage = null;
+    let streamingText = '';
+    let currentRequestId = null;
 
     submitButton.addEventListener('click', () => {
         const query = queryInput.value.trim();
         if (query) {
             addMessage(query, 'user');
-            socket.emit('query', { query });
+            startRequest();
+            socket.emit('query', { query, stream: true, request_id: currentRequestId });
             queryInput.value = '';
         }
         messages.scrollTop = messages.scrollHeight; // Scroll to the bottom
     });
 
+    cancelButton.addEventListener('click', () => {
+        if (currentRequestId) {
+            socket.emit('cancel', { request_id: currentRequestId });
+        }
+    });
+
     socket.on('response', (data) => {
-        addMessage(formatResponse(data.response), 'ai');
+        if (data.request_id !== currentRequestId) return;
+        const messageElement = addMessage(formatResponse(data.response), 'ai');
+        if (data.sources && data.sources.length) {
+            messageElement.appendChild(formatSources(data.sources));
+        }
+        finishRequest();
         messages.scrollTop = messages.scrollHeight; // Scroll to the bottom
     });
 
+    socket.on('response_chunk', (data) => {
+        if (data.request_id !== currentRequestId) return;
+        if (!streamingMessage) {
+            streamingMessage = addMessage('', 'ai');
+            streamingText = '';
+        }
+        streamingText += data.chunk;
+        streamingMessage.innerHTML = formatResponse(streamingText);
+        messages.scrollTop = messages.scrollHeight; // Scroll to the bottom
+    });
+
+    socket.on('response_end', (data) => {
+        if (data.request_id !== currentRequestId) return;
+        const messageElement = streamingMessage || addMessage('', 'ai');
+        messageElement.innerHTML = formatResponse(data.response);
+        if (data.sources && data.sources.length) {
+            messageElement.appendChild(formatSources(data.sources));
+        }
+        finishRequest();
+        messages.scrollTop = messages.scrollHeight; // Scroll to the bottom
+    });
+
+    socket.on('query_rejected', (data) => endWithNotice(data, data.error));
+    socket.on('query_error', (data) => endWithNotice(data, data.error));
+    socket.on('query_cancelled', (data) => endWithNotice(data, 'Query cancelled.'));
+
+    function startRequest() {
+        currentRequestId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+        streamingMessage = null;
+        streamingText = '';
+        cancelButton.disabled = false;
+    }
+
+    function finishRequest() {
+        currentRequestId = null;
+        streamingMessage = null;
+        streamingText = '';
+        cancelButton.disabled = true;
+    }
+
+    function endWithNotice(data, notice) {
+        if (data.request_id !== currentRequestId) return;
+        addMessage(notice, 'ai');
+        finishRequest();
+    }
+
     function addMessage(text, sender) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message', sender);
         messageElement.innerHTML = text; // Use innerHTML for formatted text
         messages.appendChild(messageElement);
         messages.scrollTop = messages.scrollHeight; // Scroll to the bottom
+        return messageElement;
+    }
+
+    function formatSources(sources) {
+        const sourcesElement = document.createElement('div');
+        sourcesElement.classList.add('sources');
+        sourcesElement.textContent = 'Sources: ' + sources.map((source) => {
+            return source.score !== undefined ? `${source.name} (${source.score})` : source.name;
+        }).join('; ');
+        return sourcesElement;
     }
 
     function formatResponse(response) {
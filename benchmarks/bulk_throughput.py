@@ -0,0 +1,65 @@
+# benchmarks/bulk_throughput.py
+#
+# Offline comparison of answering a list of questions one at a time through
+# query_knowledge_base and all at once through BulkAnswerer, against the in-process
+# stand-ins in benchmarks/fakes.py. Reports wall time, throughput and round trips.
+#
+#   python -m benchmarks.bulk_throughput --queries 200 --concurrency 8
+
+import argparse
+import logging
+import os
+import time
+
+from benchmarks.fakes import build_offline_kb, sample_queries
+from app.knowledge_base.bulk import BulkAnswerer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sequential vs bulk question answering throughput')
+    parser.add_argument('--cases', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=8, help='LLM completions running at once in bulk mode')
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--graph-latency', type=float, default=0.005)
+    parser.add_argument('--vector-latency', type=float, default=0.005)
+    parser.add_argument('--embed-latency', type=float, default=0.002)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Every query must do the full work in both modes
+    os.environ['KB_ANSWER_CACHE'] = 'false'
+    os.environ['KB_SYNTHESIS_MODE'] = 'single'
+
+    results = {}
+    for mode in ('sequential', 'bulk'):
+        kb_query, cases = build_offline_kb(
+            num_cases=args.cases,
+            llm_latency=args.llm_latency,
+            graph_latency=args.graph_latency,
+            vector_latency=args.vector_latency,
+            embed_latency=args.embed_latency,
+        )
+        queries = sample_queries(cases, args.queries)
+        graph_calls = kb_query.graph_store.calls
+        vector_calls = kb_query.vector_store.client.calls
+
+        start = time.perf_counter()
+        if mode == 'sequential':
+            answers = [kb_query.query_knowledge_base(query) for query in queries]
+        else:
+            answerer = BulkAnswerer(kb_query, batch_size=args.batch_size, concurrency=args.concurrency)
+            answers = [result['response'] for result in answerer.answer(queries)]
+        elapsed = time.perf_counter() - start
+
+        results[mode] = elapsed
+        print(f"{mode:<10} {len(answers)} answers in {elapsed:.2f}s ({len(answers) / elapsed:.1f} queries/s), "
+              f"{kb_query.graph_store.calls - graph_calls} graph queries, "
+              f"{kb_query.vector_store.client.calls - vector_calls} Qdrant requests")
+
+    print(f"\nbulk speedup: {results['sequential'] / results['bulk']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# benchmarks/engine_construction.py
+#
+# Measures the per-query cost of building the router query engine (graph and vector
+# query engines, tools, TreeSummarize and RouterQueryEngine) that query_datastores used
+# to pay on every call, against reusing the engine built at startup.
+#
+#   python -m benchmarks.engine_construction --iterations 200
+#   python -m benchmarks.engine_construction --offline
+
+import argparse
+import statistics
+import time
+
+from app.knowledge_base.integrated_kb_query import IntegratedKnowledgeBaseQuery
+from benchmarks.fakes import build_offline_kb
+
+
+def time_calls(func, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure router query engine construction overhead')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--offline', action='store_true', help='use the in-process stand-ins from benchmarks/fakes.py')
+    args = parser.parse_args()
+
+    if args.offline:
+        kb_query, _ = build_offline_kb(llm_latency=0.2, graph_latency=0.01, vector_latency=0.01)
+    else:
+        kb_query = IntegratedKnowledgeBaseQuery()
+
+    rebuilt = time_calls(kb_query._build_router_query_engine, args.iterations)
+    reused = time_calls(lambda: kb_query.router_query_engine, args.iterations)
+
+    for label, durations in (('rebuilt per query', rebuilt), ('reused', reused)):
+        print(
+            f"{label:<18} mean {statistics.mean(durations) * 1000:8.3f} ms  "
+            f"p50 {statistics.median(durations) * 1000:8.3f} ms  "
+            f"max {max(durations) * 1000:8.3f} ms"
+        )
+    print(f"overhead removed per query: {(statistics.mean(rebuilt) - statistics.mean(reused)) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/entity_extraction.py
+#
+# Offline comparison of regex and gazetteer entity extraction over the synthetic corpus,
+# padded with generated names to a realistic gazetteer size: build, snapshot save and
+# load times, extraction latency, and how many of the extracted entities are real graph
+# names (each one costs a Neo4j lookup).
+#
+#   python -m benchmarks.entity_extraction --names 200000
+
+import argparse
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+
+from benchmarks.fakes import InMemoryLegalGraph, build_corpus, sample_queries
+from app.knowledge_base.gazetteer import EntityGazetteer
+from app.knowledge_base.integrated_kb_query import ENTITY_INDEX_LABELS, ENTITY_PATTERN, GAZETTEER_NAMES_QUERY
+
+SYLLABLES = ['ka', 'lo', 'mer', 'ten', 'va', 'ris', 'don', 'bel', 'qui', 'sor', 'an', 'thu', 'gre', 'mi', 'pel']
+
+
+def generated_names(count, seed=3):
+    rng = random.Random(seed)
+    word = lambda: ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+    labels = ['Party', 'Attorney', 'Judge', 'Case']
+    records = []
+    for _ in range(count):
+        label = rng.choice(labels)
+        name = f"{word()} v. {word()}" if label == 'Case' else " ".join(word() for _ in range(rng.randint(1, 3)))
+        records.append({'name': name, 'labels': [label], 'aliases': []})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regex vs gazetteer entity extraction')
+    parser.add_argument('--cases', type=int, default=500)
+    parser.add_argument('--names', type=int, default=100000, help='generated names added to the corpus entities')
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    cases = build_corpus(args.cases)
+    records = InMemoryLegalGraph(cases).structured_query(GAZETTEER_NAMES_QUERY, {"labels": ENTITY_INDEX_LABELS})
+    known = {record['name'] for record in records}
+    records += generated_names(args.names)
+    queries = sample_queries(cases, args.queries)
+
+    path = os.path.join(tempfile.mkdtemp(), 'gazetteer.json')
+    gazetteer = EntityGazetteer(path)
+    start = time.perf_counter()
+    gazetteer.build(records)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    gazetteer.save()
+    save = time.perf_counter() - start
+    start = time.perf_counter()
+    gazetteer = EntityGazetteer(path)
+    load = time.perf_counter() - start
+    print(f"gazetteer: {len(gazetteer)} entities, built in {build:.2f}s, saved in {save:.2f}s "
+          f"({os.path.getsize(path) / 2 ** 20:.1f} MiB), loaded in {load:.2f}s")
+
+    extractors = {
+        'regex': lambda query: re.findall(ENTITY_PATTERN, query),
+        'gazetteer': gazetteer.names,
+    }
+    for name, extract in extractors.items():
+        start = time.perf_counter()
+        results = [list(dict.fromkeys(extract(query))) for query in queries]
+        latency = (time.perf_counter() - start) / len(queries)
+        extracted = sum(len(entities) for entities in results)
+        real = sum(entity in known for entities in results for entity in entities)
+        print(f"{name:<10} {latency * 1e6:>7.1f} us per query, {extracted / len(queries):.2f} lookups per query, "
+              f"{real / extracted if extracted else 0:.3f} of them graph names")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+# benchmarks/fakes.py
+#
+# In-process stand-ins for Groq, Neo4j and Qdrant so the query pipeline can be measured
+# offline with configurable latency. build_offline_kb() wires them into an
+# IntegratedKnowledgeBaseQuery over a synthetic corpus that follows the
+# Case/Judge/Court/Party/Attorney schema read by get_case_details.
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.graph_stores import SimplePropertyGraphStore
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from app.knowledge_base.integrated_kb_query import ENTITY_INDEX_LABELS, IntegratedKnowledgeBaseQuery
+from app.knowledge_base.vector_search import collection_config, point_vector, snippet
+
+JUDGES = ['Molley', 'Harlan', 'Okafor', 'Brennan', 'Castillo', 'Whitfield', 'Nakamura', 'Adeyemi', 'Lindqvist', 'Moreau']
+COURTS = [
+    ('Supreme Court of Ohio', 'Ohio'),
+    ('Court of Appeals for the Ninth Circuit', '9th Cir.'),
+    ('District Court for the Southern District of New York', 'S.D.N.Y.'),
+    ('Supreme Court of California', 'Cal.'),
+    ('Court of Appeals of Texas', 'Tex. App.'),
+]
+PARTIES = [
+    'Acme Corporation', 'Globex Inc.', 'Initech LLC', 'Umbrella Co.', 'Wayne Enterprises', 'Stark Industries',
+    'Smith', 'Jones', 'Garcia', 'Chen', 'Okonkwo', 'Fischer', 'Rossi', 'Dubois', 'Kowalski', 'Haddad',
+]
+ATTORNEYS = ['Linda Park', 'Raj Patel', 'Maria Rossi', 'Tom Becker', 'Aisha Bello', 'Sven Olsen', 'Grace Liu']
+TOPICS = [
+    'breach of contract', 'negligence', 'due process', 'patent infringement', 'wrongful termination',
+    'securities fraud', 'qualified immunity', 'adverse possession', 'product liability', 'trade secrets',
+]
+OPINION_TYPES = ['majority', 'per curiam', 'plurality', 'concurrence']
+
+
+def build_corpus(num_cases: int = 500, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    cases = []
+    for i in range(num_cases):
+        plaintiff, defendant = rng.sample(PARTIES, 2)
+        court_name, court_short = rng.choice(COURTS)
+        judges = rng.sample(JUDGES, 3)
+        topic = rng.choice(TOPICS)
+        year = rng.randint(1990, 2024)
+        case_id = f"case-{i}"
+        cases.append({
+            'id': case_id,
+            'case_name': f"{plaintiff} v. {defendant}",
+            'date_filed': f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'court': {'name': court_name, 'short_name': court_short},
+            'judges': judges,
+            'author': judges[0],
+            'attorneys': rng.sample(ATTORNEYS, 2),
+            'plaintiff': plaintiff,
+            'defendant': defendant,
+            'citations': [f"{rng.randint(100, 999)} F.{rng.randint(2, 4)}d {rng.randint(1, 1500)}" for _ in range(2)],
+            'opinion_type': rng.choice(OPINION_TYPES),
+            'docket': f"{year % 100:02d}-cv-{rng.randint(1000, 9999)}",
+            'topic': topic,
+            'text': (
+                f"{plaintiff} brought an action against {defendant} in the {court_name} alleging {topic}. "
+                f"Judge {judges[0]} wrote the {rng.choice(OPINION_TYPES)} opinion, joined by Judges {judges[1]} and {judges[2]}. "
+                f"The court examined the {topic} claim under the governing standard, reviewed the record de novo "
+                f"and {'affirmed' if rng.random() < 0.5 else 'reversed'} the judgment below. "
+                + " ".join(rng.choice(TOPICS) + " doctrine was discussed at length." for _ in range(20))
+            ),
+        })
+        # Exact identifiers that dense embeddings tend to miss
+        cases[-1]['text'] += f" Docket No. {cases[-1]['docket']}. Reported at {cases[-1]['citations'][0]}."
+    return cases
+
+
+def sample_queries(cases: List[Dict], count: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    templates = [
+        lambda case: f"Cases involving Judge {rng.choice(case['judges'])}",
+        lambda case: f"What did the court decide in {case['case_name']}?",
+        lambda case: f"Which attorneys represented {case['plaintiff']}?",
+        lambda case: f"Explain the {case['topic']} precedents from the {case['court']['short_name']} court",
+        lambda case: f"Summarize opinions written by Judge {case['author']} about {case['topic']}",
+    ]
+    return [rng.choice(templates)(rng.choice(cases)) for _ in range(count)]
+
+
+def _sleep(seconds: float):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+class FakeLLM(CustomLLM):
+    """Deterministic LLM with configurable first-token and per-token latency."""
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 120
+    _calls: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=8192, num_output=self.answer_tokens, model_name="fake-llm")
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _respond(self, prompt: str) -> str:
+        with self._lock:
+            self._calls += 1
+        if 'return the top choices' in prompt:
+            # LLMMultiSelector expects a JSON list of choices
+            return '[{"choice": 1, "reason": "relationships between entities"}, {"choice": 2, "reason": "case content"}]'
+        if prompt.rstrip().endswith('KEYWORDS:'):
+            return '^'.join(JUDGES[:3])
+        words = re.findall(r'[A-Z][a-z]+', prompt)[:20] or ['law']
+        return " ".join(['Based', 'on', 'my', 'knowledge'] + [words[i % len(words)] for i in range(self.answer_tokens - 4)])
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self._respond(prompt)
+        _sleep(self.latency + self.token_latency * len(text.split()))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self._respond(prompt)
+
+        def gen():
+            _sleep(self.latency)
+            generated = ""
+            for token in text.split():
+                _sleep(self.token_latency)
+                delta = token if not generated else f" {token}"
+                generated += delta
+                yield CompletionResponse(text=generated, delta=delta)
+
+        return gen()
+
+
+class HashEmbedding(BaseEmbedding):
+    """Hashed bag-of-words embedding: cheap, deterministic, and similar texts score close."""
+
+    dim: int = 384
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r'[a-z0-9]+', text.lower()):
+            digest = hashlib.md5(token.encode()).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[index] += 1.0 if digest[4] % 2 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        _sleep(self.latency)
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        _sleep(self.latency)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # One model call per batch, like FastEmbed
+        _sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class HashSparseEncoder:
+    """BM25-shaped sparse encoder: hashed term frequencies for documents, unit weights for queries."""
+
+    requires_idf = True
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _encode(self, text: str, counts: bool) -> models.SparseVector:
+        weights: Dict[int, float] = {}
+        for token in re.findall(r'[a-z0-9]+(?:[.-][a-z0-9]+)*', text.lower()):
+            index = int.from_bytes(hashlib.md5(token.encode()).digest()[:4], 'little')
+            weights[index] = (weights.get(index, 0.0) + 1.0) if counts else 1.0
+        indices = sorted(weights)
+        return models.SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+    def encode_documents(self, texts: List[str]) -> List[models.SparseVector]:
+        _sleep(self.latency)
+        return [self._encode(text, counts=True) for text in texts]
+
+    def encode_queries(self, queries: List[str]) -> List[models.SparseVector]:
+        _sleep(self.latency)
+        return [self._encode(query, counts=False) for query in queries]
+
+
+class InMemoryLegalGraph(SimplePropertyGraphStore):
+    """Answers the Cypher issued by IntegratedKnowledgeBaseQuery from an in-memory legal graph."""
+
+    def __init__(self, cases: List[Dict], latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+        self.nodes: Dict[str, Dict] = {}
+        self.edges: List[tuple] = []
+        self.adjacency: Dict[str, List[tuple]] = {}
+        for case in cases:
+            self.add_case(case)
+
+    def _node(self, node_id: str, label: str, **properties) -> str:
+        if node_id not in self.nodes:
+            self.nodes[node_id] = {'labels': [label], 'props': dict(properties, id=node_id)}
+            self.adjacency[node_id] = []
+        return node_id
+
+    def _edge(self, source: str, rel_type: str, target: str):
+        self.edges.append((source, rel_type, target))
+        self.adjacency[source].append((rel_type, target))
+        self.adjacency[target].append((rel_type, source))
+
+    def add_case(self, case: Dict):
+        case_id = self._node(case['id'], 'Case', name=case['case_name'], case_name=case['case_name'], date_filed=case['date_filed'])
+        for judge in case['judges']:
+            self._edge(case_id, 'DECIDED_BY', self._node(f"judge-{judge}", 'Judge', name=judge))
+        self._edge(case_id, 'AUTHORED_BY', self._node(f"judge-{case['author']}", 'Judge', name=case['author']))
+        court = case['court']
+        self._edge(case_id, 'HEARD_IN', self._node(f"court-{court['short_name']}", 'Court', name=court['name'], short_name=court['short_name']))
+        for attorney in case['attorneys']:
+            self._edge(case_id, 'REPRESENTED_BY', self._node(f"attorney-{attorney}", 'Attorney', name=attorney))
+        self._edge(self._node(f"party-{case['plaintiff']}", 'Party', name=case['plaintiff']), 'FILED_CASE', case_id)
+        self._edge(case_id, 'AGAINST', self._node(f"party-{case['defendant']}", 'Party', name=case['defendant']))
+        for citation in case['citations']:
+            self._edge(case_id, 'CITED_BY', self._node(f"citation-{citation}", 'Citation', text=citation))
+        self._edge(case_id, 'HAS_OPINION', self._node(f"opinion-{case_id}", 'Opinion', type=case['opinion_type']))
+        self._edge(case_id, 'HAS_DOCKET', self._node(f"docket-{case['docket']}", 'Docket', id=case['docket']))
+
+    def structured_query(self, query: str, param_map: Optional[Dict[str, Any]] = None) -> Any:
+        with self._calls_lock:
+            self.calls += 1
+        _sleep(self.latency)
+        params = param_map or {}
+
+        if 'db.index.fulltext.queryNodes' in query:
+            return self._lookup(params['names'], fulltext=True)
+        if 'UNWIND range(0, size($names)' in query:
+            return self._lookup(params['names'])
+        if 'AS aliases' in query:
+            return [
+                {'name': node['props']['name'], 'labels': node['labels'],
+                 'aliases': [node['props']['short_name']] if node['props'].get('short_name') else []}
+                for node in self.nodes.values()
+                if node['labels'][0] in params['labels'] and node['props'].get('name')
+            ]
+        if '$entity_name' in query:
+            return self._lookup([params['entity_name']])
+        if 'UNWIND $case_ids' in query:
+            return [row for case_id in params['case_ids'] for row in self._case_details(case_id)]
+        if '$case_id' in query:
+            return [{k: v for k, v in row.items() if k != 'case_id'} for row in self._case_details(params['case_id'])]
+        if 'ORDER BY references DESC' in query:
+            case_ids = [node_id for node_id, node in self.nodes.items() if node['labels'][0] == 'Case']
+            case_ids.sort(key=lambda node_id: -len(self.adjacency[node_id]))
+            return [{'case_id': case_id} for case_id in case_ids[:params['limit']]]
+        if 'count(n) AS nodes' in query:
+            return [{'nodes': len(self.nodes), 'relationships': len(self.edges)}]
+        # Index management and anything else the fake doesn't model
+        return []
+
+    def _lookup(self, names: List[str], fulltext: bool = False) -> List[Dict]:
+        rows = []
+        for position, entity_name in enumerate(names):
+            matches = []
+            for node_id, node in self.nodes.items():
+                name = node['props'].get('name')
+                if not name:
+                    continue
+                if fulltext:
+                    if node['labels'][0] not in ENTITY_INDEX_LABELS or entity_name.lower() not in name.lower():
+                        continue
+                    score = 2.0 if entity_name.lower() == name.lower() else 1.0
+                elif entity_name in name:
+                    score = None
+                else:
+                    continue
+                matches.append((node_id, score))
+            if fulltext:
+                matches.sort(key=lambda match: -match[1])
+            entity_rows = []
+            for node_id, score in matches:
+                node = self.nodes[node_id]
+                for rel_type, related_id in self.adjacency[node_id] or [(None, None)]:
+                    related = self.nodes.get(related_id)
+                    entity_rows.append({
+                        'position': position,
+                        'entity_name': entity_name,
+                        'entity': node['props'],
+                        'entity_id': node_id,
+                        'entity_labels': node['labels'],
+                        'score': score,
+                        'relationship_type': rel_type,
+                        'related': related['props'] if related else None,
+                        'related_labels': related['labels'] if related else None,
+                    })
+                    if len(entity_rows) >= 10:
+                        break
+                if len(entity_rows) >= 10:
+                    break
+            rows.extend(entity_rows)
+        return rows
+
+    def _case_details(self, case_id: str) -> List[Dict]:
+        node = self.nodes.get(case_id)
+        if node is None or node['labels'][0] != 'Case':
+            return []
+
+        def related(rel_type: str, outgoing: bool = True) -> List[Dict]:
+            found = []
+            for source, edge_type, target in self.edges:
+                if edge_type != rel_type:
+                    continue
+                if outgoing and source == case_id:
+                    found.append(self.nodes[target]['props'])
+                elif not outgoing and target == case_id:
+                    found.append(self.nodes[source]['props'])
+            return found
+
+        def first(values: List[Dict]) -> Optional[Dict]:
+            return values[0] if values else None
+
+        return [{
+            'case_id': case_id,
+            'c': node['props'],
+            'judges': related('DECIDED_BY'),
+            'author': first(related('AUTHORED_BY')),
+            'court': first(related('HEARD_IN')),
+            'attorneys': related('REPRESENTED_BY'),
+            'plaintiff': first(related('FILED_CASE', outgoing=False)),
+            'defendant': first(related('AGAINST')),
+            'citations': related('CITED_BY'),
+            'opinion': first(related('HAS_OPINION')),
+            'docket': first(related('HAS_DOCKET')),
+        }]
+
+
+class LatencyQdrantClient(QdrantClient):
+    """Qdrant in local in-memory mode with a fixed delay added to every read."""
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(location=":memory:", **kwargs)
+        self.latency = latency
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _delay(self):
+        with self._calls_lock:
+            self.calls += 1
+        _sleep(self.latency)
+
+    def query_points(self, *args, **kwargs):
+        self._delay()
+        return super().query_points(*args, **kwargs)
+
+    def query_batch_points(self, *args, **kwargs):
+        self._delay()
+        return super().query_batch_points(*args, **kwargs)
+
+    def retrieve(self, *args, **kwargs):
+        self._delay()
+        return super().retrieve(*args, **kwargs)
+
+    def scroll(self, *args, **kwargs):
+        self._delay()
+        return super().scroll(*args, **kwargs)
+
+    def get_collection(self, *args, **kwargs):
+        self._delay()
+        return super().get_collection(*args, **kwargs)
+
+
+def law_docs_points(cases: List[Dict], embed_model: BaseEmbedding, sparse_encoder=None,
+                    legacy: bool = False) -> List[models.PointStruct]:
+    # legacy points lack the snippet field, like those ingested before it existed
+    nodes = [
+        TextNode(
+            id_=str(uuid.uuid5(uuid.NAMESPACE_URL, case['id'])),
+            text=case['text'],
+            metadata={'case_id': case['id'], 'case_name': case['case_name']},
+        )
+        for case in cases
+    ]
+    texts = [node.text for node in nodes]
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    sparse_vectors = sparse_encoder.encode_documents(texts) if sparse_encoder else [None] * len(nodes)
+    return [
+        models.PointStruct(
+            id=node.node_id,
+            vector=point_vector(embedding, sparse_vector),
+            payload=node_to_metadata_dict(node, remove_text=False) if legacy else {
+                **node_to_metadata_dict(node, remove_text=False), 'snippet': snippet(node.text),
+            },
+        )
+        for node, embedding, sparse_vector in zip(nodes, embeddings, sparse_vectors)
+    ]
+
+
+def load_law_docs(client: QdrantClient, points: List[models.PointStruct], collection_name: str = "law_docs",
+                  vector_size: int = 384, sparse_encoder=None):
+    client.create_collection(collection_name=collection_name, **collection_config(vector_size, sparse_encoder))
+    client.upsert(collection_name=collection_name, points=points)
+
+
+async def aload_law_docs(aclient: AsyncQdrantClient, points: List[models.PointStruct], collection_name: str = "law_docs",
+                         vector_size: int = 384, sparse_encoder=None):
+    await aclient.create_collection(collection_name=collection_name, **collection_config(vector_size, sparse_encoder))
+    await aclient.upsert(collection_name=collection_name, points=points)
+
+
+def build_offline_kb(num_cases: int = 500, llm_latency: float = 0.0, llm_token_latency: float = 0.0,
+                     answer_tokens: int = 120, graph_latency: float = 0.0, vector_latency: float = 0.0,
+                     embed_latency: float = 0.0, seed: int = 7, hybrid: bool = False):
+    cases = build_corpus(num_cases, seed)
+    embed_model = HashEmbedding(latency=embed_latency)
+    sparse_encoder = HashSparseEncoder(latency=embed_latency) if hybrid else None
+    llm = FakeLLM(latency=llm_latency, token_latency=llm_token_latency, answer_tokens=answer_tokens)
+    graph_store = InMemoryLegalGraph(cases, latency=graph_latency)
+
+    points = law_docs_points(cases, HashEmbedding(), HashSparseEncoder() if hybrid else None)
+    client = LatencyQdrantClient(latency=vector_latency)
+    load_law_docs(client, points, sparse_encoder=sparse_encoder)
+    # The router's vector engine queries through the async client; in-memory clients don't
+    # share storage, so it gets its own copy of the points
+    aclient = AsyncQdrantClient(location=":memory:")
+    asyncio.run(aload_law_docs(aclient, points, sparse_encoder=sparse_encoder))
+    vector_store = QdrantVectorStore(client=client, aclient=aclient, collection_name="law_docs")
+
+    kb_query = IntegratedKnowledgeBaseQuery(
+        embed_model=embed_model,
+        llm=llm,
+        graph_store=graph_store,
+        vector_store=vector_store,
+        sparse_encoder=sparse_encoder,
+    )
+    return kb_query, cases
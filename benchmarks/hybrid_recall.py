@@ -0,0 +1,85 @@
+# benchmarks/hybrid_recall.py
+#
+# Offline comparison of dense-only and hybrid (dense + sparse, RRF-fused) search over a
+# synthetic law_docs collection. Each query targets one case by docket number, citation,
+# case name or topic; recall@k is the share of queries whose case is in the top k.
+#
+#   python -m benchmarks.hybrid_recall --cases 2000 --k 1 3 5
+
+import argparse
+import logging
+import random
+import time
+
+from benchmarks.fakes import HashEmbedding, HashSparseEncoder, LatencyQdrantClient, build_corpus, law_docs_points, load_law_docs
+from app.knowledge_base.vector_search import SparseEncoder, VectorSearch
+
+
+def labelled_queries(cases, count, seed=11):
+    rng = random.Random(seed)
+    templates = {
+        'docket': lambda case: f"Opinion in docket {case['docket']}",
+        'citation': lambda case: f"What was held at {case['citations'][0]}?",
+        'case_name': lambda case: f"What did the court decide in {case['case_name']}?",
+        'topic': lambda case: f"{case['topic']} opinion by Judge {case['author']} in the {case['court']['name']}",
+    }
+    queries = []
+    for _ in range(count):
+        kind = rng.choice(sorted(templates))
+        case = rng.choice(cases)
+        queries.append((kind, templates[kind](case), case['id']))
+    return queries
+
+
+def evaluate(search, queries, ks):
+    hits = {kind: {k: 0 for k in ks} for kind, _, _ in queries}
+    totals = {kind: 0 for kind, _, _ in queries}
+    latencies = []
+    for kind, query, case_id in queries:
+        start = time.perf_counter()
+        points = search.search(query, limit=max(ks))
+        latencies.append(time.perf_counter() - start)
+        ranked = [point.payload.get('case_id') for point in points]
+        totals[kind] += 1
+        for k in ks:
+            hits[kind][k] += case_id in ranked[:k]
+    recall = {kind: {k: hits[kind][k] / totals[kind] for k in ks} for kind in totals}
+    overall = {k: sum(hits[kind][k] for kind in totals) / len(queries) for k in ks}
+    return recall, overall, sum(latencies) / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall of dense-only vs hybrid law_docs search')
+    parser.add_argument('--cases', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5])
+    parser.add_argument('--prefetch', type=int, default=20, help='candidates fetched per vector before fusion')
+    parser.add_argument('--sparse-model', help='FastEmbed sparse model, e.g. Qdrant/bm25; defaults to a hashed BM25 stand-in')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    cases = build_corpus(args.cases)
+    queries = labelled_queries(cases, args.queries)
+    embed_model = HashEmbedding()
+    sparse_encoder = SparseEncoder(args.sparse_model) if args.sparse_model else HashSparseEncoder()
+
+    client = LatencyQdrantClient()
+    load_law_docs(client, law_docs_points(cases, embed_model), collection_name="law_docs_dense")
+    load_law_docs(client, law_docs_points(cases, embed_model, sparse_encoder), collection_name="law_docs_hybrid",
+                  sparse_encoder=sparse_encoder)
+
+    searches = {
+        'dense': VectorSearch(client, "law_docs_dense", embed_model, prefetch_limit=args.prefetch),
+        'hybrid': VectorSearch(client, "law_docs_hybrid", embed_model, sparse_encoder, prefetch_limit=args.prefetch),
+    }
+    for name, search in searches.items():
+        recall, overall, latency = evaluate(search, queries, args.k)
+        print(f"\n{name}: mean latency {latency * 1000:.2f} ms")
+        print(f"  {'query kind':<12} " + " ".join(f"{'R@' + str(k):>7}" for k in args.k))
+        for kind in sorted(recall):
+            print(f"  {kind:<12} " + " ".join(f"{recall[kind][k]:>7.2f}" for k in args.k))
+        print(f"  {'all':<12} " + " ".join(f"{overall[k]:>7.2f}" for k in args.k))
+
+
+if __name__ == '__main__':
+    main()
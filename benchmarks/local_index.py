@@ -0,0 +1,61 @@
+# benchmarks/local_index.py
+#
+# Offline comparison of the local law_docs mirror with Qdrant search: recall@k of the
+# local index against Qdrant's exact results, and search latency, for each storage type
+# and number or share of probed IVF lists.
+#
+#   python -m benchmarks.local_index --cases 20000 --nprobe 4 8 16 32 --probe 0.25 0.5 0.75
+
+import argparse
+import logging
+import tempfile
+import time
+
+from benchmarks.fakes import HashEmbedding, LatencyQdrantClient, build_corpus, law_docs_points, load_law_docs, sample_queries
+from app.knowledge_base.local_index import LocalVectorIndex
+from app.knowledge_base.vector_search import VectorSearch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall and latency of the local vector index against Qdrant')
+    parser.add_argument('--cases', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[4, 8, 16, 32])
+    parser.add_argument('--probe', type=float, nargs='*', default=[0.25, 0.5, 0.75], help='shares of the lists to probe')
+    parser.add_argument('--dtype', nargs='+', choices=['float32', 'int8'], default=['float32', 'int8'])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    cases = build_corpus(args.cases)
+    embed_model = HashEmbedding()
+    client = LatencyQdrantClient()
+    load_law_docs(client, law_docs_points(cases, embed_model))
+    remote = VectorSearch(client, "law_docs", embed_model)
+    queries = [embed_model.get_query_embedding(query) for query in sample_queries(cases, args.queries)]
+
+    start = time.perf_counter()
+    exact = [{point.id for point in client.query_points("law_docs", query=query, limit=args.k).points} for query in queries]
+    qdrant_latency = (time.perf_counter() - start) / len(queries)
+    print(f"qdrant (local mode): {qdrant_latency * 1000:.3f} ms per search, {len(cases)} points, vector {remote.dense_vector_name or 'unnamed'}")
+
+    for dtype in args.dtype:
+        index = LocalVectorIndex(tempfile.mkdtemp(), dtype=dtype)
+        start = time.perf_counter()
+        index.build(client, "law_docs")
+        print(f"\n{dtype}: built in {time.perf_counter() - start:.1f}s, {index.meta['nlist']} lists")
+        settings = [(nprobe, index.probe_fraction) for nprobe in args.nprobe] + [(None, probe) for probe in args.probe]
+        for nprobe, probe in settings:
+            index.nprobe, index.probe_fraction = nprobe, probe
+            found = 0
+            start = time.perf_counter()
+            results = [index.search(query, args.k) for query in queries]
+            latency = (time.perf_counter() - start) / len(queries)
+            for hits, expected in zip(results, exact):
+                found += len(expected.intersection(point_id for point_id, _ in hits))
+            label = f"nprobe {index.probes():>3}" + (f" ({probe:.0%} of lists)" if nprobe is None else '')
+            print(f"  {label}: recall@{args.k} {found / (args.k * len(queries)):.3f}, {latency * 1000:.3f} ms per search")
+
+
+if __name__ == '__main__':
+    main()
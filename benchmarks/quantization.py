@@ -0,0 +1,217 @@
+# benchmarks/quantization.py
+#
+# Recall@k against exact search, latency and vector memory for law_docs stored as float32,
+# scalar (int8) and binary quantized vectors, at several oversampling factors, with and
+# without rescoring against the original vectors.
+#
+# By default a sample of the configured law_docs collection is copied into temporary
+# collections on the same Qdrant server, and queries are built from the sampled chunks'
+# snippets, so the numbers reflect our data and Qdrant's own quantized index. Qdrant's
+# local mode ignores quantization, so --offline simulates it in NumPy on synthetic dense
+# vectors shaped like sentence embeddings instead: unrelated vectors score about 0.45,
+# vectors on the same topic about 0.6 and on the same subtopic about 0.8, and dimensions
+# differ in spread. The hashed stand-in embeddings from benchmarks/fakes.py are sparse
+# and would misstate recall.
+#
+#   python -m benchmarks.quantization --points 20000 --oversampling 1 2 4
+#   python -m benchmarks.quantization --offline --vectors 20000
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient, models
+
+from app.knowledge_base.local_index import normalize_rows
+from app.knowledge_base.vector_search import collection_config
+
+load_dotenv()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)] if ordered else 0.0
+
+
+def vector_memory(kind, count, dim):
+    # Bytes kept in RAM for the vectors; with quantization the float32 originals are on disk
+    if kind == 'scalar':
+        return count * dim
+    if kind == 'binary':
+        return count * math.ceil(dim / 8)
+    return count * dim * 4
+
+
+def report(rows, count, dim, k):
+    print(f"\n{count} points, {dim} dimensions, recall@{k} against exact float32 search")
+    print(f"  {'storage':<8} {'oversampling':>12} {'rescore':>8} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'RAM MiB':>8}")
+    for row in rows:
+        print(f"  {row['kind']:<8} {row['oversampling']:>12} {str(row['rescore']):>8} {row['recall']:>7.3f} "
+              f"{row['p50'] * 1000:>8.2f} {row['p95'] * 1000:>8.2f} {vector_memory(row['kind'], count, dim) / 2 ** 20:>8.1f}")
+
+
+def configurations(kinds, oversampling):
+    for kind in kinds:
+        if kind == 'none':
+            yield kind, 1.0, False
+            continue
+        # Without rescoring, oversampling only changes which quantized scores are returned
+        yield kind, 1.0, False
+        for factor in oversampling:
+            yield kind, factor, True
+
+
+def recall(results, exact, k):
+    return sum(len(set(found[:k]) & set(expected[:k])) for found, expected in zip(results, exact)) / (k * len(exact))
+
+
+def run_server(args):
+    from llama_index.embeddings.fastembed import FastEmbedEmbedding
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    points, offset = [], None
+    while len(points) < args.points:
+        batch, offset = client.scroll(collection_name=args.collection, limit=min(1000, args.points - len(points)),
+                                      offset=offset, with_vectors=True, with_payload=['snippet', '_node_content'])
+        points += batch
+        if offset is None:
+            break
+    vectors = [point.vector if not isinstance(point.vector, dict) else next(iter(point.vector.values())) for point in points]
+    dim = len(vectors[0])
+
+    rng = random.Random(11)
+    embed_model = FastEmbedEmbedding(model_name=args.model)
+    queries = []
+    for point in rng.sample(points, min(args.queries, len(points))):
+        text = (point.payload or {}).get('snippet') or json.loads((point.payload or {}).get('_node_content') or '{}').get('text', '')
+        queries.append(embed_model.get_query_embedding(text[:200]))
+
+    names = {}
+    for kind in args.kinds:
+        name = names[kind] = f"{args.collection}_bench_{kind}"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        client.create_collection(collection_name=name, **collection_config(dim, quantization=kind))
+        for start in range(0, len(points), 256):
+            client.upsert(collection_name=name, points=[
+                models.PointStruct(id=point.id, vector=vector)
+                for point, vector in zip(points[start:start + 256], vectors[start:start + 256])
+            ])
+        wait_until_indexed(client, name, len(points))
+
+    exact_name = names.get('none') or next(iter(names.values()))
+    exact = [
+        [point.id for point in client.query_points(exact_name, query=query, limit=args.k,
+                                                   search_params=models.SearchParams(exact=True)).points]
+        for query in queries
+    ]
+
+    rows = []
+    for kind, factor, rescore in configurations(args.kinds, args.oversampling):
+        params = None
+        if kind != 'none':
+            params = models.SearchParams(quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=factor))
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            found = client.query_points(names[kind], query=query, limit=args.k, search_params=params).points
+            latencies.append(time.perf_counter() - start)
+            results.append([point.id for point in found])
+        rows.append({'kind': kind, 'oversampling': factor, 'rescore': rescore, 'recall': recall(results, exact, args.k),
+                     'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95)})
+
+    if not args.keep:
+        for name in names.values():
+            client.delete_collection(name)
+    report(rows, len(points), dim, args.k)
+
+
+def wait_until_indexed(client, name, count, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get_collection(name)
+        if info.status == models.CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= count * 0.99:
+            return
+        time.sleep(1)
+    logging.warning(f"{name} is not fully indexed after {timeout}s; results may include unindexed segments")
+
+
+def simulate_scores(kind, matrix, query):
+    if kind == 'scalar':
+        # Like Qdrant: one int8 range for the whole collection, clipped at the 0.99 quantile
+        low, high = np.quantile(matrix, [0.005, 0.995])
+        scale = (high - low) / 255
+        quantized = np.round((np.clip(matrix, low, high) - low) / scale)
+        return (quantized * scale + low) @ query
+    if kind == 'binary':
+        return np.where(matrix > 0, 1.0, -1.0) @ np.where(query > 0, 1.0, -1.0)
+    return matrix @ query
+
+
+def synthetic_embeddings(count, rng, shared, topics, subtopics, scales):
+    # Each vector mixes a direction shared by all texts, its topic's and subtopic's centres and
+    # its own noise; the weights set the typical cosine of unrelated and related vectors
+    picked = rng.integers(len(subtopics), size=count)
+    vectors = (np.sqrt(0.45) * shared + np.sqrt(0.15) * topics[picked % len(topics)]
+               + np.sqrt(0.2) * subtopics[picked] + np.sqrt(0.2) * rng.normal(size=(count, len(scales))) * scales)
+    return normalize_rows(vectors.astype(np.float32))
+
+
+def run_offline(args):
+    rng = np.random.default_rng(7)
+    scales = rng.lognormal(0.0, 0.5, args.dim)
+    shared = rng.normal(size=args.dim) * scales
+    topics = rng.normal(size=(args.topics, args.dim)) * scales
+    subtopics = rng.normal(size=(args.topics * 8, args.dim)) * scales
+    matrix = synthetic_embeddings(args.vectors, rng, shared, topics, subtopics, scales)
+    queries = synthetic_embeddings(args.queries, rng, shared, topics, subtopics, scales)
+    exact = [list(np.argsort(-(matrix @ query))[:args.k]) for query in queries]
+
+    # Quantized scores are computed once per storage type; only the candidate selection is timed
+    approximate = {kind: [simulate_scores(kind, matrix, query) for query in queries] for kind in args.kinds}
+    rows = []
+    for kind, factor, rescore in configurations(args.kinds, args.oversampling):
+        results, latencies = [], []
+        for query, scores in zip(queries, approximate[kind]):
+            start = time.perf_counter()
+            candidates = np.argsort(-scores)[:int(args.k * factor)]
+            if rescore:
+                candidates = candidates[np.argsort(-(matrix[candidates] @ query))]
+            latencies.append(time.perf_counter() - start)
+            results.append(list(candidates[:args.k]))
+        rows.append({'kind': kind, 'oversampling': factor, 'rescore': rescore, 'recall': recall(results, exact, args.k),
+                     'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95)})
+    report(rows, len(matrix), matrix.shape[1], args.k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall, latency and memory of quantized law_docs vectors')
+    parser.add_argument('--collection', default='law_docs')
+    parser.add_argument('--points', type=int, default=20000, help='points copied from the collection')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--kinds', nargs='+', choices=['none', 'scalar', 'binary'], default=['none', 'scalar', 'binary'])
+    parser.add_argument('--oversampling', type=float, nargs='+', default=[1.0, 2.0, 4.0])
+    parser.add_argument('--model', default='BAAI/bge-small-en-v1.5', help='FastEmbed model the queries are embedded with')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark collections')
+    parser.add_argument('--offline', action='store_true', help='simulate quantization on synthetic dense vectors')
+    parser.add_argument('--vectors', type=int, default=10000, help='synthetic vectors with --offline')
+    parser.add_argument('--dim', type=int, default=384, help='dimensions of the synthetic vectors')
+    parser.add_argument('--topics', type=int, default=64, help='topics among the synthetic vectors, each with 8 subtopics')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.offline:
+        run_offline(args)
+    else:
+        run_server(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# benchmarks/query_pipeline.py
+#
+# Offline benchmark of IntegratedKnowledgeBaseQuery.query_knowledge_base against the
+# in-process stand-ins in benchmarks/fakes.py. Reports p50/p95/p99 latency per stage and
+# end to end, and throughput at each concurrency level.
+#
+#   python -m benchmarks.query_pipeline --concurrency 1 8 --save baseline.json
+#   python -m benchmarks.query_pipeline --concurrency 1 8 --compare baseline.json
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import build_offline_kb, sample_queries
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values) if values else 0.0,
+    }
+
+
+class StageRecorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+
+def instrument(kb_query, recorder):
+    # Wrap the pipeline stages on this instance only; the class is left untouched
+    retrieve = kb_query.retrieve
+    generate_llm_response = kb_query.generate_llm_response
+
+    def timed_retrieve(query):
+        start = time.perf_counter()
+        retrieved = retrieve(query)
+        recorder.record('retrieve', time.perf_counter() - start)
+        for branch, timing in retrieved['timings'].items():
+            recorder.record(f"retrieve.{branch}", timing['seconds'])
+        return retrieved
+
+    def timed_generate(*args, **kwargs):
+        start = time.perf_counter()
+        response = generate_llm_response(*args, **kwargs)
+        recorder.record('llm', time.perf_counter() - start)
+        return response
+
+    kb_query.retrieve = timed_retrieve
+    kb_query.generate_llm_response = timed_generate
+
+
+def run_level(kb_query, queries, concurrency, recorder):
+    recorder.reset()
+
+    def run(query):
+        start = time.perf_counter()
+        kb_query.query_knowledge_base(query)
+        recorder.record('end_to_end', time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, queries))
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'queries': len(queries),
+        'wall_seconds': wall,
+        'throughput_qps': len(queries) / wall if wall else 0.0,
+        'stages': {stage: summarize(values) for stage, values in sorted(recorder.samples.items())},
+    }
+
+
+def print_level(result):
+    print(f"\nconcurrency {result['concurrency']}: {result['queries']} queries in {result['wall_seconds']:.2f}s "
+          f"({result['throughput_qps']:.2f} q/s)")
+    print(f"  {'stage':<18} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in result['stages'].items():
+        print(f"  {stage:<18} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} "
+              f"{stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}")
+
+
+def compare(results, baseline, tolerance):
+    # Flags any stage whose p95 grew, or any level whose throughput dropped, by more than the tolerance
+    regressions = []
+    baseline_levels = {level['concurrency']: level for level in baseline['levels']}
+    for level in results['levels']:
+        previous = baseline_levels.get(level['concurrency'])
+        if previous is None:
+            continue
+        for stage, stats in level['stages'].items():
+            before = previous['stages'].get(stage)
+            if before and before['p95'] > 0 and stats['p95'] > before['p95'] * (1 + tolerance):
+                regressions.append(
+                    f"concurrency {level['concurrency']} {stage} p95 "
+                    f"{before['p95'] * 1000:.1f}ms -> {stats['p95'] * 1000:.1f}ms"
+                )
+        if level['throughput_qps'] < previous['throughput_qps'] * (1 - tolerance):
+            regressions.append(
+                f"concurrency {level['concurrency']} throughput "
+                f"{previous['throughput_qps']:.2f} -> {level['throughput_qps']:.2f} q/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the knowledge base query pipeline')
+    parser.add_argument('--cases', type=int, default=500, help='synthetic cases in the graph and law_docs')
+    parser.add_argument('--queries', type=int, default=100, help='queries per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--mode', choices=['single', 'router'], default='single', help='KB_SYNTHESIS_MODE')
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--llm-token-latency', type=float, default=0.002, help='seconds per generated token')
+    parser.add_argument('--answer-tokens', type=int, default=120)
+    parser.add_argument('--graph-latency', type=float, default=0.01, help='seconds per Neo4j round trip')
+    parser.add_argument('--vector-latency', type=float, default=0.01, help='seconds per Qdrant round trip')
+    parser.add_argument('--embed-latency', type=float, default=0.005, help='seconds per embedding call')
+    parser.add_argument('--answer-cache', action='store_true', help='leave the semantic answer cache enabled')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before failing')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ['KB_SYNTHESIS_MODE'] = args.mode
+    if not args.answer_cache:
+        os.environ['KB_ANSWER_CACHE'] = 'false'
+
+    kb_query, cases = build_offline_kb(
+        num_cases=args.cases,
+        llm_latency=args.llm_latency,
+        llm_token_latency=args.llm_token_latency,
+        answer_tokens=args.answer_tokens,
+        graph_latency=args.graph_latency,
+        vector_latency=args.vector_latency,
+        embed_latency=args.embed_latency,
+    )
+    queries = sample_queries(cases, args.queries)
+    recorder = StageRecorder()
+    instrument(kb_query, recorder)
+
+    results = {'config': vars(args), 'levels': []}
+    for concurrency in args.concurrency:
+        level = run_level(kb_query, queries, concurrency, recorder)
+        results['levels'].append(level)
+        print_level(level)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
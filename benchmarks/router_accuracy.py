@@ -0,0 +1,98 @@
+# benchmarks/router_accuracy.py
+#
+# Accuracy and latency of the local query router on labelled queries: the share of
+# queries routed to exactly the labelled tools, the share left to the LLM selector at the
+# threshold calibrated from the exemplars (and any --threshold given), and the accuracy of
+# the confident decisions alone.
+#
+# Labels come from a JSONL file of {"query": ..., "tools": ["graph", "vector"]} lines, for
+# example the router decision log after review, or from templates over the synthetic
+# corpus in benchmarks/fakes.py.
+#
+#   python -m benchmarks.router_accuracy --model BAAI/bge-small-en-v1.5
+#   python -m benchmarks.router_accuracy --labels reviewed_decisions.jsonl --threshold 0.7 0.75 0.8 --calibration 0.1
+
+import argparse
+import json
+import logging
+import random
+import time
+
+from benchmarks.fakes import HashEmbedding, build_corpus
+from app.knowledge_base.query_router import LocalQueryRouter, load_exemplars
+
+
+def labelled_queries(cases, count, seed=11):
+    rng = random.Random(seed)
+    templates = [
+        (['graph'], lambda case: f"Cases involving Judge {rng.choice(case['judges'])}"),
+        (['graph'], lambda case: f"Which attorneys represented {case['plaintiff']}?"),
+        (['graph'], lambda case: f"Which court heard {case['case_name']}?"),
+        (['vector'], lambda case: f"Explain the {case['topic']} precedents from the {case['court']['short_name']} court"),
+        (['vector'], lambda case: f"What is the legal standard applied in {case['topic']} disputes?"),
+        (['graph', 'vector'], lambda case: f"Summarize opinions written by Judge {case['author']} about {case['topic']}"),
+    ]
+    return [(tools, template(rng.choice(cases))) for tools, template in (rng.choice(templates) for _ in range(count))]
+
+
+def read_labels(path):
+    with open(path) as f:
+        return [(sorted(record['tools']), record['query']) for record in map(json.loads, filter(str.strip, f))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy of the local query router on labelled queries')
+    parser.add_argument('--labels', help='JSONL file of {"query", "tools"} records; synthetic queries otherwise')
+    parser.add_argument('--cases', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--threshold', type=float, nargs='+', default=[], help='fixed thresholds to compare')
+    parser.add_argument('--calibration', type=float, default=0.25, help='exemplar score quantile the threshold is calibrated to')
+    parser.add_argument('--margin', type=float, default=0.02)
+    parser.add_argument('--exemplars', help='JSON file of {route: [queries]}; the built-in exemplars otherwise')
+    parser.add_argument('--model', help='FastEmbed model to embed with instead of the hashed stand-in')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.model:
+        from llama_index.embeddings.fastembed import FastEmbedEmbedding
+        embed_model = FastEmbedEmbedding(model_name=args.model)
+    else:
+        embed_model = HashEmbedding()
+    if args.labels:
+        queries = read_labels(args.labels)
+        entity_extractor = None
+    else:
+        cases = build_corpus(args.cases)
+        queries = labelled_queries(cases, args.queries)
+        # Stands in for graph entity recognition: the corpus' judge, party and case names
+        names = {name for case in cases for name in [*case['judges'], case['plaintiff'], case['case_name']]}
+        entity_extractor = lambda query: [name for name in names if name in query]
+
+    router = LocalQueryRouter(embed_model, exemplars=load_exemplars(args.exemplars),
+                              entity_extractor=entity_extractor, margin=args.margin,
+                              calibration_quantile=args.calibration)
+    decisions, latencies = [], []
+    for tools, query in queries:
+        start = time.perf_counter()
+        decision = router.route(query)
+        latencies.append(time.perf_counter() - start)
+        decisions.append((sorted(tools), sorted(decision['tools']), decision['confidence']))
+
+    latencies.sort()
+    print(f"{len(queries)} queries, {latencies[len(latencies) // 2] * 1000:.2f} ms p50, "
+          f"{latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms p95 per decision")
+    correct = sum(expected == chosen for expected, chosen, _ in decisions)
+    print(f"local decisions: {correct / len(decisions):.3f} accuracy")
+    for label in sorted({'+'.join(expected) for expected, _, _ in decisions}):
+        subset = [(expected, chosen) for expected, chosen, _ in decisions if '+'.join(expected) == label]
+        print(f"  {label:<13} {sum(e == c for e, c in subset) / len(subset):.3f} accuracy ({len(subset)} queries)")
+    for index, threshold in enumerate([router.threshold, *args.threshold]):
+        confident = [(expected, chosen) for expected, chosen, confidence in decisions if confidence >= threshold]
+        accuracy = sum(e == c for e, c in confident) / len(confident) if confident else 0.0
+        label = '' if index else 'calibrated '
+        print(f"{label}threshold {threshold:.3f}: {1 - len(confident) / len(decisions):.3f} sent to the LLM selector, "
+              f"{accuracy:.3f} accuracy on the rest")
+
+
+if __name__ == '__main__':
+    main()
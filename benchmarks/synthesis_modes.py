@@ -0,0 +1,85 @@
+# benchmarks/synthesis_modes.py
+#
+# Compares LLM calls per query and end-to-end latency for the 'single' and 'router'
+# synthesis modes of IntegratedKnowledgeBaseQuery.query_datastores.
+#
+#   python -m benchmarks.synthesis_modes --repeat 3
+#   python -m benchmarks.synthesis_modes --offline
+
+import argparse
+import os
+import statistics
+import time
+
+from llama_index.core.callbacks import TokenCountingHandler
+
+from app.knowledge_base.integrated_kb_query import IntegratedKnowledgeBaseQuery
+from benchmarks.fakes import build_offline_kb
+
+DEFAULT_QUERIES = [
+    'Cases involving Judge Molley',
+    'What did the court decide in Smith v. Jones Corporation?',
+    'Which attorneys represented the plaintiff in contract disputes?',
+]
+
+
+def run_mode(kb_query, mode, queries, repeat, token_counter):
+    kb_query.synthesis_mode = mode
+    latencies = []
+    llm_calls = []
+    prompt_tokens = []
+    completion_tokens = []
+    for _ in range(repeat):
+        for query in queries:
+            token_counter.reset_counts()
+            start = time.perf_counter()
+            kb_query.query_datastores(query)
+            latencies.append(time.perf_counter() - start)
+            llm_calls.append(len(token_counter.llm_token_counts))
+            prompt_tokens.append(token_counter.prompt_llm_token_count)
+            completion_tokens.append(token_counter.completion_llm_token_count)
+    return {
+        'mode': mode,
+        'queries': len(latencies),
+        'llm_calls': statistics.mean(llm_calls),
+        'prompt_tokens': statistics.mean(prompt_tokens),
+        'completion_tokens': statistics.mean(completion_tokens),
+        'p50': statistics.median(latencies),
+        'max': max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare LLM calls and latency per synthesis mode')
+    parser.add_argument('--modes', nargs='+', default=['single', 'router'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+    parser.add_argument('--offline', action='store_true', help='use the in-process stand-ins from benchmarks/fakes.py')
+    args = parser.parse_args()
+
+    # The answer cache would serve repeats without any LLM call
+    os.environ['KB_ANSWER_CACHE'] = 'false'
+    # The local router is only built in router mode; each run below switches the mode itself
+    if 'router' in args.modes:
+        os.environ['KB_SYNTHESIS_MODE'] = 'router'
+    if args.offline:
+        kb_query, _ = build_offline_kb(llm_latency=0.2, graph_latency=0.01, vector_latency=0.01)
+    else:
+        kb_query = IntegratedKnowledgeBaseQuery()
+    # Every LLM call in the pipeline (selector, sub-engines, summarizer, final prompt) goes through kb_query.llm
+    token_counter = TokenCountingHandler()
+    kb_query.llm.callback_manager.add_handler(token_counter)
+
+    results = [run_mode(kb_query, mode, args.queries, args.repeat, token_counter) for mode in args.modes]
+
+    print(f"{'mode':<8} {'queries':>7} {'llm calls/q':>11} {'prompt tok':>10} {'compl tok':>9} {'p50 s':>7} {'max s':>7}")
+    for result in results:
+        print(
+            f"{result['mode']:<8} {result['queries']:>7} {result['llm_calls']:>11.1f} "
+            f"{result['prompt_tokens']:>10.0f} {result['completion_tokens']:>9.0f} "
+            f"{result['p50']:>7.2f} {result['max']:>7.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# tests/conftest.py
+
+import pytest
+
+
+@pytest.fixture
+def offline_kb(monkeypatch):
+    # The knowledge base over the in-process stand-ins from benchmarks/fakes.py
+    from benchmarks.fakes import build_offline_kb
+
+    def build(num_cases=50, **kwargs):
+        return build_offline_kb(num_cases=num_cases, **kwargs)
+
+    monkeypatch.setenv('KB_DATA_VERSION_INTERVAL', '0')
+    return build
@@ -0,0 +1,78 @@
+# tests/test_answer_cache.py
+
+import numpy as np
+
+from app.knowledge_base.answer_cache import SemanticAnswerCache, source_ids
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_hit_needs_similarity_and_the_same_entities():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("opinions by Judge Molley", unit(1, 0.1, 0), "molley", [], entities=['Molley', 'Supreme Court of Ohio'])
+
+    assert cache.lookup(unit(1, 0.1, 0), ['supreme court of  ohio', 'MOLLEY'])['answer'] == "molley"
+    assert cache.lookup(unit(1, 0.1, 0), ['Harlan', 'Supreme Court of Ohio']) is None
+    assert cache.lookup(unit(1, 0.1, 0), ['Molley']) is None
+    assert cache.lookup(unit(0, 1, 0), ['Molley', 'Supreme Court of Ohio']) is None
+
+
+def test_lookup_skips_a_closer_entry_about_other_entities():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("Harlan", unit(1, 0, 0), "harlan", [], entities=['Harlan'])
+    cache.store("Molley", unit(1, 0.2, 0), "molley", [], entities=['Molley'])
+
+    assert cache.lookup(unit(1, 0, 0), ['Molley'])['answer'] == "molley"
+
+
+def test_document_sources_are_invalidated_by_case_and_document_id():
+    sources = [
+        {'type': 'case', 'id': 'case-1', 'name': 'A v. B'},
+        {'type': 'document', 'id': 'point-uuid', 'case_id': 'case-2', 'doc_id': 'case-2', 'name': 'C v. D'},
+    ]
+    assert source_ids(sources) == ['case-1', 'point-uuid', 'case-2']
+
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("q", unit(1, 0, 0), "answer", sources)
+    cache.invalidate_sources(['case-2'])
+    assert cache.lookup(unit(1, 0, 0)) is None
+
+
+def test_entries_and_entities_survive_a_restart(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    SemanticAnswerCache(threshold=0.9, path=path).store("q", unit(1, 0, 0), "answer", [], entities=['Molley'])
+
+    cache = SemanticAnswerCache(threshold=0.9, path=path)
+    assert cache.lookup(unit(1, 0, 0), ['Molley'])['answer'] == "answer"
+    assert cache.lookup(unit(1, 0, 0), ['Harlan']) is None
+
+
+def test_recent_use_survives_a_restart(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=2, path=path)
+    cache.store("a", unit(1, 0, 0), "a", [])
+    cache.store("b", unit(0, 1, 0), "b", [])
+    assert cache.lookup(unit(1, 0, 0))['answer'] == "a"
+
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=2, path=path)
+    cache.store("c", unit(0, 0, 1), "c", [])
+    assert cache.lookup(unit(1, 0, 0))['answer'] == "a"
+    assert cache.lookup(unit(0, 1, 0)) is None
+
+
+def test_expired_entries_are_not_served():
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60)
+    cache.store("q", unit(1, 0, 0), "answer", [])
+    cache._entries[cache._ids[0]]['created_at'] -= 120
+    assert cache.lookup(unit(1, 0, 0)) is None
+
+
+def test_data_version_change_clears_the_cache():
+    cache = SemanticAnswerCache(threshold=0.9)
+    assert cache.set_data_version("1") is False
+    cache.store("q", unit(1, 0, 0), "answer", [])
+    assert cache.set_data_version("2") is True
+    assert cache.lookup(unit(1, 0, 0)) is None
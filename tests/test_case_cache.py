@@ -0,0 +1,74 @@
+# tests/test_case_cache.py
+
+from app.knowledge_base import case_cache as case_cache_module
+from app.knowledge_base.case_cache import CaseDetailsCache
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(case_cache_module.time, 'time', lambda: now[0])
+    cache = CaseDetailsCache(ttl=60)
+    cache.put_many({'case-1': {'name': 'Harlan v. Molley'}})
+
+    now[0] += 59
+    assert cache.get_many(['case-1']) == {'case-1': {'name': 'Harlan v. Molley'}}
+    now[0] += 2
+    assert cache.get_many(['case-1']) == {}
+    assert cache.stats()['size'] == 0
+
+
+def test_invalidation_drops_the_given_cases_or_everything():
+    cache = CaseDetailsCache()
+    cache.put_many({'case-1': {}, 'case-2': {}, 'case-3': {}})
+
+    cache.invalidate(['case-1', 'case-9'])
+    assert set(cache.get_many(['case-1', 'case-2', 'case-3'])) == {'case-2', 'case-3'}
+    cache.invalidate()
+    assert cache.get_many(['case-2', 'case-3']) == {}
+    assert cache.stats()['invalidations'] == 3
+
+
+def test_records_fetched_before_an_invalidation_are_not_stored():
+    cache = CaseDetailsCache()
+
+    def fetch(case_ids):
+        cache.invalidate()
+        return {case_id: {'name': case_id} for case_id in case_ids}
+
+    assert cache.get_or_fetch(['case-1'], fetch) == {'case-1': {'name': 'case-1'}}
+    assert cache.stats()['size'] == 0
+    cache.get_or_fetch(['case-1'], lambda case_ids: {case_id: {'name': case_id} for case_id in case_ids})
+    assert cache.stats()['size'] == 1
+
+
+def test_data_version_change_during_a_lookup_discards_its_records(offline_kb, monkeypatch):
+    kb_query, cases = offline_kb(num_cases=10)
+    version = ['v1']
+    monkeypatch.setattr(kb_query, 'data_version', lambda: version[0])
+    fetch = kb_query.fetch_case_records
+
+    def fetch_during_ingestion(case_ids):
+        records = fetch(case_ids)
+        version[0] = 'v2'
+        kb_query.refresh_data_version(force=True)
+        return records
+
+    monkeypatch.setattr(kb_query, 'fetch_case_records', fetch_during_ingestion)
+    records = kb_query.case_records([cases[0]['id']])
+    assert records[cases[0]['id']]['name'] == cases[0]['case_name']
+    assert kb_query.case_cache.stats()['size'] == 0
+
+    monkeypatch.setattr(kb_query, 'fetch_case_records', fetch)
+    kb_query.case_records([cases[0]['id']])
+    assert kb_query.case_cache.stats()['size'] == 1
+
+
+def test_prefetch_fills_the_cache(offline_kb):
+    kb_query, cases = offline_kb(num_cases=20)
+    kb_query.case_cache.invalidate()
+
+    kb_query.warm_case_cache(8, batch_size=3)
+    assert kb_query.case_cache.stats()['size'] == 8
+    hits = kb_query.case_cache.stats()['hits']
+    kb_query.case_records([case['id'] for case in cases])
+    assert kb_query.case_cache.stats()['hits'] == hits + 8
@@ -0,0 +1,36 @@
+# tests/test_context_budget.py
+
+from app.knowledge_base.context_budget import ContextBudget
+
+
+def budget(max_tokens, **kwargs):
+    return ContextBudget(max_tokens=max_tokens, tokenizer=str.split, **kwargs)
+
+
+def test_items_fit_the_budget_best_first_in_their_original_order():
+    sections = {
+        'vector': ["weather report " * 15, "promissory estoppel requires reliance " * 5],
+        'graph': ["Judge Molley presided over Harlan v. Molley"],
+    }
+    kept, used = budget(40, min_item_tokens=25).fit("promissory estoppel reliance", sections)
+
+    assert kept['vector'] == ["promissory estoppel requires reliance " * 5]
+    assert kept['graph'] == sections['graph']
+    assert used == 20 + 7
+
+
+def test_duplicates_are_kept_once_and_the_last_item_is_truncated():
+    text = "estoppel " * 30
+    sections = {'vector': [text, text.upper()], 'case_details': ["reliance " * 30]}
+    kept, used = budget(40, min_item_tokens=5).fit("estoppel", sections)
+
+    assert kept['vector'] == [text]
+    assert len(kept['case_details']) == 1 and kept['case_details'][0].endswith("...")
+    assert 35 <= used <= 40
+
+
+def test_prompt_text_and_answer_reserve_come_out_of_the_window():
+    context = budget(3000, context_window=100, reserve_tokens=40)
+    assert context.available() == 60
+    assert context.available("one two three four five") == 55
+    assert budget(3000, context_window=10, reserve_tokens=40).available() == 0
@@ -0,0 +1,82 @@
+# tests/test_conversation_store.py
+
+import threading
+import time
+
+from app.knowledge_base.conversation_store import ConversationStore
+
+
+def test_relevant_turns_score_the_earlier_question_separately():
+    store = ConversationStore()
+    store.add_turn('c', 'Who decided Harlan v. Molley?', 'Judge Brennan decided it; damages were awarded for breach.')
+
+    turns = store.relevant_turns('c', 'What damages?')
+    assert turns[0]['score'] == 1.0
+    assert turns[0]['query_score'] == 0.0
+
+    repeat = store.relevant_turns('c', 'who decided harlan v molley')
+    assert repeat[0]['query_score'] == 1.0
+
+
+def test_short_follow_up_does_not_skip_retrieval(offline_kb):
+    kb_query, _ = offline_kb()
+    context = {'turns': [{'query': 'Who decided Harlan v. Molley?', 'response': 'Damages were awarded.',
+                          'score': 1.0, 'query_score': 0.0}], 'summary': ''}
+    assert not kb_query.can_use_previous_context('What damages?', context)
+    context['turns'][0]['query_score'] = 1.0
+    assert kb_query.can_use_previous_context('Who decided Harlan v. Molley?', context)
+
+
+def test_old_turns_fold_into_the_summary_and_leave_the_index():
+    store = ConversationStore(max_turns=2)
+    for i in range(4):
+        store.add_turn('c', f"question{i} topic{i}", f"answer{i}")
+    assert [turn['query'] for turn in store.history('c')] == ['question2 topic2', 'question3 topic3']
+    assert 'question0' in store.summary('c') and 'question1' in store.summary('c')
+    assert store.relevant_turns('c', 'topic0') == []
+
+
+def test_concurrent_folds_keep_every_turn():
+    def slow_summarizer(summary, turn):
+        time.sleep(0.01)
+        return f"{summary} {turn['query']}".strip()
+
+    store = ConversationStore(max_turns=1, summarizer=slow_summarizer, summary_chars=10000)
+    threads = [threading.Thread(target=store.add_turn, args=('c', f"q{i}", 'a')) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    folded = store.summary('c').split()
+    remaining = [turn['query'] for turn in store.history('c')]
+    assert sorted(folded + remaining) == sorted(f"q{i}" for i in range(20))
+
+
+def test_failed_summaries_are_retried_on_the_next_fold():
+    calls = []
+
+    def flaky(summary, turn):
+        calls.append(turn['query'])
+        if len(calls) == 1:
+            raise RuntimeError('LLM unavailable')
+        return f"{summary} {turn['query']}".strip()
+
+    store = ConversationStore(max_turns=1, summarizer=flaky)
+    store.add_turn('c', 'q0', 'a')
+    try:
+        store.add_turn('c', 'q1', 'a')
+    except RuntimeError:
+        pass
+    store.add_turn('c', 'q2', 'a')
+    assert store.summary('c') == 'q0 q1'
+
+
+def test_conversations_expire_and_are_bounded():
+    store = ConversationStore(max_conversations=2, ttl=0.05)
+    for conversation_id in ('a', 'b', 'c'):
+        store.add_turn(conversation_id, 'question', 'answer')
+    assert store.stats()['conversations'] == 2
+    assert store.history('a') == []
+    time.sleep(0.1)
+    assert store.history('c') == []
@@ -0,0 +1,58 @@
+# tests/test_embedding_cache.py
+
+from benchmarks.fakes import HashEmbedding
+from app.knowledge_base.embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class CountingEmbedding(HashEmbedding):
+    calls: int = 0
+
+    def get_query_embedding_batch(self, queries):
+        self.calls += 1
+        return [self._embed(query) for query in queries]
+
+
+def test_batch_counts_one_hit_or_miss_per_query():
+    base = CountingEmbedding()
+    cache = EmbeddingCache(max_size=10)
+    embed_model = CachedEmbedding(base, cache)
+
+    embed_model.get_query_embedding('Cases involving Judge Molley')
+    embed_model.get_query_embedding_batch(['cases involving  judge molley', 'Harlan v. Molley', 'Harlan v. Molley'])
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+    assert base.calls == 1
+
+
+def test_batch_larger_than_the_cache_returns_every_embedding():
+    base = CountingEmbedding()
+    cache = EmbeddingCache(max_size=2)
+    queries = [f"query {i}" for i in range(5)]
+
+    embeddings = CachedEmbedding(base, cache).get_query_embedding_batch(queries)
+    assert embeddings == [base._embed(query) for query in queries]
+    assert base.calls == 1
+    assert cache.stats()['size'] == 2
+
+
+def test_cache_round_trips_through_its_file(tmp_path):
+    path = str(tmp_path / 'embeddings.npz')
+    cache = EmbeddingCache(path=path, model_name='hash')
+    cache.put('Harlan v. Molley', [0.5, 0.25])
+    cache.save()
+
+    assert EmbeddingCache(path=path, model_name='hash').get_many(['harlan v. molley']) == {'harlan v. molley': [0.5, 0.25]}
+    assert EmbeddingCache(path=path, model_name='other').stats()['size'] == 0
+
+
+def test_cache_is_saved_after_every_batch_of_new_entries(tmp_path):
+    path = tmp_path / 'embeddings.npz'
+    cache = EmbeddingCache(path=str(path), model_name='hash', save_every=3)
+    embed_model = CachedEmbedding(CountingEmbedding(), cache)
+
+    embed_model.get_query_embedding_batch(['query 0', 'query 1'])
+    assert not path.exists()
+    embed_model.get_query_embedding('query 2')
+    assert EmbeddingCache(path=str(path), model_name='hash').stats()['size'] == 3
+    # Each process swaps in its own temporary file
+    assert [file.name for file in tmp_path.iterdir()] == ['embeddings.npz']
@@ -0,0 +1,54 @@
+# tests/test_engine.py
+
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.knowledge_base import engine
+from app.knowledge_base import integrated_kb_query
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    for name in ('_kb_query', '_init_error', '_init_started', '_init_seconds', '_warmup_thread'):
+        monkeypatch.setattr(engine, name, None)
+    built = []
+
+    class SlowKnowledgeBase:
+        def __init__(self):
+            time.sleep(0.2)
+            built.append(self)
+
+    monkeypatch.setattr(integrated_kb_query, 'IntegratedKnowledgeBaseQuery', SlowKnowledgeBase)
+    return built
+
+
+def test_concurrent_callers_build_the_engine_once(fresh_engine):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(engine.get_kb_query())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(fresh_engine) == 1
+    assert len(results) == 8 and all(result is fresh_engine[0] for result in results)
+
+
+def test_ready_returns_503_until_warm_up_finishes(fresh_engine, monkeypatch):
+    monkeypatch.setenv('KB_WARMUP', 'false')
+    client = create_app().test_client()
+
+    response = client.get('/ready')
+    assert response.status_code == 503 and response.get_json()['status'] == 'not_started'
+
+    engine.warm_up(background=True)
+    response = client.get('/ready')
+    assert response.status_code == 503 and response.get_json()['status'] == 'initializing'
+
+    engine._warmup_thread.join(5)
+    response = client.get('/ready')
+    assert response.status_code == 200 and response.get_json()['status'] == 'ready'
+    assert len(fresh_engine) == 1
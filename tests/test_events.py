@@ -0,0 +1,78 @@
+# tests/test_events.py
+
+import threading
+
+from app.main import events
+from app.main.dispatcher import QueryDispatcher
+
+
+def recorder(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(events.socketio, 'emit', lambda event, data, to=None: emitted.append((event, data)))
+    monkeypatch.setattr(events.socketio, 'sleep', lambda seconds: None)
+    return emitted
+
+
+def answer_events(emitted):
+    return [event for event, _ in emitted if event in ('response_chunk', 'response_end', 'response', 'query_error')]
+
+
+def test_cancel_during_retrieval_sends_nothing(offline_kb, monkeypatch):
+    kb_query, _ = offline_kb()
+    monkeypatch.setattr(events, 'get_kb_query', lambda: kb_query)
+    emitted = recorder(monkeypatch)
+    cancel_event = threading.Event()
+    retrieve = kb_query.retrieve
+
+    def retrieve_then_cancel(query, cancel_event=None):
+        retrieved = retrieve(query, cancel_event)
+        cancel_event.set()
+        return retrieved
+
+    monkeypatch.setattr(kb_query, 'retrieve', retrieve_then_cancel)
+    calls = kb_query.llm.calls
+    events.run_query('sid', 'r1', "Explain the negligence precedents", None, True, cancel_event)
+
+    assert answer_events(emitted) == []
+    assert kb_query.llm.calls == calls
+
+
+def test_cancel_while_waiting_for_the_first_token_sends_nothing(offline_kb, monkeypatch):
+    kb_query, _ = offline_kb(llm_latency=0.3)
+    monkeypatch.setattr(events, 'get_kb_query', lambda: kb_query)
+    emitted = recorder(monkeypatch)
+    cancel_event = threading.Event()
+
+    threading.Timer(0.1, cancel_event.set).start()
+    events.run_query('sid', 'r1', "Explain the negligence precedents", None, True, cancel_event)
+    assert answer_events(emitted) == []
+
+
+def test_cancelled_queued_query_never_runs(offline_kb, monkeypatch):
+    kb_query, _ = offline_kb()
+    monkeypatch.setattr(events, 'get_kb_query', lambda: kb_query)
+    emitted = recorder(monkeypatch)
+    dispatcher = QueryDispatcher(max_workers=1, max_queued=1, max_per_owner=0)
+    release = threading.Event()
+    busy = dispatcher.submit(lambda cancel_event: release.wait(5))
+    queued = dispatcher.submit(
+        lambda cancel_event: events.run_query('sid', 'r1', "Explain the negligence precedents", None, True, cancel_event),
+        job_id='sid:r1', owner='sid',
+    )
+
+    assert dispatcher.cancel('sid:r1', owner='sid')
+    release.set()
+    busy.future.result(timeout=5)
+    assert queued.future.cancelled() or queued.future.result(timeout=5) is None
+    assert answer_events(emitted) == []
+
+
+def test_uncancelled_query_streams_its_answer(offline_kb, monkeypatch):
+    kb_query, _ = offline_kb()
+    monkeypatch.setattr(events, 'get_kb_query', lambda: kb_query)
+    emitted = recorder(monkeypatch)
+    events.run_query('sid', 'r1', "Explain the negligence precedents", None, True, threading.Event())
+
+    assert answer_events(emitted)[-1] == 'response_end'
+    chunks = "".join(data['chunk'] for event, data in emitted if event == 'response_chunk')
+    assert chunks and chunks == emitted[-1][1]['response']
@@ -0,0 +1,45 @@
+# tests/test_gazetteer.py
+
+from app.knowledge_base.gazetteer import EntityGazetteer
+
+RECORDS = [
+    {'name': 'Harlan v. Molley', 'labels': ['Case'], 'aliases': []},
+    {'name': 'Molley', 'labels': ['Party'], 'aliases': []},
+    {'name': 'Acme Corporation', 'labels': ['Party'], 'aliases': ['Acme Widgets']},
+    {'name': 'Ruth Bader', 'labels': ['Judge'], 'aliases': []},
+    {'name': 'The', 'labels': ['Party'], 'aliases': []},
+]
+
+
+def gazetteer(path=None):
+    entities = EntityGazetteer(path)
+    entities.build(RECORDS, data_version='v1')
+    return entities
+
+
+def test_names_match_across_spellings():
+    entities = gazetteer()
+    assert entities.names("What did the court hold in harlan vs molley?") == ['Harlan v. Molley']
+    assert entities.names("Cases against Acme Corp. and ACME widgets") == ['Acme Corporation']
+    assert entities.names("Which cases did Justice Bader decide?") == ['Ruth Bader']
+    # A lone common word is not matched
+    assert entities.names("The court ruled for the plaintiff") == []
+
+
+def test_names_inside_a_longer_match_are_dropped():
+    matches = gazetteer().find("Harlan v. Molley and then Molley again")
+    assert [(match['name'], match['label'], match['start'], match['end']) for match in matches] == [
+        ('Harlan v. Molley', 'Case', 0, 2),
+        ('Molley', 'Party', 5, 5),
+    ]
+
+
+def test_snapshot_round_trips(tmp_path):
+    path = str(tmp_path / 'gazetteer.json')
+    gazetteer(path).save()
+
+    loaded = EntityGazetteer(path)
+    assert loaded.ready and len(loaded) == len(RECORDS)
+    assert loaded.data_version == 'v1'
+    assert loaded.names("harlan versus molley") == ['Harlan v. Molley']
+    assert not EntityGazetteer(str(tmp_path / 'missing.json')).ready
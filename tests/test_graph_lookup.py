@@ -0,0 +1,44 @@
+# tests/test_graph_lookup.py
+
+from benchmarks.fakes import sample_queries
+from app.knowledge_base.integrated_kb_query import build_fulltext_query
+
+
+def test_fulltext_query_escapes_lucene_syntax():
+    assert build_fulltext_query('Smith (Jr.) v. Jones: AT&T') == (
+        r'"Smith \(Jr.\) v. Jones\: AT&T"^2 OR (Smith~1 AND \(Jr.\)~1 AND v. AND Jones\:~1 AND AT&T~1)'
+    )
+    assert build_fulltext_query('a+b "c"') == r'"a\+b \"c\""^2 OR (a\+b AND \"c\")'
+
+
+def test_fulltext_query_keeps_keywords_as_terms():
+    assert build_fulltext_query('Smith OR Jones') == '"Smith or Jones"^2 OR (Smith~1 AND or AND Jones~1)'
+    assert build_fulltext_query('Bread AND Butter NOT Inc', fuzzy=False) == (
+        '"Bread and Butter not Inc"^2 OR (Bread AND and AND Butter AND not AND Inc)'
+    )
+
+
+def test_fulltext_query_short_and_empty_terms():
+    assert build_fulltext_query('Ng v. Li') == '"Ng v. Li"^2 OR (Ng AND v. AND Li)'
+    assert build_fulltext_query('Mary') == '"Mary"^2 OR (Mary~1)'
+    assert build_fulltext_query('   ') == '""'
+
+
+def test_batched_graph_lookups_match_per_entity_lookups(offline_kb, monkeypatch):
+    monkeypatch.setenv('KB_CASE_CACHE', 'false')
+    kb_query, cases = offline_kb(num_cases=40)
+    kb_query.entity_index_ready = False
+    queries = sample_queries(cases, 30) + [
+        f"Compare {cases[0]['case_name']} with {cases[1]['case_name']} before Judge {cases[0]['author']}",
+    ]
+
+    kb_query.graph_batched = True
+    batched = kb_query.graph_contexts(queries)
+    kb_query.graph_batched = False
+    single = [kb_query.graph_context(query) for query in queries]
+
+    assert all(context['graph_results'] for context in single)
+    assert sum(bool(context['case_details']) for context in single) > 0
+    for batched_context, single_context in zip(batched, single):
+        assert batched_context['graph_results'] == single_context['graph_results']
+        assert batched_context['case_details'] == single_context['case_details']
@@ -0,0 +1,79 @@
+# tests/test_ingestion.py
+
+import json
+
+import pytest
+from llama_index.vector_stores.qdrant.base import DEFAULT_DENSE_VECTOR_NAME
+from qdrant_client import QdrantClient
+
+from benchmarks.fakes import HashEmbedding, HashSparseEncoder, build_corpus
+from app.knowledge_base import ingestion as ingestion_module
+from app.knowledge_base.ingestion import IngestionPipeline, iter_documents
+
+
+class StreamingEmbedding(HashEmbedding):
+    streams: int = 0
+
+    def embed_stream(self, texts):
+        self.streams += 1
+        for text in texts:
+            yield self._embed(text)
+
+
+def pipeline(embed_model, client=None):
+    return IngestionPipeline(client or QdrantClient(location=':memory:'), embed_model,
+                             sparse_encoder=HashSparseEncoder(), batch_size=8, chunk_size=128, chunk_overlap=16)
+
+
+def test_one_embedding_stream_per_run():
+    embed_model = StreamingEmbedding()
+    ingestion = pipeline(embed_model)
+    stats = ingestion.run(build_corpus(30))
+
+    assert embed_model.streams == 1
+    assert stats['documents'] == 30
+    points, _ = ingestion.client.scroll('law_docs', limit=10000, with_vectors=True)
+    assert len(points) == stats['chunks_embedded']
+    # Each batch gets the vectors of its own chunks back from the shared stream
+    for point in points:
+        expected = embed_model._embed(json.loads(point.payload['_node_content'])['text'])
+        assert point.vector[DEFAULT_DENSE_VECTOR_NAME] == pytest.approx(expected, abs=1e-6)
+
+
+def test_batches_without_new_chunks_are_still_written():
+    cases = build_corpus(10)
+    ingestion = pipeline(HashEmbedding())
+    first = dict(ingestion.run(cases))
+
+    renamed = [dict(case, case_name=f"{case['case_name']} (renamed)") for case in cases]
+    stats = ingestion.run(renamed)
+    assert stats['documents'] == first['documents'] + 10
+    assert stats['chunks_embedded'] == first['chunks_embedded']
+    assert ingestion.plan(dict(renamed[0])) is None
+
+
+def test_unchanged_pdfs_are_not_parsed_again(tmp_path, monkeypatch):
+    parsed = []
+
+    def read_pdf(path):
+        parsed.append(path.name)
+        return {'id': path.stem, 'case_name': path.stem, 'text': f"Opinion parsed from {path.stem}. " * 20}
+
+    monkeypatch.setattr(ingestion_module, 'read_pdf', read_pdf)
+    for name in ('a', 'b'):
+        (tmp_path / f"{name}.pdf").write_bytes(f"%PDF {name}".encode())
+    ingestion = pipeline(HashEmbedding())
+
+    ingestion.run(iter_documents([str(tmp_path)]))
+    assert parsed == ['a.pdf', 'b.pdf']
+
+    parsed.clear()
+    stats = ingestion.run(iter_documents([str(tmp_path)]), prune=True)
+    assert parsed == []
+    assert stats['removed'] == 0
+
+    # New bytes that parse to the same text are parsed once, then recorded
+    (tmp_path / 'a.pdf').write_bytes(b"%PDF a, saved again")
+    ingestion.run(iter_documents([str(tmp_path)]))
+    ingestion.run(iter_documents([str(tmp_path)]))
+    assert parsed == ['a.pdf']
@@ -0,0 +1,75 @@
+# tests/test_jobs.py
+
+import threading
+
+import pytest
+
+from app.main import routes
+from app.main.dispatcher import QueryDispatcher, QueryRejected
+from app.main.job_store import JobStore
+
+
+def test_dispatcher_rejects_beyond_capacity_and_per_owner():
+    dispatcher = QueryDispatcher(max_workers=1, max_queued=1, max_per_owner=1)
+    release = threading.Event()
+    first = dispatcher.submit(lambda cancel_event: release.wait(5), owner='a')
+    with pytest.raises(QueryRejected):
+        dispatcher.submit(lambda cancel_event: None, owner='a')
+    dispatcher.submit(lambda cancel_event: release.wait(5), owner='b')
+    with pytest.raises(QueryRejected):
+        dispatcher.submit(lambda cancel_event: None, owner='c')
+
+    release.set()
+    first.future.result(timeout=5)
+    assert dispatcher.stats()['capacity'] == 2
+
+
+def test_dispatcher_cancel_sets_the_event_of_running_jobs():
+    dispatcher = QueryDispatcher(max_workers=1, max_queued=1)
+    started = threading.Event()
+
+    def work(cancel_event):
+        started.set()
+        return cancel_event.wait(5)
+
+    job = dispatcher.submit(work, job_id='job-1')
+    started.wait(5)
+    assert dispatcher.cancel('job-1')
+    assert job.future.result(timeout=5) is True
+    assert not dispatcher.cancel('job-1')
+
+
+def test_job_store_evicts_only_finished_jobs():
+    store = JobStore(max_jobs=2, ttl=0)
+    for job_id in ('a', 'b', 'c'):
+        store.create(job_id, 'query')
+    # Unfinished jobs are never evicted
+    assert store.stats()['jobs'] == 3
+
+    store.update('a', status='done')
+    store.create('d', 'query')
+    assert store.get('a') is None and store.get('d') is not None
+    assert 'finished_at' in store.update('b', status='error', error='boom')
+
+
+def test_job_store_fills_results_in_place():
+    store = JobStore()
+    store.create('job', ['q1', 'q2'])
+    store.update('job', results=[None, None])
+    store.set_result('job', 1, {'index': 1, 'response': 'second'}, completed=1)
+    job = store.get('job')
+    assert job['results'] == [None, {'index': 1, 'response': 'second'}]
+    assert job['completed'] == 1
+    assert store.set_result('missing', 0, {}) is None
+
+
+def test_batch_job_fails_when_the_knowledge_base_cannot_start(monkeypatch):
+    def unavailable():
+        raise RuntimeError('Neo4j is unavailable')
+
+    monkeypatch.setattr(routes, 'get_kb_query', unavailable)
+    routes.jobs.create('batch', ['q1', 'q2'])
+    routes.run_batch_job('batch', ['q1', 'q2'], None, threading.Event())
+    job = routes.jobs.get('batch')
+    assert job['status'] == 'error'
+    assert 'Neo4j is unavailable' in job['error']
@@ -0,0 +1,119 @@
+# tests/test_local_index.py
+
+import threading
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from benchmarks.fakes import HashEmbedding, build_corpus, law_docs_points, load_law_docs
+from app.knowledge_base.local_index import LocalVectorIndex, LocalVectorSearch
+from app.knowledge_base.vector_search import VectorSearch
+
+
+def collection(num_cases):
+    embed_model = HashEmbedding()
+    client = QdrantClient(location=':memory:')
+    load_law_docs(client, law_docs_points(build_corpus(num_cases), embed_model))
+    return client, embed_model
+
+
+def test_small_collections_match_exact_search(tmp_path):
+    client, embed_model = collection(200)
+    index = LocalVectorIndex(str(tmp_path))
+    index.build(client, 'law_docs')
+
+    query = embed_model.get_query_embedding('Judge Molley breach of contract')
+    exact = [point.id for point in client.query_points('law_docs', query=query, limit=5).points]
+    assert [point_id for point_id, _ in index.search(query, 5)] == exact
+
+
+def test_probed_lists_scale_with_the_list_count(tmp_path):
+    client, _ = collection(1100)
+    index = LocalVectorIndex(str(tmp_path), probe_fraction=0.5)
+    index.build(client, 'law_docs')
+    assert index.meta['nlist'] == 33
+    assert index.probes() == 17
+
+    index.nprobe = 4
+    assert index.probes() == 4
+
+
+def test_synced_changes_survive_a_restart(tmp_path):
+    client, embed_model = collection(50)
+    index = LocalVectorIndex(str(tmp_path))
+    index.build(client, 'law_docs')
+
+    removed, _ = client.scroll('law_docs', limit=1)
+    removed_id = removed[0].id
+    client.delete('law_docs', points_selector=models.PointIdsList(points=[removed_id]))
+    added_id = '00000000-0000-0000-0000-000000000001'
+    vector = embed_model.get_text_embedding('Harlan v. Molley securities fraud opinion')
+    client.upsert('law_docs', points=[models.PointStruct(
+        id=added_id, vector=vector, payload={'snippet': 'added', 'case_id': 'case-new', 'updated_at': time.time()},
+    )])
+    assert index.sync(client, 'law_docs') == {'upserted': 1, 'deleted': 1}
+
+    restarted = LocalVectorIndex(str(tmp_path))
+    assert len(restarted) == 50
+    assert restarted.meta['watermark'] == index.meta['watermark'] > 0
+    hits = [point_id for point_id, _ in restarted.search(vector, 50)]
+    assert hits[0] == added_id
+    assert removed_id not in hits
+    assert restarted.payloads([added_id])[added_id]['snippet'] == 'added'
+
+    # Compaction folds the delta into the files and drops the saved delta
+    restarted.compact()
+    assert not (tmp_path / f"delta-{restarted.meta['generation']}.npz").exists()
+    point_id, score = LocalVectorIndex(str(tmp_path)).search(vector, 1)[0]
+    assert point_id == added_id and np.isclose(score, 1.0)
+
+
+def test_sync_without_changes_writes_nothing(tmp_path, monkeypatch):
+    client, embed_model = collection(50)
+    client.set_payload('law_docs', payload={'updated_at': 1000.0}, points=models.Filter(must=[]))
+    index = LocalVectorIndex(str(tmp_path))
+    index.build(client, 'law_docs')
+    assert index.meta['watermark'] == 1000.0 and len(index.meta['watermark_ids']) == 50
+
+    saves = []
+    monkeypatch.setattr(index, '_save_delta', lambda: saves.append(1))
+    assert index.sync(client, 'law_docs') == {'upserted': 0, 'deleted': 0}
+    assert saves == []
+
+    # A write at the watermark's own timestamp is still picked up
+    point_id = '00000000-0000-0000-0000-000000000002'
+    client.upsert('law_docs', points=[models.PointStruct(
+        id=point_id, vector=embed_model.get_text_embedding('late write'),
+        payload={'snippet': 'late', 'updated_at': index.meta['watermark']},
+    )])
+    assert index.sync(client, 'law_docs') == {'upserted': 1, 'deleted': 0}
+    assert point_id in index.meta['watermark_ids']
+    assert index.sync(client, 'law_docs') == {'upserted': 0, 'deleted': 0}
+
+
+def test_first_build_runs_in_the_background(tmp_path, monkeypatch):
+    client, embed_model = collection(50)
+    build = LocalVectorIndex.build
+    release = threading.Event()
+
+    def slow_build(self, *args, **kwargs):
+        release.wait(5)
+        build(self, *args, **kwargs)
+
+    monkeypatch.setattr(LocalVectorIndex, 'build', slow_build)
+    fallback = VectorSearch(client, 'law_docs', embed_model, limit=3)
+    search = LocalVectorSearch(LocalVectorIndex(str(tmp_path)), client, 'law_docs', embed_model,
+                               limit=3, sync_interval=0, fallback=fallback)
+
+    assert not search.index.ready
+    query = 'Judge Molley breach of contract'
+    expected = [point.id for point in fallback.search(query)]
+    assert [point.id for point in search.search(query)] == expected
+
+    release.set()
+    deadline = time.time() + 5
+    while not search.index.ready and time.time() < deadline:
+        time.sleep(0.01)
+    assert search.index.ready
+    assert [point.id for point in search.search(query)] == expected
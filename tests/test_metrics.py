@@ -0,0 +1,42 @@
+# tests/test_metrics.py
+
+import subprocess
+import sys
+
+from app.knowledge_base.metrics import Metrics
+
+
+def test_routes_import_without_llama_index():
+    code = "import sys, app.main.routes; print(any(name.startswith('llama_index') for name in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_counters_and_histograms_are_recorded_by_label():
+    registry = Metrics(buckets=(0.1, 1.0))
+    registry.inc('kb_cache_hits_total', cache='answer')
+    registry.inc('kb_cache_hits_total', 2, cache='answer')
+    registry.inc('kb_cache_hits_total', cache='case')
+    with registry.timer('retrieval'):
+        pass
+    registry.observe('kb_stage_seconds', 0.5, stage='retrieval')
+
+    snapshot = registry.snapshot()
+    assert snapshot['counters']['kb_cache_hits_total'] == {(('cache', 'answer'),): 3, (('cache', 'case'),): 1}
+    histogram = snapshot['histograms']['kb_stage_seconds'][(('stage', 'retrieval'),)]
+    assert histogram['buckets'] == [1, 2] and histogram['count'] == 2
+
+    # Later observations leave an earlier snapshot alone
+    registry.observe('kb_stage_seconds', 0.01, stage='retrieval')
+    assert histogram['buckets'] == [1, 2]
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = Metrics(buckets=(0.1, 1.0))
+    registry.inc('kb_cache_hits_total', cache='answer')
+    registry.observe('kb_stage_seconds', 0.2, stage='retrieval')
+    registry.register_collector(lambda: [('kb_cache_entries', 'gauge', {'cache': 'answer'}, 4)])
+    lines = registry.render().splitlines()
+    assert '# TYPE kb_cache_hits_total counter' in lines
+    assert 'kb_stage_seconds_bucket{stage="retrieval",le="1.0"} 1' in lines
+    assert 'kb_cache_entries{cache="answer"} 4' in lines
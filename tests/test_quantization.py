@@ -0,0 +1,88 @@
+# tests/test_quantization.py
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+from app.knowledge_base.vector_search import (VectorSearch, collection_config, ensure_quantization, point_vector,
+                                              quantization_config, quantization_kind)
+
+
+class QuantizedClient(QdrantClient):
+    # Local mode ignores quantization, so this one reports and records it instead
+    def __init__(self, quantization=None):
+        super().__init__(location=':memory:')
+        self.quantization = quantization
+        self.updates = []
+        self.queries = []
+
+    def get_collection(self, collection_name):
+        info = super().get_collection(collection_name)
+        info.config.quantization_config = self.quantization
+        return info
+
+    def update_collection(self, collection_name, **kwargs):
+        self.updates.append(kwargs)
+        self.quantization = kwargs['quantization_config']
+        return True
+
+    def query_points(self, collection_name, **kwargs):
+        self.queries.append(kwargs)
+        return super().query_points(collection_name, **kwargs)
+
+
+class FixedEmbedding:
+    def get_query_embedding(self, query):
+        return [1.0, 0.0, 0.0]
+
+
+def quantized_collection(kind):
+    client = QuantizedClient(quantization_config(kind))
+    client.create_collection('law_docs', **collection_config(3, quantization=kind))
+    client.upsert('law_docs', points=[
+        models.PointStruct(id=i, vector=point_vector([1.0, i / 10, 0.0]), payload={'snippet': str(i)}) for i in range(5)
+    ])
+    return client
+
+
+def test_quantization_configs():
+    scalar = quantization_config('scalar')
+    assert scalar.scalar.type == models.ScalarType.INT8 and scalar.scalar.always_ram
+    assert quantization_config(' Binary ').binary.always_ram
+    assert quantization_config('none') is None and quantization_config(None) is None
+    assert [quantization_kind(quantization_config(kind)) for kind in ('none', 'scalar', 'binary')] == ['none', 'scalar', 'binary']
+    with pytest.raises(ValueError):
+        quantization_config('product')
+
+    # The originals only serve rescoring, so they go to disk
+    assert collection_config(3, quantization='binary')['vectors_config'].on_disk
+    assert collection_config(3)['vectors_config'].on_disk is None
+
+
+@pytest.mark.parametrize('kind', ['scalar', 'binary'])
+def test_quantized_searches_oversample_and_rescore(kind):
+    client = quantized_collection(kind)
+    search = VectorSearch(client, 'law_docs', FixedEmbedding(), oversampling=3.0, rescore=True)
+    assert search.quantization == kind
+
+    assert len(search.search('estoppel')) == 3
+    assert client.queries[-1]['search_params'].quantization == models.QuantizationSearchParams(rescore=True, oversampling=3.0)
+
+
+def test_unquantized_searches_send_no_search_params():
+    client = quantized_collection('none')
+    VectorSearch(client, 'law_docs', FixedEmbedding()).search('estoppel')
+    assert client.queries[-1]['search_params'] is None
+
+
+def test_ensure_quantization_only_updates_a_different_config():
+    client = quantized_collection('scalar')
+    assert not ensure_quantization(client, 'law_docs', 'scalar')
+    assert client.updates == []
+
+    assert ensure_quantization(client, 'law_docs', 'binary')
+    assert quantization_kind(client.updates[0]['quantization_config']) == 'binary'
+    assert client.updates[0]['vectors_config'] == {'': models.VectorParamsDiff(on_disk=True)}
+    assert not ensure_quantization(client, 'law_docs', 'binary')
+
+    assert ensure_quantization(client, 'law_docs', 'none')
+    assert client.updates[-1]['quantization_config'] == models.Disabled.DISABLED
@@ -0,0 +1,28 @@
+# tests/test_query_router.py
+
+from benchmarks.fakes import HashEmbedding, build_corpus
+from benchmarks.router_accuracy import labelled_queries
+from app.knowledge_base.query_router import LocalQueryRouter
+
+
+def test_calibrated_threshold_routes_most_queries_locally():
+    router = LocalQueryRouter(HashEmbedding())
+    assert 0 < router.threshold < 0.75
+
+    decisions = [(sorted(tools), router.route(query)) for tools, query in labelled_queries(build_corpus(50), 200)]
+    confident = [(tools, decision) for tools, decision in decisions if decision['confident']]
+    assert len(confident) > 0.8 * len(decisions)
+    assert sum(tools == sorted(decision['tools']) for tools, decision in confident) > 0.95 * len(confident)
+
+
+def test_explicit_threshold_is_kept():
+    assert LocalQueryRouter(HashEmbedding(), threshold=0.9).threshold == 0.9
+
+
+def test_local_router_only_in_router_mode(offline_kb, monkeypatch):
+    kb_query, _ = offline_kb()
+    assert kb_query.local_router is None
+
+    monkeypatch.setenv('KB_SYNTHESIS_MODE', 'router')
+    kb_query, _ = offline_kb()
+    assert kb_query.local_router is not None
@@ -0,0 +1,39 @@
+# tests/test_retrieval.py
+
+import threading
+
+import pytest
+
+from app.knowledge_base.branch_pool import BranchBusy, BranchPool
+
+
+def test_branch_pool_rejects_work_once_its_threads_are_taken():
+    release = threading.Event()
+    pool = BranchPool('graph', max_in_flight=2)
+    futures = [pool.submit(release.wait) for _ in range(2)]
+    with pytest.raises(BranchBusy):
+        pool.submit(release.wait)
+    assert pool.in_flight == 2 and pool.rejected == 1
+
+    release.set()
+    for future in futures:
+        future.result(timeout=1)
+    pool.submit(lambda: None).result(timeout=1)
+    assert pool.in_flight == 0
+
+
+def test_hung_graph_does_not_starve_vector_search(offline_kb, monkeypatch):
+    monkeypatch.setenv('KB_RETRIEVAL_WORKERS', '2')
+    monkeypatch.setenv('KB_GRAPH_TIMEOUT', '0.2')
+    monkeypatch.setenv('KB_VECTOR_TIMEOUT', '0.5')
+    kb_query, _ = offline_kb()
+    hung = threading.Event()
+    monkeypatch.setattr(kb_query, 'graph_context', lambda query: hung.wait(5))
+
+    statuses = []
+    for _ in range(4):
+        timings = kb_query.retrieve("Explain the negligence precedents")['timings']
+        statuses.append((timings['graph']['status'], timings['vector']['status']))
+    hung.set()
+
+    assert statuses == [('timeout', 'ok'), ('timeout', 'ok'), ('rejected', 'ok'), ('rejected', 'ok')]
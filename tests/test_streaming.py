@@ -0,0 +1,42 @@
+# tests/test_streaming.py
+
+import threading
+
+import pytest
+
+from app.main import events
+
+QUERY = "Explain the negligence precedents of Judge Molley"
+
+
+def test_streamed_chunks_are_the_stored_answer(offline_kb):
+    kb_query, _ = offline_kb()
+    sources, chunks = kb_query.stream_knowledge_base(QUERY, 'conversation-1')
+    assert sources
+    assert kb_query.conversation_store.history('conversation-1') == []
+
+    chunks = list(chunks)
+    assert len(chunks) > 1
+    answer = "".join(chunks)
+    assert kb_query.conversation_store.history('conversation-1') == [{'query': QUERY, 'response': answer}]
+    assert kb_query.lookup_cached_answer(QUERY)['answer'] == answer
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_socket_events_carry_the_whole_answer(offline_kb, monkeypatch, stream):
+    kb_query, _ = offline_kb()
+    emitted = []
+    monkeypatch.setattr(events, 'get_kb_query', lambda: kb_query)
+    monkeypatch.setattr(events.socketio, 'emit', lambda event, data, to=None: emitted.append((event, data)))
+    monkeypatch.setattr(events.socketio, 'sleep', lambda seconds: None)
+
+    events.run_query('sid', 'r1', QUERY, None, stream, threading.Event())
+    names = [event for event, _ in emitted]
+    final = emitted[-1][1]
+    assert final['request_id'] == 'r1' and final['sources']
+    if stream:
+        assert names == ['response_chunk'] * (len(names) - 1) + ['response_end']
+        assert "".join(data['chunk'] for _, data in emitted[:-1]) == final['response']
+    else:
+        assert names == ['response']
+    assert final['response'] == kb_query.lookup_cached_answer(QUERY)['answer']
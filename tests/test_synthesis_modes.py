@@ -0,0 +1,30 @@
+# tests/test_synthesis_modes.py
+
+import pytest
+
+QUERY = "Explain the negligence precedents of Judge Molley"
+
+
+def test_single_synthesis_makes_one_llm_call_per_query(offline_kb, monkeypatch):
+    monkeypatch.setenv('KB_SYNTHESIS_MODE', 'single')
+    kb_query, _ = offline_kb()
+    assert kb_query.retrieve(QUERY)['response'] == ""
+
+    calls = kb_query.llm.calls
+    "".join(kb_query.stream_knowledge_base(QUERY)[1])
+    assert kb_query.llm.calls == calls + 1
+    kb_query.query_datastores("Summarize the securities fraud opinions")
+    assert kb_query.llm.calls == calls + 2
+
+
+@pytest.mark.parametrize('router', ['local', 'llm'])
+def test_router_synthesis_keeps_the_router_pass(offline_kb, monkeypatch, router):
+    monkeypatch.setenv('KB_SYNTHESIS_MODE', 'router')
+    monkeypatch.setenv('KB_ROUTER', router)
+    kb_query, _ = offline_kb()
+    assert kb_query.retrieve(QUERY)['response']
+
+    calls = kb_query.llm.calls
+    "".join(kb_query.stream_knowledge_base(QUERY)[1])
+    # The router's own synthesis, then the final answer
+    assert kb_query.llm.calls >= calls + 2
@@ -0,0 +1,100 @@
+# tests/test_vector_search.py
+
+from qdrant_client import QdrantClient, models
+
+from benchmarks.fakes import HashEmbedding, build_corpus, law_docs_points, load_law_docs
+from app.knowledge_base.vector_search import VectorSearch, backfill_snippets, collection_config, point_vector, snippet
+
+
+class CountingClient(QdrantClient):
+    retrieves: int = 0
+
+    def retrieve(self, *args, **kwargs):
+        self.retrieves += 1
+        return super().retrieve(*args, **kwargs)
+
+
+def legacy_collection(num_cases=20):
+    embed_model = HashEmbedding()
+    cases = build_corpus(num_cases)
+    points = law_docs_points(cases, embed_model, legacy=True)
+    texts = {point.id: snippet(case['text']) for point, case in zip(points, cases)}
+    client = CountingClient(location=':memory:')
+    load_law_docs(client, points)
+    return client, embed_model, texts
+
+
+def test_backfill_writes_missing_snippets():
+    client, embed_model, texts = legacy_collection()
+    search = VectorSearch(client, 'law_docs', embed_model)
+
+    search.search('breach of contract damages')
+    assert client.retrieves == 1
+
+    assert backfill_snippets(client, 'law_docs', batch_size=7) == len(texts)
+    points, _ = client.scroll('law_docs', limit=1000, with_payload=['snippet'])
+    assert {point.id: point.payload['snippet'] for point in points} == texts
+    assert backfill_snippets(client, 'law_docs') == 0
+
+    hits = search.search('breach of contract damages')
+    assert client.retrieves == 1
+    assert all(hit.payload['snippet'] == texts[hit.id] for hit in hits)
+
+
+class FixedEmbedding:
+    def __init__(self, vector):
+        self.vector = vector
+
+    def get_query_embedding(self, query):
+        return self.vector
+
+
+class FixedSparseEncoder:
+    requires_idf = False
+    calls = 0
+
+    def encode_queries(self, queries):
+        self.calls += 1
+        return [models.SparseVector(indices=[1], values=[1.0]) for _ in queries]
+
+
+def hybrid_collection(sparse_encoder):
+    # 'dense' is nearest the query, 'sparse' alone shares its term, 'runner-up' is second on dense
+    client = QdrantClient(location=':memory:')
+    client.create_collection('law_docs', **collection_config(3, sparse_encoder))
+    rows = {
+        1: ('dense', [1.0, 0.0, 0.0], [5]),
+        2: ('runner-up', [0.9, 0.4, 0.0], [6]),
+        3: ('sparse', [0.0, 0.0, 1.0], [1]),
+    }
+    sparse = lambda indices: models.SparseVector(indices=indices, values=[1.0] * len(indices))
+    client.upsert('law_docs', points=[
+        models.PointStruct(id=point_id, payload={'snippet': name},
+                           vector=point_vector(dense, sparse(indices) if sparse_encoder else None))
+        for point_id, (name, dense, indices) in rows.items()
+    ])
+    return client
+
+
+def test_hybrid_search_fuses_dense_and_sparse_candidates():
+    encoder = FixedSparseEncoder()
+    client = hybrid_collection(encoder)
+    embed_model = FixedEmbedding([1.0, 0.0, 0.0])
+
+    hybrid = VectorSearch(client, 'law_docs', embed_model, sparse_encoder=encoder, limit=2, prefetch_limit=1)
+    assert hybrid.hybrid
+    assert {hit.payload['snippet'] for hit in hybrid.search('estoppel')} == {'dense', 'sparse'}
+    assert [{hit.payload['snippet'] for hit in hits} for hits in hybrid.search_batch(['estoppel'])] == [{'dense', 'sparse'}]
+
+    dense = VectorSearch(client, 'law_docs', embed_model, limit=2, prefetch_limit=1)
+    assert [hit.payload['snippet'] for hit in dense.search('estoppel')] == ['dense', 'runner-up']
+
+
+def test_dense_only_collections_fall_back_to_dense_search():
+    encoder = FixedSparseEncoder()
+    client = hybrid_collection(None)
+
+    search = VectorSearch(client, 'law_docs', FixedEmbedding([1.0, 0.0, 0.0]), sparse_encoder=encoder, limit=2)
+    assert not search.hybrid and search.dense_vector_name is None
+    assert [hit.payload['snippet'] for hit in search.search('estoppel')] == ['dense', 'runner-up']
+    assert encoder.calls == 0